@@ -19,23 +19,30 @@
 import asyncio
 import contextlib
 import json
+import time
 from typing import AsyncIterator, List, Dict, Any, TypedDict, Optional, Callable, Awaitable
 
 from langchain_core.messages import HumanMessage, AIMessage, AnyMessage, SystemMessage, ToolMessage, ToolCall
+from langchain_core.runnables import RunnableConfig
 from langchain_core.utils.function_calling import convert_to_openai_tool
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
-from openai import AsyncOpenAI
+from openai import APIConnectionError
 
 from client import MCPClient
 from logger import logger
+from model_cascade import SMALL, CascadeDecision, CascadeEscalation, ModelCascade
+from model_health import ModelRouter, ModelUnavailableError
 from prompts import Prompts
 from postgres_storage import PostgreSQLConversationStorage
 from utils import convert_langgraph_messages_to_openai
 
 
-memory = MemorySaver()
 SENTINEL = object()
+# Tools whose partial output is streamed to the client as "tool_token" events.
+STREAMING_TOOLS = {"write_code"}
+TOOL_CALLING_MODELS = {"gpt-oss-20b", "gpt-oss-120b"}
+# Failures of a small-model step that are retried on the large model.
+ESCALATION_ERRORS = (CascadeEscalation, ModelUnavailableError, APIConnectionError)
 StreamCallback = Callable[[Dict[str, Any]], Awaitable[None]]
 
 
@@ -56,17 +63,28 @@ class ChatAgent:
     - Manage conversation history via Redis
     """
 
-    def __init__(self, vector_store, config_manager, postgres_storage: PostgreSQLConversationStorage):
+    def __init__(
+        self,
+        vector_store,
+        config_manager,
+        postgres_storage: PostgreSQLConversationStorage,
+        model_router: Optional[ModelRouter] = None,
+        model_cascade: Optional[ModelCascade] = None
+    ):
         """Initialize the chat agent.
         
         Args:
             vector_store: VectorStore instance for document retrieval
             config_manager: ConfigManager for reading configuration
             postgres_storage: PostgreSQL storage for conversation persistence
+            model_router: Router tracking model health; turns go to the selected model if omitted
+            model_cascade: Small/large model cascade; configured from the environment if omitted
         """
         self.vector_store = vector_store
         self.config_manager = config_manager
         self.conversation_store = postgres_storage
+        self.model_router = model_router or ModelRouter(config_manager)
+        self.cascade = model_cascade or ModelCascade()
         self.current_model = None
         
         self.current_model = None
@@ -78,18 +96,23 @@ class ChatAgent:
         self.system_prompt = None
         
         self.graph = self._build_graph()
-        self.stream_callback = None
-        self.last_state = None
 
     @classmethod
-    async def create(cls, vector_store, config_manager, postgres_storage: PostgreSQLConversationStorage):
+    async def create(
+        cls,
+        vector_store,
+        config_manager,
+        postgres_storage: PostgreSQLConversationStorage,
+        model_router: Optional[ModelRouter] = None,
+        model_cascade: Optional[ModelCascade] = None
+    ):
         """
         Asynchronously creates and initializes a ChatAgent instance.
         
         This factory method ensures that all async setup, like loading tools,
         is completed before the agent is ready to be used.
         """
-        agent = cls(vector_store, config_manager, postgres_storage)
+        agent = cls(vector_store, config_manager, postgres_storage, model_router, model_cascade)
         await agent.init_tools()
         
         available_tools = list(agent.tools_by_name.values()) if agent.tools_by_name else []
@@ -143,6 +166,11 @@ class ChatAgent:
             self.openai_tools = []
             logger.warning("No MCP tools available - agent will run with limited functionality")
 
+    async def close(self) -> None:
+        """Close persistent MCP server sessions."""
+        if self.mcp_client:
+            await self.mcp_client.close()
+
     def set_current_model(self, model_name: str) -> None:
         """Set the current model for completions.
         
@@ -158,10 +186,7 @@ class ChatAgent:
             if model_name in available_models:
                 self.current_model = model_name
                 logger.info(f"Switched to model: {model_name}")
-                self.model_client = AsyncOpenAI(
-                    base_url=f"http://{self.current_model}:8000/v1",
-                    api_key="api_key"
-                )
+                self.model_client = self.model_router.client(model_name)
             else:
                 raise ValueError(f"Model {model_name} is not available. Available models: {available_models}")
         except Exception as e:
@@ -209,11 +234,12 @@ class ChatAgent:
         logger.debug({"message": "GRAPH: should_continue → CONTINUE (has tool calls)", "chat_id": state.get("chat_id")})
         return "continue"
 
-    async def tool_node(self, state: State) -> Dict[str, Any]:
+    async def tool_node(self, state: State, config: RunnableConfig) -> Dict[str, Any]:
         """Execute tools from the last AI message's tool calls.
         
         Args:
             state: Current graph state
+            config: Run configuration carrying this turn's stream callback
             
         Returns:
             Updated state with tool results and incremented iteration count
@@ -223,14 +249,15 @@ class ChatAgent:
             "chat_id": state.get("chat_id"),
             "iterations": state.get("iterations", 0)
         })
-        await self.stream_callback({'type': 'node_start', 'data': 'tool_node'})
+        stream_callback: StreamCallback = config["configurable"]["stream_callback"]
+        await stream_callback({'type': 'node_start', 'data': 'tool_node'})
         
         outputs = []
         messages = state.get("messages", [])
         last_message = messages[-1]
         for i, tool_call in enumerate(last_message.tool_calls):
             logger.debug(f'Executing tool {i+1}/{len(last_message.tool_calls)}: {tool_call["name"]} with args: {tool_call["args"]}')
-            await self.stream_callback({'type': 'tool_start', 'data': tool_call["name"]})
+            await stream_callback({'type': 'tool_start', 'data': tool_call["name"]})
             
             try:
                 if tool_call["name"] == "explain_image" and state.get("image_data"):
@@ -239,6 +266,8 @@ class ChatAgent:
                     logger.info(f'Executing tool {tool_call["name"]} with args: {tool_args}')
                     tool_result = await self.tools_by_name[tool_call["name"]].ainvoke(tool_args)
                     state["process_image_used"] = True
+                elif tool_call["name"] in STREAMING_TOOLS:
+                    tool_result = await self._call_tool_streaming(tool_call["name"], tool_call["args"], stream_callback)
                 else:
                     tool_result = await self.tools_by_name[tool_call["name"]].ainvoke(tool_call["args"])
                 if "code" in tool_call["name"]:
@@ -251,7 +280,7 @@ class ChatAgent:
                 logger.error(f'Error executing tool {tool_call["name"]}: {str(e)}', exc_info=True)
                 content = f"Error executing tool '{tool_call['name']}': {str(e)}"
             
-            await self.stream_callback({'type': 'tool_end', 'data': tool_call["name"]})
+            await stream_callback({'type': 'tool_end', 'data': tool_call["name"]})
 
             outputs.append(
                 ToolMessage(
@@ -270,58 +299,66 @@ class ChatAgent:
             "tools_executed": len(outputs),
             "next_step": "→ returning to generate"
         })
-        await self.stream_callback({'type': 'node_end', 'data': 'tool_node'})
+        await stream_callback({'type': 'node_end', 'data': 'tool_node'})
         return {"messages": messages + outputs, "iterations": state.get("iterations", 0) + 1}
 
-    async def generate(self, state: State) -> Dict[str, Any]:
+    async def _call_tool_streaming(self, tool_name: str, tool_args: Dict[str, Any], stream_callback: StreamCallback) -> str:
+        """Call an MCP tool, forwarding its progress messages as "tool_token" events.
+        
+        Cancelling the chat cancels the tool call on its server as well.
+        
+        Args:
+            tool_name: Name of the tool to call
+            tool_args: Tool arguments
+            stream_callback: Callback for streaming events
+            
+        Returns:
+            The tool's text output
+            
+        Raises:
+            RuntimeError: If the tool reported an error
+        """
+        async def on_progress(progress: float, total: Optional[float], message: Optional[str]) -> None:
+            if message:
+                await stream_callback({'type': 'tool_token', 'data': message})
+
+        result = await self.mcp_client.call_tool_streaming(tool_name, tool_args, on_progress)
+        text = "\n".join(block.text for block in result.content if getattr(block, "text", None))
+        if result.isError:
+            raise RuntimeError(text)
+        return text
+
+    async def generate(self, state: State, config: RunnableConfig) -> Dict[str, Any]:
         """Generate AI response using the current model.
         
         Args:
             state: Current graph state
+            config: Run configuration carrying this turn's stream callback and selected model
             
         Returns:
             Updated state with new AI message
         """
         messages = convert_langgraph_messages_to_openai(state.get("messages", []))
+        requested_model = config["configurable"].get("model") or self.current_model
         logger.debug({
             "message": "GRAPH: ENTERING NODE - generate",
             "chat_id": state.get("chat_id"),
             "iterations": state.get("iterations", 0),
-            "current_model": self.current_model,
+            "current_model": requested_model,
             "message_count": len(state.get("messages", []))
         })
-        await self.stream_callback({'type': 'node_start', 'data': 'generate'})
-
-        supports_tools = self.current_model in {"gpt-oss-20b", "gpt-oss-120b"}
-        has_tools = supports_tools and self.openai_tools and len(self.openai_tools) > 0
-        
-        logger.debug({
-            "message": "Tool calling debug info",
-            "chat_id": state.get("chat_id"),
-            "current_model": self.current_model,
-            "supports_tools": supports_tools,
-            "openai_tools_count": len(self.openai_tools) if self.openai_tools else 0,
-            "openai_tools": self.openai_tools,
-            "has_tools": has_tools
-        })
-        
-        tool_params = {}
-        if has_tools:
-            tool_params = {
-                "tools": self.openai_tools,
-                "tool_choice": "auto"
-            }
-        
-        stream = await self.model_client.chat.completions.create(
-            model=self.current_model,
-            messages=messages,
-            temperature=0,
-            top_p=1,
-            stream=True,
-            **tool_params
-        )
+        stream_callback: StreamCallback = config["configurable"]["stream_callback"]
+        await stream_callback({'type': 'node_start', 'data': 'generate'})
 
-        llm_output_buffer, tool_calls_buffer = await self._stream_response(stream, self.stream_callback)
+        small_supports_tools = bool(self.openai_tools) and self.cascade.small_model in TOOL_CALLING_MODELS
+        decision = self.cascade.decide(state, requested_model, small_supports_tools)
+        try:
+            llm_output_buffer, tool_calls_buffer = await self._cascade_step(decision, messages, state, stream_callback)
+        except ESCALATION_ERRORS:
+            if decision.tier != SMALL:
+                raise
+            decision = self.cascade.escalate(decision, requested_model)
+            llm_output_buffer, tool_calls_buffer = await self._cascade_step(decision, messages, state, stream_callback)
         tool_calls = self._format_tool_calls(tool_calls_buffer)
         raw_output = "".join(llm_output_buffer)
         
@@ -349,9 +386,123 @@ class ChatAgent:
             "tool_calls_names": [tc["name"] for tc in tool_calls] if tool_calls else [],
             "next_step": "→ should_continue decision"
         })
-        await self.stream_callback({'type': 'node_end', 'data': 'generate'})
+        await stream_callback({'type': 'node_end', 'data': 'generate'})
         return {"messages": state.get("messages", []) + [response]}
 
+    async def _cascade_step(
+        self,
+        decision: CascadeDecision,
+        messages: List[Dict[str, Any]],
+        state: State,
+        stream_callback: StreamCallback
+    ) -> tuple[List[str], Dict[int, Dict[str, str]]]:
+        """Run one generate step as the cascade decided and record its outcome.
+        
+        A speculative small-model step streams nothing to the client: it is
+        given up as soon as the model starts answering instead of calling a tool.
+        
+        Raises:
+            CascadeEscalation: If a speculative step did not call a tool
+        """
+        async def refuse_answer(event: Dict[str, Any]) -> None:
+            if event.get("type") == "token":
+                raise CascadeEscalation("The small model answered instead of calling a tool")
+
+        started = time.monotonic()
+        try:
+            model, llm_output_buffer, tool_calls_buffer = await self._generate_routed(
+                decision.model, messages, state, refuse_answer if decision.speculative else stream_callback
+            )
+            if decision.speculative and not tool_calls_buffer:
+                raise CascadeEscalation("The small model did not call a tool")
+        except Exception as e:
+            escalated = decision.tier == SMALL and isinstance(e, ESCALATION_ERRORS)
+            self.cascade.record(decision, "escalated" if escalated else "error", started, state.get("chat_id"))
+            raise
+        self.cascade.record(
+            decision, "tool_call" if tool_calls_buffer else "answer", started, state.get("chat_id"), model
+        )
+        return llm_output_buffer, tool_calls_buffer
+
+    async def _generate_routed(
+        self,
+        requested_model: str,
+        messages: List[Dict[str, Any]],
+        state: State,
+        stream_callback: StreamCallback
+    ) -> tuple[str, List[str], Dict[int, Dict[str, str]]]:
+        """Generate on `requested_model` or, if it is unhealthy, on the model the router picks.
+        
+        Returns:
+            Tuple of (model used, content_buffer, tool_calls_buffer)
+        """
+        # A model that cannot be reached is marked down, so the retry is routed elsewhere.
+        for attempt in range(2):
+            model = self.model_router.route(requested_model)
+            try:
+                llm_output_buffer, tool_calls_buffer = await self._generate_with(model, messages, state, stream_callback)
+                return model, llm_output_buffer, tool_calls_buffer
+            except APIConnectionError as e:
+                self.model_router.record_failure(model, f"{type(e).__name__}: {e}", down=True)
+                if attempt == 1:
+                    raise
+
+    async def _generate_with(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        state: State,
+        stream_callback: StreamCallback
+    ) -> tuple[List[str], Dict[int, Dict[str, str]]]:
+        """Stream one completion from `model`, recording its TTFT in the routing table.
+        
+        Args:
+            model: Model to generate with
+            messages: Conversation in OpenAI format
+            state: Current graph state
+            stream_callback: Callback for streaming events
+            
+        Returns:
+            Tuple of (content_buffer, tool_calls_buffer)
+        """
+        supports_tools = model in TOOL_CALLING_MODELS
+        has_tools = supports_tools and self.openai_tools and len(self.openai_tools) > 0
+        
+        logger.debug({
+            "message": "Tool calling debug info",
+            "chat_id": state.get("chat_id"),
+            "current_model": model,
+            "supports_tools": supports_tools,
+            "openai_tools_count": len(self.openai_tools) if self.openai_tools else 0,
+            "openai_tools": self.openai_tools,
+            "has_tools": has_tools
+        })
+        
+        tool_params = {}
+        if has_tools:
+            tool_params = {
+                "tools": self.openai_tools,
+                "tool_choice": "auto"
+            }
+        
+        async with self.model_router.track(model):
+            started = time.monotonic()
+            stream = await self.model_router.client(model).chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                top_p=1,
+                stream=True,
+                **tool_params
+            )
+            try:
+                return await self._stream_response(
+                    self.model_router.timed_stream(model, stream, started),
+                    stream_callback
+                )
+            finally:
+                await stream.close()
+
     def _build_graph(self) -> StateGraph:
         """Build the LangGraph state machine for conversation flow.
         
@@ -373,7 +524,7 @@ class ChatAgent:
         )
         workflow.add_edge("action", "generate")
 
-        return workflow.compile(checkpointer=memory)
+        return workflow.compile()
 
     def _format_tool_calls(self, tool_calls_buffer: Dict[int, Dict[str, str]]) -> List[ToolCall]:
         """Parse streamed tool call buffer into ToolCall objects.
@@ -471,8 +622,6 @@ class ChatAgent:
             "graph_flow": "START → generate → should_continue → action → generate → END"
         })
 
-        config = {"configurable": {"thread_id": chat_id}}
-
         try:
             existing_messages = await self.conversation_store.get_messages(chat_id, limit=1)
             
@@ -515,27 +664,36 @@ class ChatAgent:
                 }
             })
 
-            self.last_state = None
+            # Per-turn state lives in the run config, not on the agent, so one agent serves concurrent turns.
             token_q: asyncio.Queue[Any] = asyncio.Queue()
-            self.stream_callback = lambda event: self._queue_writer(event, token_q)
+            config = {"configurable": {
+                "stream_callback": lambda event: self._queue_writer(event, token_q),
+                "model": model_name
+            }}
             runner = asyncio.create_task(self._run_graph(initial_state, config, chat_id, token_q))
 
+            finished = False
             try:
                 while True:
                     item = await token_q.get()
                     if item is SENTINEL:
+                        finished = True
                         break
                     yield item
             except Exception as stream_error:
                 logger.error({"message": "Error in streaming", "error": str(stream_error)}, exc_info=True)
             finally:
+                if not finished:
+                    # The consumer went away mid-reply; stop the graph and any tool calls it is waiting on.
+                    runner.cancel()
+                final_state = None
                 with contextlib.suppress(asyncio.CancelledError):
-                    await runner
+                    final_state = await runner
 
                 logger.debug({
                     "message": "GRAPH: EXECUTION COMPLETED",
                     "chat_id": chat_id,
-                    "final_iterations": self.last_state.get("iterations", 0) if self.last_state else 0
+                    "final_iterations": final_state.get("iterations", 0) if final_state else 0
                 })
 
         except Exception as e:
@@ -552,15 +710,22 @@ class ChatAgent:
         """
         await token_q.put(event)
 
-    async def _run_graph(self, initial_state: Dict[str, Any], config: Dict[str, Any], chat_id: str, token_q: asyncio.Queue) -> None:
+    async def _run_graph(self, initial_state: Dict[str, Any], config: Dict[str, Any], chat_id: str, token_q: asyncio.Queue) -> Optional[Dict[str, Any]]:
         """Run the graph execution in background task.
         
+        The final messages are saved immediately rather than batched, so a turn
+        on this chat that starts on another worker sees them.
+        
         Args:
             initial_state: Starting state for graph
             config: LangGraph configuration
             chat_id: Chat identifier
             token_q: Queue for streaming events
+            
+        Returns:
+            The last graph state, or None if the graph produced none
         """
+        last_state = None
         try:
             async for final_state in self.graph.astream(
                 initial_state,
@@ -568,14 +733,14 @@ class ChatAgent:
                 stream_mode="values",
                 stream_writer=lambda event: self._queue_writer(event, token_q)
             ):
-                self.last_state = final_state
+                last_state = final_state
         finally:
             try:
-                if self.last_state and self.last_state.get("messages"):
-                    final_msg = self.last_state["messages"][-1]
+                if last_state and last_state.get("messages"):
+                    final_msg = last_state["messages"][-1]
                     try:
                         logger.debug(f'Saving messages to conversation store for chat: {chat_id}')
-                        await self.conversation_store.save_messages(chat_id, self.last_state["messages"])
+                        await self.conversation_store.save_messages_immediate(chat_id, last_state["messages"])
                     except Exception as save_err:
                         logger.warning({"message": "Failed to persist conversation", "chat_id": chat_id, "error": str(save_err)})
 
@@ -584,3 +749,4 @@ class ChatAgent:
                         await token_q.put(content)
             finally:
                 await token_q.put(SENTINEL)
+        return last_state
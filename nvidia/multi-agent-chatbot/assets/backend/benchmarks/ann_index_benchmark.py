@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+ANN index benchmark: recall@k against FLAT, search latency and memory.
+
+Builds one collection per index type over a synthetic clustered corpus, uses
+a FLAT collection as ground truth and reports recall@k, p50/p99 single-query
+latency, build time and memory. Runs against Milvus Lite (a local .db file,
+the default) or a Milvus server (--uri http://localhost:19530).
+
+Milvus Lite only builds FLAT, HNSW, IVF_FLAT and IVF_SQ8 indexes; benchmark
+IVF_PQ and SCANN against a Milvus server.
+
+Example:
+    python benchmarks/ann_index_benchmark.py --sizes 10000,100000 --dim 768 \\
+        --index-types HNSW,IVF_FLAT --metric COSINE --output results.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from pymilvus import DataType, MilvusClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_index import build_index_config  # noqa: E402
+
+
+LITE_INDEX_TYPES = {"AUTOINDEX", "FLAT", "HNSW", "IVF_FLAT", "IVF_SQ8"}
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident memory of this process and its children (e.g. a Milvus Lite server), Linux only."""
+    def rss(pid: str) -> int:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    try:
+        total = rss("self")
+        children_path = f"/proc/self/task/{os.getpid()}/children"
+        if os.path.exists(children_path):
+            with open(children_path) as f:
+                total += sum(rss(pid) for pid in f.read().split())
+        return total
+    except OSError:
+        return None
+
+
+def estimate_index_bytes(index_type: str, params: Dict[str, Any], n: int, dim: int) -> int:
+    """Rough in-memory size of an index over n float32 vectors."""
+    raw = n * dim * 4
+    if index_type == "HNSW":
+        return raw + n * params.get("M", 16) * 2 * 8
+    if index_type == "IVF_SQ8":
+        return n * dim + params.get("nlist", 1024) * dim * 4
+    if index_type == "IVF_PQ":
+        m, nbits = params.get("m", 16), params.get("nbits", 8)
+        return n * m * nbits // 8 + params.get("nlist", 1024) * dim * 4 + m * (2 ** nbits) * (dim // m) * 4
+    if index_type == "SCANN":
+        return n * dim // 2 + (raw if params.get("with_raw_data", True) else 0)
+    return raw
+
+
+class SyntheticCorpus:
+    """Clustered Gaussian vectors, generated deterministically in batches to bound memory."""
+
+    def __init__(self, size: int, dim: int, clusters: int, normalize: bool, seed: int):
+        self.size = size
+        self.dim = dim
+        self.normalize = normalize
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+
+    def _sample(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        labels = rng.integers(0, len(self.centers), size=count)
+        vectors = self.centers[labels] + rng.normal(scale=0.5, size=(count, self.dim)).astype(np.float32)
+        if self.normalize:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    def batches(self, batch_size: int):
+        rng = np.random.default_rng(self.seed + 1)
+        for start in range(0, self.size, batch_size):
+            count = min(batch_size, self.size - start)
+            yield start, self._sample(rng, count)
+
+    def queries(self, count: int) -> np.ndarray:
+        return self._sample(np.random.default_rng(self.seed + 2), count)
+
+
+def build_collection(
+    client: MilvusClient,
+    name: str,
+    corpus: SyntheticCorpus,
+    index_params: Dict[str, Any],
+    batch_size: int
+) -> Dict[str, float]:
+    """Create, fill and index a collection, returning insert and index build times."""
+    if client.has_collection(name):
+        client.drop_collection(name)
+
+    schema = client.create_schema(auto_id=False, enable_dynamic_field=False)
+    schema.add_field("id", DataType.INT64, is_primary=True)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=corpus.dim)
+    client.create_collection(name, schema=schema)
+
+    start = time.perf_counter()
+    for offset, vectors in corpus.batches(batch_size):
+        client.insert(name, [{"id": offset + i, "vector": vector} for i, vector in enumerate(vectors.tolist())])
+    client.flush(name)
+    insert_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prepared = client.prepare_index_params()
+    prepared.add_index(
+        "vector",
+        index_type=index_params["index_type"],
+        metric_type=index_params["metric_type"],
+        params=index_params["params"]
+    )
+    client.create_index(name, prepared)
+    client.load_collection(name)
+    # Warm up so lazily built segment indexes are not counted as search latency.
+    client.search(name, data=[[0.0] * corpus.dim], limit=1, anns_field="vector")
+    build_s = time.perf_counter() - start
+    return {"insert_s": insert_s, "build_s": build_s}
+
+
+def run_queries(
+    client: MilvusClient,
+    name: str,
+    queries: np.ndarray,
+    k: int,
+    search_params: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Search one query at a time, returning result ids and per-query latencies in ms."""
+    ids, latencies = [], []
+    for query in queries.tolist():
+        start = time.perf_counter()
+        result = client.search(name, data=[query], limit=k, anns_field="vector", search_params=search_params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append([hit["id"] for hit in result[0]])
+    return {"ids": ids, "latencies_ms": latencies}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def recall_at_k(results: List[List[int]], truth: List[List[int]], k: int) -> float:
+    hits = sum(len(set(found[:k]) & set(expected[:k])) for found, expected in zip(results, truth))
+    return hits / (k * len(truth)) if truth else 0.0
+
+
+def benchmark_size(client: MilvusClient, args: argparse.Namespace, size: int) -> List[Dict[str, Any]]:
+    corpus = SyntheticCorpus(
+        size=size,
+        dim=args.dim,
+        clusters=args.clusters,
+        normalize=args.metric in ("COSINE", "IP"),
+        seed=args.seed
+    )
+    queries = corpus.queries(args.queries)
+    results = []
+    truth = None
+
+    for index_type in ["FLAT"] + [t for t in args.index_types if t != "FLAT"]:
+        if args.lite and index_type not in LITE_INDEX_TYPES:
+            print(f"Skipping {index_type}: not supported by Milvus Lite", file=sys.stderr)
+            continue
+
+        overrides = args.params.get(index_type, {})
+        index_params, search_params = build_index_config(
+            index_type,
+            args.metric,
+            overrides.get("build", {}),
+            overrides.get("search", {})
+        )
+        name = f"ann_bench_{index_type.lower()}_{size}"
+        print(f"[{size}] building {index_type} ...", file=sys.stderr)
+
+        rss_before = _rss_bytes()
+        timings = build_collection(client, name, corpus, index_params, args.batch_size)
+        rss_after = _rss_bytes()
+
+        run = run_queries(client, name, queries, args.k, search_params)
+        if index_type == "FLAT":
+            truth = run["ids"]
+        latencies = run["latencies_ms"]
+
+        results.append({
+            "size": size,
+            "dim": args.dim,
+            "index_type": index_type,
+            "metric_type": args.metric,
+            "build_params": index_params["params"],
+            "search_params": search_params["params"],
+            "k": args.k,
+            "queries": len(queries),
+            f"recall_at_{args.k}": round(recall_at_k(run["ids"], truth, args.k), 4),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "insert_s": round(timings["insert_s"], 2),
+            "build_s": round(timings["build_s"], 2),
+            "estimated_index_bytes": estimate_index_bytes(index_type, index_params["params"], size, args.dim),
+            "rss_delta_bytes": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None
+        })
+
+        if not args.keep:
+            client.drop_collection(name)
+    return results
+
+
+def print_table(results: List[Dict[str, Any]], k: int) -> None:
+    header = f"{'size':>9} {'index':<10} {'recall@' + str(k):>10} {'p50 ms':>9} {'p99 ms':>9} {'build s':>9} {'est MiB':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(
+            f"{row['size']:>9} {row['index_type']:<10} {row[f'recall_at_{k}']:>10.4f} "
+            f"{row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['build_s']:>9.2f} "
+            f"{row['estimated_index_bytes'] / (1024 * 1024):>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Milvus ANN index types against FLAT")
+    parser.add_argument("--uri", default=None, help="Milvus URI (default: a temporary Milvus Lite file)")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated corpus sizes, e.g. 10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimension")
+    parser.add_argument("--clusters", type=int, default=256, help="Number of Gaussian clusters in the corpus")
+    parser.add_argument("--index-types", default="HNSW,IVF_FLAT,IVF_PQ,SCANN", help="Comma-separated index types")
+    parser.add_argument("--metric", default="COSINE", choices=["L2", "IP", "COSINE"], help="Distance metric")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries per index")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per insert")
+    parser.add_argument("--params", default="{}",
+                        help='Per-index overrides as JSON, e.g. \'{"HNSW": {"build": {"M": 32}, "search": {"ef": 128}}}\'')
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic corpus")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    args.index_types = [t.strip().upper() for t in args.index_types.split(",") if t.strip()]
+    args.metric = args.metric.upper()
+    args.params = {key.upper(): value for key, value in json.loads(args.params).items()}
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    tmp_dir = None
+    if args.uri is None:
+        tmp_dir = tempfile.mkdtemp(prefix="ann_bench_")
+        args.uri = os.path.join(tmp_dir, "milvus.db")
+    args.lite = not args.uri.startswith(("http://", "https://", "tcp://"))
+
+    client = MilvusClient(uri=args.uri)
+    results = []
+    try:
+        for size in sizes:
+            results.extend(benchmark_size(client, args, size))
+    finally:
+        client.close()
+        if tmp_dir and not args.keep:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print_table(results, args.k)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"uri": args.uri, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
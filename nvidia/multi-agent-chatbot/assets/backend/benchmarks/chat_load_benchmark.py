@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+End-to-end chat load benchmark: concurrent websocket chats against main.py.
+
+Starts a mock OpenAI-compatible model server (benchmarks/mock_llm_server.py),
+points the agent at a mock MCP stdio server (benchmarks/mock_mcp_server.py),
+runs one or more backend workers on a throwaway Postgres database and Milvus
+Lite file, and drives N concurrent chats of T turns each over the websocket.
+
+Reports time to first token, inter-token latency and turn latency
+percentiles, each worker's event-loop lag, and database write amplification
+(WAL bytes and rows written per turn relative to the conversation bytes the
+turns added). WAL is counted cluster-wide, so use a dedicated Postgres
+(e.g. --embedded-postgres, which needs initdb and pg_ctl on PATH).
+
+The benchmark database (--postgres-db, default chatbot_bench) is dropped
+before and after the run unless --keep-db is given.
+
+Example:
+    python benchmarks/chat_load_benchmark.py --users 32 --turns 5 --workers 2 \\
+        --ttft-ms 200 --itl-ms 20 --tool-call-rate 0.3 --embedded-postgres \\
+        --output load.json --baseline previous.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+import httpx
+import numpy as np
+import websockets
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# (metric path, label) pairs compared against --baseline; higher is worse for all of them.
+REGRESSION_METRICS = [
+    (("ttft_ms", "p99"), "TTFT p99"),
+    (("itl_ms", "p99"), "ITL p99"),
+    (("turn_latency_ms", "p99"), "turn latency p99"),
+    (("event_loop_lag_ms", "p99"), "event-loop lag p99"),
+    (("db", "wal_bytes_per_turn"), "WAL bytes per turn"),
+]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Count, mean and percentiles of a list of samples."""
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(values),
+        "mean": round(float(np.mean(values)), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p90": round(float(np.percentile(values, 90)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(np.max(values)), 3)
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_embedded_postgres(tmp_dir: str, user: str) -> Tuple[int, str]:
+    """Initialize and start a temporary Postgres cluster on a free port.
+    
+    Returns:
+        The port and the data directory to pass to `stop_embedded_postgres`
+    """
+    if not (shutil.which("initdb") and shutil.which("pg_ctl")):
+        raise RuntimeError("--embedded-postgres needs initdb and pg_ctl on PATH")
+    data_dir = os.path.join(tmp_dir, "pgdata")
+    port = free_port()
+    subprocess.run(["initdb", "-D", data_dir, "-U", user, "--auth=trust"], check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(
+        ["pg_ctl", "-D", data_dir, "-w", "-l", os.path.join(tmp_dir, "postgres.log"),
+         "-o", f"-p {port} -k {tmp_dir} -c listen_addresses=127.0.0.1", "start"],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    return port, data_dir
+
+
+def stop_embedded_postgres(data_dir: str) -> None:
+    subprocess.run(["pg_ctl", "-D", data_dir, "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up from a fixed-interval sleep."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, (loop.time() - start - self.interval) * 1000))
+
+
+def serve(port: int) -> None:
+    """Run main.app with benchmark stats routes and an event-loop lag monitor (worker mode)."""
+    import uvicorn
+
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+
+    monitor = LoopLagMonitor()
+
+    async def stats():
+        return {
+            "event_loop_lag_ms": summarize(monitor.samples),
+            "storage": main.postgres_storage.get_cache_stats()
+        }
+
+    async def reset():
+        monitor.samples.clear()
+        return {"status": "ok"}
+
+    main.app.add_api_route("/_bench/stats", stats, methods=["GET"])
+    main.app.add_api_route("/_bench/reset", reset, methods=["POST"])
+
+    async def run():
+        server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        task = asyncio.create_task(monitor.run())
+        try:
+            await server.serve()
+        finally:
+            task.cancel()
+
+    asyncio.run(run())
+
+
+@dataclass
+class TurnResult:
+    """Client-side timings of one chat turn."""
+    worker: int
+    ttft_ms: Optional[float] = None
+    turn_ms: Optional[float] = None
+    itl_ms: List[float] = field(default_factory=list)
+    tokens: int = 0
+    tool_tokens: int = 0
+    error: Optional[str] = None
+
+
+async def run_chat(url: str, worker: int, turns: int, think_time: float, timeout: float) -> List[TurnResult]:
+    """Run one chat of `turns` turns over a websocket, timing every streamed event."""
+    results = []
+    async with websockets.connect(url, max_size=None) as ws:
+        await _receive_history(ws, timeout)
+        for turn in range(turns):
+            result = TurnResult(worker=worker)
+            start = last = time.perf_counter()
+            await ws.send(json.dumps({"message": f"Benchmark question {turn}: summarize the indexed documents."}))
+            try:
+                while True:
+                    event = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+                    now = time.perf_counter()
+                    kind = event.get("type") if isinstance(event, dict) else None
+                    if kind == "token":
+                        if result.ttft_ms is None:
+                            result.ttft_ms = (now - start) * 1000
+                        else:
+                            result.itl_ms.append((now - last) * 1000)
+                        last = now
+                        result.tokens += 1
+                    elif kind == "tool_token":
+                        result.tool_tokens += 1
+                    elif kind == "error":
+                        result.error = str(event.get("content") or event.get("data"))
+                    elif kind in ("history", "history_delta"):
+                        result.turn_ms = (now - start) * 1000
+                        break
+            except asyncio.TimeoutError:
+                result.error = f"No event within {timeout}s"
+                results.append(result)
+                break
+            results.append(result)
+            if think_time:
+                await asyncio.sleep(think_time)
+    return results
+
+
+async def _receive_history(ws, timeout: float) -> None:
+    while True:
+        event = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+        if isinstance(event, dict) and event.get("type") in ("history", "history_delta"):
+            return
+
+
+async def db_snapshot(conn: asyncpg.Connection) -> Dict[str, Any]:
+    """WAL position, row write counters and stored conversation bytes."""
+    await conn.execute("SELECT pg_stat_clear_snapshot()")
+    rows = await conn.fetchrow("""
+        SELECT COALESCE(SUM(n_tup_ins), 0) AS inserted,
+               COALESCE(SUM(n_tup_upd), 0) AS updated,
+               COALESCE(SUM(n_tup_del), 0) AS deleted
+        FROM pg_stat_user_tables
+    """)
+    has_conversations = await conn.fetchval("SELECT to_regclass('conversations') IS NOT NULL")
+    conversation_bytes = 0
+    if has_conversations:
+        conversation_bytes = await conn.fetchval(
+            "SELECT COALESCE(SUM(octet_length(messages::text)), 0) FROM conversations"
+        )
+    return {
+        "wal_lsn": await conn.fetchval("SELECT pg_current_wal_lsn()::text"),
+        "rows_written": int(rows["inserted"] + rows["updated"] + rows["deleted"]),
+        "conversation_bytes": int(conversation_bytes)
+    }
+
+
+async def db_delta(conn: asyncpg.Connection, before: Dict[str, Any], after: Dict[str, Any], turns: int) -> Dict[str, Any]:
+    wal_bytes = int(await conn.fetchval("SELECT pg_wal_lsn_diff($1::pg_lsn, $2::pg_lsn)", after["wal_lsn"], before["wal_lsn"]))
+    rows_written = after["rows_written"] - before["rows_written"]
+    added = after["conversation_bytes"] - before["conversation_bytes"]
+    return {
+        "wal_bytes": wal_bytes,
+        "rows_written": rows_written,
+        "conversation_bytes_added": added,
+        "wal_bytes_per_turn": round(wal_bytes / turns, 1) if turns else 0.0,
+        "rows_written_per_turn": round(rows_written / turns, 2) if turns else 0.0,
+        "write_amplification": round(wal_bytes / added, 2) if added > 0 else None
+    }
+
+
+class Cluster:
+    """The mock model server, the backend workers and optionally an embedded Postgres."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.tmp_dir = tempfile.mkdtemp(prefix="chat_load_")
+        self.processes: List[subprocess.Popen] = []
+        self.worker_ports: List[int] = []
+        self.pg_data: Optional[str] = None
+
+    def _spawn(self, command: List[str], name: str, **kwargs) -> subprocess.Popen:
+        log = open(os.path.join(self.tmp_dir, f"{name}.log"), "w")
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+        self.processes.append(process)
+        return process
+
+    def start_postgres(self) -> None:
+        self.args.postgres_host = "127.0.0.1"
+        self.args.postgres_port, self.pg_data = start_embedded_postgres(self.tmp_dir, self.args.postgres_user)
+
+    async def admin_connect(self, database: str) -> asyncpg.Connection:
+        return await asyncpg.connect(
+            host=self.args.postgres_host,
+            port=self.args.postgres_port,
+            user=self.args.postgres_user,
+            password=self.args.postgres_password,
+            database=database
+        )
+
+    async def drop_database(self) -> None:
+        conn = await self.admin_connect("postgres")
+        try:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{self.args.postgres_db}" WITH (FORCE)')
+        finally:
+            await conn.close()
+
+    def start_services(self) -> None:
+        args = self.args
+        llm_port = free_port()
+        self._spawn([
+            sys.executable, os.path.join(BENCHMARK_DIR, "mock_llm_server.py"),
+            "--port", str(llm_port), "--model", args.model,
+            "--ttft-ms", str(args.ttft_ms), "--itl-ms", str(args.itl_ms), "--tokens", str(args.tokens),
+            "--tool-call-rate", str(args.tool_call_rate), "--seed", str(args.seed),
+            *(["--tool-name", args.tool_name] if args.tool_name else [])
+        ], "mock_llm")
+
+        mcp_config = os.path.join(self.tmp_dir, "mcp_servers.json")
+        with open(mcp_config, "w") as f:
+            json.dump({
+                "mock-tools": {
+                    "command": sys.executable,
+                    "args": [os.path.join(BENCHMARK_DIR, "mock_mcp_server.py")],
+                    "transport": "stdio",
+                    "env": {
+                        **os.environ,
+                        "MOCK_TOOL_LATENCY_MS": str(args.tool_latency_ms),
+                        "MOCK_CODE_CHUNKS": str(args.code_chunks),
+                    }
+                }
+            }, f)
+
+        env = {
+            **os.environ,
+            "POSTGRES_HOST": args.postgres_host,
+            "POSTGRES_PORT": str(args.postgres_port),
+            "POSTGRES_DB": args.postgres_db,
+            "POSTGRES_USER": args.postgres_user,
+            "POSTGRES_PASSWORD": args.postgres_password,
+            "MILVUS_URI": os.path.join(self.tmp_dir, "milvus.db"),
+            "MODELS": args.model,
+            "MODEL_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+            "MCP_SERVERS_CONFIG": mcp_config,
+            "MCP_PERSISTENT_SERVERS": "mock-tools",
+        }
+        for i in range(args.workers):
+            port = free_port()
+            self.worker_ports.append(port)
+            # Each worker gets its own port; clients spread chats across them like a load balancer.
+            self._spawn(
+                [sys.executable, os.path.abspath(__file__), "--serve", str(port)],
+                f"worker{i}", cwd=self.tmp_dir, env=env
+            )
+
+    async def wait_ready(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            for port in self.worker_ports:
+                while True:
+                    if any(process.poll() is not None for process in self.processes):
+                        raise RuntimeError(f"A benchmark process exited during startup; see logs in {self.tmp_dir}")
+                    try:
+                        if (await client.get(f"http://127.0.0.1:{port}/_bench/stats")).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"Backend worker on port {port} not ready after {timeout}s")
+                    await asyncio.sleep(0.5)
+
+    async def worker_stats(self, reset: bool = False) -> List[Dict[str, Any]]:
+        async with httpx.AsyncClient() as client:
+            if reset:
+                for port in self.worker_ports:
+                    await client.post(f"http://127.0.0.1:{port}/_bench/reset")
+                return []
+            return [(await client.get(f"http://127.0.0.1:{port}/_bench/stats")).json() for port in self.worker_ports]
+
+    def stop(self) -> None:
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.pg_data:
+            stop_embedded_postgres(self.pg_data)
+        if not self.args.keep_logs:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    cluster = Cluster(args)
+    try:
+        if args.embedded_postgres:
+            cluster.start_postgres()
+        await cluster.drop_database()
+        cluster.start_services()
+        await cluster.wait_ready(args.startup_timeout)
+
+        conn = await cluster.admin_connect(args.postgres_db)
+        try:
+            before = await db_snapshot(conn)
+            await cluster.worker_stats(reset=True)
+
+            run_id = uuid.uuid4().hex[:8]
+            start = time.perf_counter()
+            chats = await asyncio.gather(*[
+                run_chat(
+                    f"ws://127.0.0.1:{cluster.worker_ports[i % len(cluster.worker_ports)]}/ws/chat/bench-{run_id}-{i}",
+                    i % len(cluster.worker_ports), args.turns, args.think_time, args.turn_timeout
+                )
+                for i in range(args.users)
+            ], return_exceptions=True)
+            elapsed = time.perf_counter() - start
+
+            workers = await cluster.worker_stats()
+            # Postgres publishes table statistics asynchronously.
+            await asyncio.sleep(1.5)
+            after = await db_snapshot(conn)
+            turns = [turn for chat in chats if isinstance(chat, list) for turn in chat]
+            completed = [turn for turn in turns if turn.turn_ms is not None and turn.error is None]
+            db = await db_delta(conn, before, after, len(completed))
+        finally:
+            await conn.close()
+        if not args.keep_db:
+            await cluster.drop_database()
+    finally:
+        cluster.stop()
+
+    failed_chats = [str(chat) for chat in chats if isinstance(chat, BaseException)]
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("postgres_password", "serve")},
+        "elapsed_s": round(elapsed, 3),
+        "turns_completed": len(completed),
+        "turns_failed": len(turns) - len(completed),
+        "chats_failed": len(failed_chats),
+        "errors": sorted({turn.error for turn in turns if turn.error} | set(failed_chats))[:20],
+        "turns_per_s": round(len(completed) / elapsed, 3) if elapsed else 0.0,
+        "tokens_per_s": round(sum(turn.tokens for turn in completed) / elapsed, 1) if elapsed else 0.0,
+        "tool_tokens": sum(turn.tool_tokens for turn in completed),
+        "ttft_ms": summarize([turn.ttft_ms for turn in completed if turn.ttft_ms is not None]),
+        "itl_ms": summarize([gap for turn in completed for gap in turn.itl_ms]),
+        "turn_latency_ms": summarize([turn.turn_ms for turn in completed]),
+        "event_loop_lag_ms": max((worker["event_loop_lag_ms"] for worker in workers), key=lambda lag: lag["p99"], default=summarize([])),
+        "workers": workers,
+        "db": db
+    }
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List metrics that are worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for path, label in REGRESSION_METRICS:
+        current, previous = results, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if isinstance(current, (int, float)) and isinstance(previous, (int, float)) and previous > 0:
+            if current > previous * (1 + tolerance):
+                regressions.append(f"{label}: {current} vs baseline {previous} (+{(current / previous - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_summary(results: Dict[str, Any]) -> None:
+    print(f"turns: {results['turns_completed']} completed, {results['turns_failed']} failed "
+          f"in {results['elapsed_s']}s ({results['turns_per_s']} turns/s, {results['tokens_per_s']} tokens/s)")
+    header = f"{'metric':<22} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}"
+    print(header)
+    print("-" * len(header))
+    for key in ("ttft_ms", "itl_ms", "turn_latency_ms", "event_loop_lag_ms"):
+        row = results[key]
+        print(f"{key:<22} {row['p50']:>10.2f} {row['p90']:>10.2f} {row['p99']:>10.2f} {row['max']:>10.2f}")
+    db = results["db"]
+    print(f"db: {db['wal_bytes_per_turn']} WAL bytes/turn, {db['rows_written_per_turn']} rows/turn, "
+          f"write amplification {db['write_amplification']}")
+    for error in results["errors"]:
+        print(f"error: {error}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent websocket chats against the backend with mock models")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    parser.add_argument("--users", type=int, default=16, help="Concurrent chats")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per chat")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between a reply and the next message")
+    parser.add_argument("--workers", type=int, default=1, help="Backend worker processes")
+    parser.add_argument("--model", default="gpt-oss-20b", help="Model name the agent selects (gpt-oss models get tools)")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Mock model time to first token")
+    parser.add_argument("--itl-ms", type=float, default=20, help="Mock model inter-token latency")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per mock reply")
+    parser.add_argument("--tool-call-rate", type=float, default=0.3, help="Fraction of turns that start with a tool call")
+    parser.add_argument("--tool-name", default=None, help="Tool the mock model calls (search_documents or write_code)")
+    parser.add_argument("--tool-latency-ms", type=float, default=50, help="Mock search_documents latency")
+    parser.add_argument("--code-chunks", type=int, default=20, help="Chunks streamed by the mock write_code tool")
+    parser.add_argument("--turn-timeout", type=float, default=60, help="Seconds to wait for any event before failing a turn")
+    parser.add_argument("--startup-timeout", type=float, default=180, help="Seconds to wait for the backend workers")
+    parser.add_argument("--embedded-postgres", action="store_true", help="Run a temporary Postgres cluster (needs initdb/pg_ctl)")
+    parser.add_argument("--postgres-host", default=os.getenv("POSTGRES_HOST", "127.0.0.1"))
+    parser.add_argument("--postgres-port", type=int, default=int(os.getenv("POSTGRES_PORT", 5432)))
+    parser.add_argument("--postgres-user", default=os.getenv("POSTGRES_USER", "chatbot_user"))
+    parser.add_argument("--postgres-password", default=os.getenv("POSTGRES_PASSWORD", "chatbot_password"))
+    parser.add_argument("--postgres-db", default="chatbot_bench", help="Benchmark database, dropped before and after the run")
+    parser.add_argument("--keep-db", action="store_true", help="Keep the benchmark database after the run")
+    parser.add_argument("--keep-logs", action="store_true", help="Keep the temporary directory with process logs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --output file; exit with status 1 if a latency or write metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against --baseline as a fraction")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+    if args.postgres_db in ("postgres", os.getenv("POSTGRES_DB", "chatbot")):
+        parser.error(f"refusing to use {args.postgres_db!r} as the benchmark database, it is dropped after the run")
+
+    results = asyncio.run(run_benchmark(args))
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Conversation storage benchmark: PostgreSQLConversationStorage under load.
+
+For every combination of conversation length and concurrency, each task owns
+one chat pre-filled with that many messages and runs these operations:
+
+- save_batched: `save_messages` of one more turn, then waits for
+  `_batch_save_worker` to persist everything; latency is the in-memory
+  enqueue, `flush_s` is how long the worker took to write it all
+- save_immediate: `save_messages_immediate` of one more turn
+- get_cached / get_uncached: `get_messages`, the latter after dropping the cache
+- list_cached / list_uncached: `list_conversations`, likewise
+
+Reports ops/sec, p50/p99 latency, WAL bytes and JSON payload bytes per
+operation, and the cache hit rate. Runs against the Postgres server from
+POSTGRES_* (using a separate database that is dropped afterwards) or an
+embedded cluster (--embedded-postgres, needs initdb and pg_ctl on PATH).
+
+Example:
+    python benchmarks/conversation_storage_benchmark.py --lengths 10,100,1000 \\
+        --concurrency 1,8,32 --ops 400 --embedded-postgres --output storage.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import asyncpg
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_load_benchmark import start_embedded_postgres, stop_embedded_postgres, summarize  # noqa: E402
+from postgres_storage import PostgreSQLConversationStorage  # noqa: E402
+
+
+OPERATIONS = ["save_batched", "save_immediate", "get_cached", "get_uncached", "list_cached", "list_uncached"]
+
+
+def make_turn(index: int, words: int) -> List[BaseMessage]:
+    text = " ".join(f"word{i}" for i in range(words))
+    return [HumanMessage(content=f"Question {index}: {text}"), AIMessage(content=f"Answer {index}: {text}")]
+
+
+def make_history(length: int, words: int) -> List[BaseMessage]:
+    messages: List[BaseMessage] = [SystemMessage(content="You are a helpful assistant.")]
+    while len(messages) < length:
+        messages.extend(make_turn(len(messages), words))
+    return messages[:max(length, 1)]
+
+
+async def wal_lsn(conn: asyncpg.Connection) -> str:
+    return await conn.fetchval("SELECT pg_current_wal_lsn()::text")
+
+
+async def wal_bytes_since(conn: asyncpg.Connection, lsn: str) -> int:
+    return int(await conn.fetchval("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), $1::pg_lsn)", lsn))
+
+
+async def wait_for_batch_flush(
+    conn: asyncpg.Connection,
+    histories: Dict[str, List[BaseMessage]],
+    timeout: float = 60
+) -> None:
+    """Wait until every chat's latest history is stored, i.e. the batch save worker caught up."""
+    deadline = time.monotonic() + timeout
+    expected = {chat_id: len(messages) for chat_id, messages in histories.items()}
+    while True:
+        rows = await conn.fetch(
+            "SELECT chat_id, message_count FROM conversations WHERE chat_id = ANY($1::varchar[])",
+            list(expected)
+        )
+        if {row["chat_id"]: row["message_count"] for row in rows} == expected:
+            return
+        if time.monotonic() > deadline:
+            raise RuntimeError("Batch save worker did not flush in time")
+        await asyncio.sleep(0.01)
+
+
+async def run_tasks(concurrency: int, ops: int, op: Callable[[int, int], Awaitable[Any]]) -> Dict[str, Any]:
+    """Run `ops` calls of op(task, i) spread over `concurrency` tasks, timing each call."""
+    latencies: List[float] = []
+
+    async def task(task_index: int):
+        for i in range(task_index, ops, concurrency):
+            start = time.perf_counter()
+            await op(task_index, i)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[task(t) for t in range(concurrency)])
+    return {"elapsed_s": time.perf_counter() - start, "latencies_ms": latencies}
+
+
+async def benchmark_scenario(
+    args: argparse.Namespace,
+    admin: asyncpg.Connection,
+    length: int,
+    concurrency: int
+) -> List[Dict[str, Any]]:
+    await admin.execute("TRUNCATE conversations CASCADE")
+    storage = PostgreSQLConversationStorage(
+        host=args.postgres_host,
+        port=args.postgres_port,
+        database=args.postgres_db,
+        user=args.postgres_user,
+        password=args.postgres_password,
+        pool_size=max(10, concurrency)
+    )
+    await storage.init_pool()
+    try:
+        for _ in range(500):
+            if storage._listening:
+                break
+            await asyncio.sleep(0.01)
+
+        chat_ids = [f"bench-{length}-{concurrency}-{t}" for t in range(concurrency)]
+        histories = {chat_id: make_history(length, args.words) for chat_id in chat_ids}
+        for chat_id, messages in histories.items():
+            await storage.save_messages_immediate(chat_id, messages)
+
+        async def save_batched(task: int, i: int):
+            chat_id = chat_ids[task]
+            histories[chat_id] = histories[chat_id] + make_turn(i, args.words)
+            await storage.save_messages(chat_id, histories[chat_id])
+
+        async def save_immediate(task: int, i: int):
+            chat_id = chat_ids[task]
+            histories[chat_id] = histories[chat_id] + make_turn(i, args.words)
+            await storage.save_messages_immediate(chat_id, histories[chat_id])
+
+        async def get_cached(task: int, i: int):
+            await storage.get_messages(chat_ids[task])
+
+        async def get_uncached(task: int, i: int):
+            storage._invalidate_cache(chat_ids[task])
+            await storage.get_messages(chat_ids[task])
+
+        async def list_cached(task: int, i: int):
+            await storage.list_conversations()
+
+        async def list_uncached(task: int, i: int):
+            storage._chat_list_cache = None
+            await storage.list_conversations()
+
+        operations = {
+            "save_batched": save_batched,
+            "save_immediate": save_immediate,
+            "get_cached": get_cached,
+            "get_uncached": get_uncached,
+            "list_cached": list_cached,
+            "list_uncached": list_uncached,
+        }
+        results = []
+        for name in args.operations:
+            hits, misses, db_operations = storage._cache_hits, storage._cache_misses, storage._db_operations
+            lsn = await wal_lsn(admin)
+            run = await run_tasks(concurrency, args.ops, operations[name])
+            flush_s = None
+            if name == "save_batched":
+                flush_start = time.perf_counter()
+                await wait_for_batch_flush(admin, histories)
+                flush_s = time.perf_counter() - flush_start
+            wal_bytes = await wal_bytes_since(admin, lsn)
+
+            hit_count, miss_count = storage._cache_hits - hits, storage._cache_misses - misses
+            latencies = summarize(run["latencies_ms"])
+            payload_bytes = None
+            if name.startswith("save"):
+                payload_bytes = round(sum(
+                    len(json.dumps([storage._message_to_dict(m) for m in histories[chat_id]]))
+                    for chat_id in chat_ids
+                ) / len(chat_ids), 1)
+            results.append({
+                "length": length,
+                "concurrency": concurrency,
+                "operation": name,
+                "ops": args.ops,
+                "ops_per_s": round(args.ops / (run["elapsed_s"] + (flush_s or 0)), 1),
+                "p50_ms": latencies["p50"],
+                "p99_ms": latencies["p99"],
+                "flush_s": round(flush_s, 3) if flush_s is not None else None,
+                "db_operations": storage._db_operations - db_operations,
+                "wal_bytes_per_op": round(wal_bytes / args.ops, 1),
+                "payload_bytes_per_op": payload_bytes,
+                "cache_hit_rate_percent": round(hit_count / (hit_count + miss_count) * 100, 2) if hit_count + miss_count else None
+            })
+            print(f"[{length} msgs x {concurrency}] {name}: {results[-1]['ops_per_s']} ops/s", file=sys.stderr)
+        return results
+    finally:
+        await storage.close()
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    header = (f"{'msgs':>6} {'conc':>5} {'operation':<15} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} "
+              f"{'WAL B/op':>10} {'payload B':>10} {'hit %':>7}")
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        hit_rate = "-" if row["cache_hit_rate_percent"] is None else f"{row['cache_hit_rate_percent']:.1f}"
+        payload = "-" if row["payload_bytes_per_op"] is None else f"{row['payload_bytes_per_op']:.0f}"
+        print(
+            f"{row['length']:>6} {row['concurrency']:>5} {row['operation']:<15} {row['ops_per_s']:>10.1f} "
+            f"{row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['wal_bytes_per_op']:>10.0f} {payload:>10} {hit_rate:>7}"
+        )
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    async def admin_connect(database: str) -> asyncpg.Connection:
+        return await asyncpg.connect(
+            host=args.postgres_host, port=args.postgres_port, user=args.postgres_user,
+            password=args.postgres_password, database=database
+        )
+
+    async def drop_database():
+        conn = await admin_connect("postgres")
+        try:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{args.postgres_db}" WITH (FORCE)')
+        finally:
+            await conn.close()
+
+    await drop_database()
+    # Let the storage create the database and its tables.
+    bootstrap = PostgreSQLConversationStorage(
+        host=args.postgres_host, port=args.postgres_port, database=args.postgres_db,
+        user=args.postgres_user, password=args.postgres_password
+    )
+    await bootstrap.init_pool()
+    await bootstrap.close()
+
+    results = []
+    admin = await admin_connect(args.postgres_db)
+    try:
+        for length in args.lengths:
+            for concurrency in args.concurrency:
+                results.extend(await benchmark_scenario(args, admin, length, concurrency))
+    finally:
+        await admin.close()
+        if not args.keep_db:
+            await drop_database()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PostgreSQLConversationStorage")
+    parser.add_argument("--lengths", default="10,100,1000", help="Comma-separated messages per conversation")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated numbers of concurrent tasks")
+    parser.add_argument("--ops", type=int, default=200, help="Operations per scenario and operation")
+    parser.add_argument("--words", type=int, default=50, help="Words per message")
+    parser.add_argument("--operations", default=",".join(OPERATIONS), help="Comma-separated operations to run")
+    parser.add_argument("--embedded-postgres", action="store_true", help="Run a temporary Postgres cluster (needs initdb/pg_ctl)")
+    parser.add_argument("--postgres-host", default=os.getenv("POSTGRES_HOST", "127.0.0.1"))
+    parser.add_argument("--postgres-port", type=int, default=int(os.getenv("POSTGRES_PORT", 5432)))
+    parser.add_argument("--postgres-user", default=os.getenv("POSTGRES_USER", "chatbot_user"))
+    parser.add_argument("--postgres-password", default=os.getenv("POSTGRES_PASSWORD", "chatbot_password"))
+    parser.add_argument("--postgres-db", default="chatbot_storage_bench", help="Benchmark database, dropped before and after the run")
+    parser.add_argument("--keep-db", action="store_true", help="Keep the benchmark database after the run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    args.lengths = [int(value) for value in args.lengths.split(",") if value.strip()]
+    args.concurrency = [int(value) for value in args.concurrency.split(",") if value.strip()]
+    args.operations = [value.strip() for value in args.operations.split(",") if value.strip()]
+    unknown = set(args.operations) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+    if args.postgres_db in ("postgres", os.getenv("POSTGRES_DB", "chatbot")):
+        parser.error(f"refusing to use {args.postgres_db!r} as the benchmark database, it is dropped after the run")
+
+    tmp_dir = None
+    pg_data = None
+    if args.embedded_postgres:
+        tmp_dir = tempfile.mkdtemp(prefix="storage_bench_")
+        args.postgres_host = "127.0.0.1"
+        args.postgres_port, pg_data = start_embedded_postgres(tmp_dir, args.postgres_user)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if pg_data:
+            stop_embedded_postgres(pg_data)
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "config": {key: value for key, value in vars(args).items() if key != "postgres_password"},
+                "results": results
+            }, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Mock OpenAI-compatible chat completions server for load tests.
+
+Streams replies with a configurable time to first token (TTFT) and
+inter-token latency (ITL). When the request offers tools and the last message
+is from the user, a configurable fraction of replies is a tool call instead
+of text, so the agent's tool loop is exercised as well.
+
+Example:
+    python benchmarks/mock_llm_server.py --port 8900 --ttft-ms 200 --itl-ms 20 \\
+        --tokens 64 --tool-call-rate 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def tool_arguments(tool: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill a tool's required parameters with placeholder values of the right type."""
+    parameters = tool.get("function", {}).get("parameters", {})
+    placeholders = {"string": "benchmark", "integer": 1, "number": 1.0, "boolean": True, "array": [], "object": {}}
+    return {
+        name: placeholders.get(schema.get("type"), "benchmark")
+        for name, schema in parameters.get("properties", {}).items()
+        if name in parameters.get("required", [])
+    }
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(args.seed)
+    stats = {"requests": 0, "tool_calls": 0, "tokens": 0}
+
+    def chunk(model: str, delta: Dict[str, Any], finish_reason=None) -> str:
+        body = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(body)}\n\n"
+
+    async def stream(model: str, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]):
+        await asyncio.sleep(args.ttft_ms / 1000)
+        if tools and messages and messages[-1].get("role") == "user" and rng.random() < args.tool_call_rate:
+            names = [tool["function"]["name"] for tool in tools]
+            tool = tools[names.index(args.tool_name)] if args.tool_name in names else tools[0]
+            stats["tool_calls"] += 1
+            yield chunk(model, {"role": "assistant", "tool_calls": [{
+                "index": 0,
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": tool["function"]["name"], "arguments": json.dumps(tool_arguments(tool))}
+            }]})
+            yield chunk(model, {}, "tool_calls")
+            yield "data: [DONE]\n\n"
+            return
+
+        for i in range(args.tokens):
+            if i:
+                await asyncio.sleep(args.itl_ms / 1000)
+            stats["tokens"] += 1
+            yield chunk(model, {"role": "assistant", "content": f"tok{i} "} if i == 0 else {"content": f"tok{i} "})
+        yield chunk(model, {}, "stop")
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        return StreamingResponse(
+            stream(body.get("model", "mock"), body.get("messages", []), body.get("tools") or []),
+            media_type="text/event-stream"
+        )
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": args.model, "object": "model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible streaming chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--model", default="gpt-oss-20b", help="Model id reported by /v1/models")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Delay before the first streamed chunk")
+    parser.add_argument("--itl-ms", type=float, default=20, help="Delay between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per text reply")
+    parser.add_argument("--tool-call-rate", type=float, default=0.0, help="Fraction of user turns answered with a tool call")
+    parser.add_argument("--tool-name", default=None, help="Tool to call (default: the first tool offered)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
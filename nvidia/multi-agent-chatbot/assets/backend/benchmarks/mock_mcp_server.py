@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Mock MCP stdio server for load tests.
+
+Exposes a plain `search_documents` tool and a streaming `write_code` tool with
+the same signatures the agent sees from the real servers, answering after a
+configurable delay instead of calling any model.
+
+Environment:
+    MOCK_TOOL_LATENCY_MS: Delay before `search_documents` answers (default 50)
+    MOCK_CODE_CHUNKS: Progress chunks streamed by `write_code` (default 20)
+    MOCK_CODE_CHUNK_MS: Delay between `write_code` chunks (default 10)
+"""
+
+import asyncio
+import os
+
+from mcp.server.fastmcp import Context, FastMCP
+
+mcp = FastMCP("mock-tools")
+
+MOCK_TOOL_LATENCY_MS = float(os.getenv("MOCK_TOOL_LATENCY_MS", 50))
+MOCK_CODE_CHUNKS = int(os.getenv("MOCK_CODE_CHUNKS", 20))
+MOCK_CODE_CHUNK_MS = float(os.getenv("MOCK_CODE_CHUNK_MS", 10))
+
+
+@mcp.tool()
+async def search_documents(query: str) -> str:
+    """Search the indexed documents for passages relevant to the query.
+
+    Args:
+        query: The search query.
+
+    Returns:
+        Matching passages.
+    """
+    await asyncio.sleep(MOCK_TOOL_LATENCY_MS / 1000)
+    return f"Mock passage relevant to: {query}"
+
+
+@mcp.tool()
+async def write_code(query: str, programming_language: str, ctx: Context) -> str:
+    """This tool is used to write complete code.
+
+    Args:
+        query: The natural language description of the code to be generated.
+        programming_language: The programming language for the code generation.
+
+    Returns:
+        The generated code.
+    """
+    lines = []
+    for i in range(MOCK_CODE_CHUNKS):
+        await asyncio.sleep(MOCK_CODE_CHUNK_MS / 1000)
+        line = f"# {programming_language} line {i}\n"
+        lines.append(line)
+        await ctx.report_progress(i + 1, MOCK_CODE_CHUNKS, line)
+    return "".join(lines)
+
+
+if __name__ == "__main__":
+    mcp.run(transport="stdio")
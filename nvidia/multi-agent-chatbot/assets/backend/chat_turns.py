@@ -0,0 +1,155 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""PostgreSQL-backed leases that serialize turns on the same chat.
+
+A turn holds its chat's lease from the moment the user message is accepted
+until the reply is saved. A turn that finds the lease held by a live turn on
+any worker is rejected instead of racing it. The holder renews the lease while
+it runs, so a crashed worker only blocks the chat until the lease expires.
+"""
+
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import asyncpg
+
+from logger import logger
+
+
+CHAT_TURN_LEASE_SECONDS = int(os.getenv("CHAT_TURN_LEASE_SECONDS", 30))
+
+
+class ChatBusyError(Exception):
+    """Raised when another turn on the same chat is still running."""
+
+
+class ChatTurnLeases:
+    """Per-chat turn leases stored in the conversation database's connection pool."""
+
+    def __init__(self, storage, lease_seconds: int = CHAT_TURN_LEASE_SECONDS):
+        """Initialize the lease table wrapper.
+        
+        Args:
+            storage: PostgreSQLConversationStorage whose pool is shared
+            lease_seconds: How long a turn keeps its chat without a lease renewal
+        """
+        self.storage = storage
+        self.lease_seconds = lease_seconds
+
+    @property
+    def pool(self):
+        return self.storage.pool
+
+    async def init(self) -> None:
+        """Create the lease table if it doesn't exist."""
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_turns (
+                    chat_id VARCHAR(255) PRIMARY KEY,
+                    turn_id VARCHAR(64) NOT NULL,
+                    owner VARCHAR(64) NOT NULL,
+                    lease_expires_at TIMESTAMP NOT NULL,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    async def _acquire(self, chat_id: str, turn_id: str) -> Optional[asyncpg.Record]:
+        """Take the chat's lease if it is free or expired.
+        
+        Returns:
+            A row with the chat's stored `version` (NULL if it is not stored
+            yet) if the lease was taken, otherwise None
+        """
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                WITH acquired AS (
+                    INSERT INTO chat_turns (chat_id, turn_id, owner, lease_expires_at)
+                    VALUES ($1, $2, $3, CURRENT_TIMESTAMP + make_interval(secs => $4))
+                    ON CONFLICT (chat_id) DO UPDATE SET
+                        turn_id = EXCLUDED.turn_id,
+                        owner = EXCLUDED.owner,
+                        lease_expires_at = EXCLUDED.lease_expires_at,
+                        started_at = CURRENT_TIMESTAMP
+                    WHERE chat_turns.lease_expires_at < CURRENT_TIMESTAMP
+                    RETURNING turn_id
+                )
+                SELECT (SELECT version FROM conversations WHERE chat_id = $1) AS version
+                FROM acquired
+                """,
+                chat_id, turn_id, self.storage.worker_id, self.lease_seconds
+            )
+        return row
+
+    async def _renew(self, chat_id: str, turn_id: str) -> None:
+        interval = max(1, self.lease_seconds // 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self.pool.acquire() as conn:
+                    result = await conn.execute(
+                        """
+                        UPDATE chat_turns SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $3)
+                        WHERE chat_id = $1 AND turn_id = $2
+                        """,
+                        chat_id, turn_id, self.lease_seconds
+                    )
+                if result == "UPDATE 0":
+                    logger.warning({"message": "Chat turn lease lost", "chat_id": chat_id, "turn_id": turn_id})
+                    return
+            except Exception as e:
+                logger.warning({"message": "Chat turn lease renewal failed", "chat_id": chat_id, "error": str(e)})
+
+    async def _release(self, chat_id: str, turn_id: str) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM chat_turns WHERE chat_id = $1 AND turn_id = $2", chat_id, turn_id)
+
+    @asynccontextmanager
+    async def turn(self, chat_id: str, turn_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Hold the chat's lease for the duration of one turn.
+        
+        On entry the storage's cached history of the chat is dropped if another
+        worker changed it, so the turn starts from the latest saved history.
+        
+        Args:
+            chat_id: Chat identifier
+            turn_id: Id for the turn; a new one is generated if omitted
+            
+        Yields:
+            The turn id
+            
+        Raises:
+            ChatBusyError: If another turn on this chat holds the lease
+        """
+        turn_id = turn_id or uuid.uuid4().hex
+        acquired = await self._acquire(chat_id, turn_id)
+        if acquired is None:
+            raise ChatBusyError(f"Another reply is still being generated for chat {chat_id}")
+        self.storage.refresh_if_stale(chat_id, acquired["version"])
+
+        renewer = asyncio.create_task(self._renew(chat_id, turn_id))
+        try:
+            yield turn_id
+        finally:
+            renewer.cancel()
+            try:
+                await asyncio.shield(self._release(chat_id, turn_id))
+            except Exception as e:
+                logger.warning({"message": "Failed to release chat turn lease", "chat_id": chat_id, "error": str(e)})
@@ -0,0 +1,505 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Token-aware structural chunking for document ingestion.
+
+Documents are parsed into structural blocks (headings, paragraphs, fenced
+code, tables) and packed greedily into chunks measured in tokens of the
+embedding model's tokenizer, so chunk sizes line up with the embedding
+model's context instead of a character count. Oversized blocks are split at
+the finest boundary that keeps them readable: sentences and words for prose,
+lines for code (re-fenced), and rows for tables (header repeated). Chunks
+overlap by up to CHUNK_OVERLAP_TOKENS of trailing prose from the previous
+chunk, and carry the heading path they were found under.
+
+The tokenizer is only ever loaded from a local tokenizer.json (fetched by
+model_download.sh); when the `tokenizers` package or that file is
+unavailable, token counts fall back to a character-based estimate.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from logger import logger
+
+
+# "structural" (token-aware, default) or "character" (legacy 1000/200 character splitter).
+CHUNKER = os.getenv("CHUNKER", "structural").lower()
+# Local tokenizer.json of the embedding model, used to count tokens.
+EMBEDDING_TOKENIZER = os.getenv("EMBEDDING_TOKENIZER", "/models/Qwen3-Embedding-4B-tokenizer.json")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 512))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 64))
+# Chunks smaller than this are not closed early at a heading boundary.
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", 64))
+
+CHUNKERS = {"structural", "character"}
+CHUNK_METADATA_KEYS = ("source", "file_path", "filename")
+SKIPPED_CATEGORIES = {"PageBreak"}
+MAX_SECTION_CHARS = 512
+STATS_SAMPLE_SIZE = 10_000
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+TABLE_ROW_RE = re.compile(r"^\s*\|")
+TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?。！？])\s+")
+CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+
+def approximate_token_count(text: str) -> int:
+    """Estimate tokens as ~4 characters each, counting CJK characters as one token apiece."""
+    cjk = len(CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def load_token_counter(tokenizer: str = EMBEDDING_TOKENIZER) -> Tuple[Callable[[str], int], str]:
+    """Load a token counting function for `tokenizer`.
+
+    The file is never fetched from the Hugging Face Hub, so startup does not
+    depend on network access.
+
+    Args:
+        tokenizer: Path to a tokenizer.json file
+
+    Returns:
+        (count function, name of the tokenizer actually used)
+    """
+    try:
+        from tokenizers import Tokenizer
+
+        if not os.path.isfile(tokenizer):
+            raise FileNotFoundError(f"tokenizer file not found: {tokenizer}")
+        hf_tokenizer = Tokenizer.from_file(tokenizer)
+
+        def count(text: str) -> int:
+            return len(hf_tokenizer.encode(text, add_special_tokens=False).ids)
+
+        return count, tokenizer
+    except Exception as e:
+        logger.warning({
+            "message": "Embedding tokenizer unavailable, estimating token counts from characters",
+            "tokenizer": tokenizer,
+            "error": str(e)
+        })
+        return approximate_token_count, "approximate"
+
+
+@dataclass
+class Block:
+    """A structural unit of a document: heading, paragraph, code or table."""
+    kind: str
+    text: str
+    tokens: int = 0
+    level: int = 0
+    page_number: Optional[int] = None
+    section: str = ""
+
+
+class ChunkStats:
+    """Running chunk size statistics, used to tune embedding batches and index size."""
+
+    def __init__(self, sample_size: int = STATS_SAMPLE_SIZE):
+        self._lock = threading.Lock()
+        self._sample = deque(maxlen=sample_size)
+        self.documents = 0
+        self.chunks = 0
+        self.tokens = 0
+        self.overlap_tokens = 0
+        self.split_blocks = 0
+        self.min_tokens: Optional[int] = None
+        self.max_tokens = 0
+
+    def record(self, token_counts: List[int], documents: int, overlap_tokens: int, split_blocks: int) -> None:
+        with self._lock:
+            self.documents += documents
+            self.chunks += len(token_counts)
+            self.tokens += sum(token_counts)
+            self.overlap_tokens += overlap_tokens
+            self.split_blocks += split_blocks
+            if token_counts:
+                low = min(token_counts)
+                self.min_tokens = low if self.min_tokens is None else min(self.min_tokens, low)
+                self.max_tokens = max(self.max_tokens, max(token_counts))
+            self._sample.extend(token_counts)
+
+    def to_dict(self) -> Dict[str, object]:
+        with self._lock:
+            summary = summarize_token_counts(list(self._sample))
+            return {
+                "documents": self.documents,
+                "chunks": self.chunks,
+                "tokens": self.tokens,
+                "mean_tokens": round(self.tokens / self.chunks, 1) if self.chunks else 0,
+                "min_tokens": self.min_tokens or 0,
+                "max_tokens": self.max_tokens,
+                "p50_tokens": summary["p50_tokens"],
+                "p95_tokens": summary["p95_tokens"],
+                "overlap_ratio": round(self.overlap_tokens / self.tokens, 3) if self.tokens else 0,
+                "split_blocks": self.split_blocks
+            }
+
+
+def summarize_token_counts(token_counts: List[int]) -> Dict[str, int]:
+    """Return the total, median and 95th percentile of a list of chunk token counts."""
+    if not token_counts:
+        return {"tokens": 0, "p50_tokens": 0, "p95_tokens": 0}
+    ordered = sorted(token_counts)
+    return {
+        "tokens": sum(ordered),
+        "p50_tokens": ordered[(len(ordered) - 1) // 2],
+        "p95_tokens": ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)]
+    }
+
+
+def parse_blocks(text: str, page_number: Optional[int] = None) -> List[Block]:
+    """Split markdown-ish text into heading, paragraph, code and table blocks."""
+    blocks: List[Block] = []
+    paragraph: List[str] = []
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append(Block("paragraph", "\n".join(paragraph).strip(), page_number=page_number))
+            paragraph.clear()
+
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        fence = FENCE_RE.match(line)
+        if fence:
+            end_paragraph()
+            code = [line]
+            i += 1
+            while i < len(lines):
+                code.append(lines[i])
+                i += 1
+                if lines[i - 1].strip().startswith(fence.group(1)):
+                    break
+            blocks.append(Block("code", "\n".join(code), page_number=page_number))
+            continue
+
+        heading = HEADING_RE.match(line)
+        if heading:
+            end_paragraph()
+            blocks.append(Block("heading", line.strip(), level=len(heading.group(1)), page_number=page_number))
+        elif TABLE_ROW_RE.match(line):
+            end_paragraph()
+            rows = []
+            while i < len(lines) and TABLE_ROW_RE.match(lines[i]):
+                rows.append(lines[i].rstrip())
+                i += 1
+            blocks.append(Block("table", "\n".join(rows), page_number=page_number))
+            continue
+        elif not line.strip():
+            end_paragraph()
+        else:
+            paragraph.append(line.rstrip())
+        i += 1
+
+    end_paragraph()
+    return [block for block in blocks if block.text]
+
+
+def document_blocks(document: Document) -> List[Block]:
+    """Turn a loaded document, or a single Unstructured element, into blocks."""
+    metadata = document.metadata or {}
+    category = metadata.get("category")
+    page_number = metadata.get("page_number")
+    text = document.page_content.strip()
+    if not text or category in SKIPPED_CATEGORIES:
+        return []
+    if category == "Title":
+        return [Block("heading", text, level=1, page_number=page_number)]
+    if category == "Table":
+        return [Block("table", text, page_number=page_number)]
+    return parse_blocks(document.page_content, page_number)
+
+
+def heading_title(block: Block) -> str:
+    match = HEADING_RE.match(block.text)
+    return match.group(2) if match else block.text
+
+
+class StructuralChunker:
+    """Pack structural blocks into chunks bounded by embedding-model tokens."""
+
+    def __init__(
+        self,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        min_tokens: int = CHUNK_MIN_TOKENS,
+        token_counter: Optional[Callable[[str], int]] = None,
+        tokenizer: str = EMBEDDING_TOKENIZER
+    ):
+        """Initialize the chunker.
+
+        Args:
+            chunk_tokens: Maximum tokens per chunk
+            overlap_tokens: Maximum tokens of trailing prose repeated at the start of the next chunk
+            min_tokens: Chunks smaller than this are not closed early at a heading
+            token_counter: Token counting function (defaults to the embedding tokenizer)
+            tokenizer: Tokenizer loaded when `token_counter` is not given
+        """
+        self.chunk_tokens = max(16, chunk_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.chunk_tokens // 2))
+        self.min_tokens = max(0, min(min_tokens, self.chunk_tokens))
+        if token_counter is not None:
+            self.count_tokens, self.tokenizer = token_counter, "custom"
+        else:
+            self.count_tokens, self.tokenizer = load_token_counter(tokenizer)
+        self.stats = ChunkStats()
+
+    def get_stats(self) -> Dict[str, object]:
+        """Get chunk statistics accumulated since startup."""
+        return {
+            "tokenizer": self.tokenizer,
+            "chunk_tokens": self.chunk_tokens,
+            "overlap_tokens": self.overlap_tokens,
+            **self.stats.to_dict()
+        }
+
+    def _measure(self, block: Block) -> Block:
+        block.tokens = self.count_tokens(block.text)
+        return block
+
+    def _pack(
+        self,
+        units: List[str],
+        template: Block,
+        joiner: str,
+        prefix: str = "",
+        suffix: str = "",
+        reserve: int = 0
+    ) -> List[Block]:
+        """Greedily pack text units into blocks under the token limit, wrapping each in prefix/suffix."""
+        budget = self.chunk_tokens - reserve - self.count_tokens(prefix + suffix)
+        pieces, current, current_tokens = [], [], 0
+        for unit in units:
+            unit_tokens = self.count_tokens(unit)
+            if current and current_tokens + unit_tokens > budget:
+                pieces.append(joiner.join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+        if current:
+            pieces.append(joiner.join(current))
+        return [
+            self._measure(Block(
+                template.kind,
+                prefix + piece + suffix,
+                level=template.level,
+                page_number=template.page_number,
+                section=template.section
+            ))
+            for piece in pieces
+        ]
+
+    def _hard_split(self, text: str) -> List[str]:
+        """Split text with no usable boundaries into windows that fit the token limit."""
+        tokens = max(1, self.count_tokens(text))
+        width = max(1, int(len(text) * self.chunk_tokens / tokens * 0.9))
+        windows = [text[i:i + width] for i in range(0, len(text), width)]
+        result = []
+        for window in windows:
+            if self.count_tokens(window) > self.chunk_tokens and len(window) > 1:
+                half = len(window) // 2
+                result.extend(self._hard_split(window[:half]) + self._hard_split(window[half:]))
+            else:
+                result.append(window)
+        return result
+
+    def _split_text_units(self, text: str) -> List[str]:
+        """Break prose into sentences, then words, then raw windows until each unit fits."""
+        units = []
+        for sentence in SENTENCE_END_RE.split(text):
+            if self.count_tokens(sentence) <= self.chunk_tokens:
+                units.append(sentence)
+                continue
+            for word in sentence.split():
+                if self.count_tokens(word) <= self.chunk_tokens:
+                    units.append(word)
+                else:
+                    units.extend(self._hard_split(word))
+        return units
+
+    def _split_block(self, block: Block) -> List[Block]:
+        """Split a block that is larger than one chunk along its own structure."""
+        if block.kind == "code":
+            lines = block.text.split("\n")
+            opening = lines[0] if FENCE_RE.match(lines[0]) else ""
+            closing = lines[-1] if len(lines) > 1 and FENCE_RE.match(lines[-1]) else ""
+            body = lines[1 if opening else 0:len(lines) - 1 if closing else len(lines)]
+            units = [unit for line in body for unit in (
+                [line] if self.count_tokens(line) <= self.chunk_tokens // 2 else self._hard_split(line)
+            )]
+            return self._pack(units, block, "\n", opening + "\n" if opening else "", "\n" + closing if closing else "")
+
+        if block.kind == "table":
+            rows = block.text.split("\n")
+            header = rows[:2] if len(rows) > 2 and TABLE_SEPARATOR_RE.match(rows[1]) else []
+            prefix = "\n".join(header) + "\n" if header else ""
+            units = [unit for row in rows[len(header):] for unit in (
+                [row] if self.count_tokens(row) <= self.chunk_tokens // 2 else self._hard_split(row)
+            )]
+            return self._pack(units, block, "\n", prefix)
+
+        # Leave room for the overlap carried into each following chunk.
+        return self._pack(self._split_text_units(block.text), block, " ", reserve=self.overlap_tokens)
+
+    def _overlap(self, blocks: List[Block]) -> Optional[Block]:
+        """Return the trailing prose of a chunk that fits in the overlap budget."""
+        if not self.overlap_tokens or not blocks or blocks[-1].kind != "paragraph":
+            return None
+        last = blocks[-1]
+        if last.tokens <= self.overlap_tokens:
+            return Block("overlap", last.text, last.tokens, page_number=last.page_number, section=last.section)
+
+        tail: List[str] = []
+        tokens = 0
+        for sentence in reversed(SENTENCE_END_RE.split(last.text)):
+            sentence_tokens = self.count_tokens(sentence)
+            if tokens + sentence_tokens > self.overlap_tokens:
+                break
+            tail.insert(0, sentence)
+            tokens += sentence_tokens
+        if not tail:
+            return None
+        return Block("overlap", " ".join(tail), tokens, page_number=last.page_number, section=last.section)
+
+    def _chunk_blocks(self, blocks: List[Block], metadata: dict) -> Tuple[List[Document], List[int], int, int]:
+        """Pack one file's blocks into chunk documents.
+
+        Returns:
+            (chunks, token count per chunk, overlap tokens, number of oversized blocks split)
+        """
+        chunks: List[Document] = []
+        token_counts: List[int] = []
+        overlap_total = 0
+        split_blocks = 0
+        headings: List[Tuple[int, str]] = []
+        current: List[Block] = []
+        current_tokens = 0
+
+        def emit(carry_overlap: bool, final: bool = False) -> None:
+            nonlocal current, current_tokens, overlap_total
+            # A heading that ended up last belongs with the content that follows it, so it is
+            # held back for the next chunk, unless nothing else would be emitted.
+            split = len(current)
+            if not final:
+                while split and current[split - 1].kind == "heading":
+                    split -= 1
+                if not any(block.kind not in ("heading", "overlap") for block in current[:split]):
+                    split = len(current)
+            body, trailing_headings = current[:split], current[split:]
+            content = [block for block in body if block.kind != "overlap"]
+            if not content:
+                return
+            text = "\n\n".join(block.text for block in body)
+            tokens = self.count_tokens(text)
+            page = next((block.page_number for block in body if block.page_number is not None), None)
+            chunk_metadata = {key: metadata.get(key, "") for key in CHUNK_METADATA_KEYS}
+            chunk_metadata.update({
+                "page_number": str(page) if page is not None else "",
+                "section": content[0].section[:MAX_SECTION_CHARS],
+                "token_count": tokens
+            })
+            chunks.append(Document(page_content=text, metadata=chunk_metadata))
+            token_counts.append(tokens)
+
+            overlap = self._overlap(body) if carry_overlap and not trailing_headings else None
+            current = ([overlap] if overlap else []) + trailing_headings
+            current_tokens = sum(block.tokens for block in current)
+            if overlap:
+                overlap_total += overlap.tokens
+
+        for block in blocks:
+            self._measure(block)
+            if block.kind == "heading":
+                # Prefer closing a chunk at a heading over splitting a section across chunks.
+                if current_tokens >= self.min_tokens:
+                    emit(carry_overlap=False)
+                headings = [(level, name) for level, name in headings if level < block.level]
+                headings.append((block.level, heading_title(block)))
+            block.section = " > ".join(name for _, name in headings)
+
+            pieces = [block]
+            if block.tokens > self.chunk_tokens:
+                pieces = self._split_block(block)
+                split_blocks += 1
+            for piece in pieces:
+                if current and current_tokens + piece.tokens > self.chunk_tokens:
+                    emit(carry_overlap=True)
+                    if current_tokens + piece.tokens > self.chunk_tokens:
+                        current = [b for b in current if b.kind != "overlap"]
+                        current_tokens = sum(b.tokens for b in current)
+                current.append(piece)
+                current_tokens += piece.tokens
+        emit(carry_overlap=False, final=True)
+        return chunks, token_counts, overlap_total, split_blocks
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Split loaded documents into token-bounded chunks.
+
+        Consecutive documents from the same source (e.g. the elements or pages
+        Unstructured returns for one file) are chunked together, so small
+        elements are packed into full chunks instead of being embedded alone.
+        """
+        groups: List[Tuple[dict, List[Document]]] = []
+        for document in documents:
+            source = (document.metadata or {}).get("source")
+            if groups and groups[-1][0].get("source") == source:
+                groups[-1][1].append(document)
+            else:
+                groups.append((document.metadata or {}, [document]))
+
+        chunks: List[Document] = []
+        token_counts: List[int] = []
+        overlap_tokens = 0
+        split_blocks = 0
+        for metadata, group in groups:
+            blocks = [block for document in group for block in document_blocks(document)]
+            group_chunks, group_counts, group_overlap, group_splits = self._chunk_blocks(blocks, metadata)
+            chunks.extend(group_chunks)
+            token_counts.extend(group_counts)
+            overlap_tokens += group_overlap
+            split_blocks += group_splits
+
+        self.stats.record(token_counts, len(documents), overlap_tokens, split_blocks)
+        logger.debug({
+            "message": "Chunked documents",
+            "document_count": len(documents),
+            "chunk_count": len(chunks),
+            "max_tokens": max(token_counts, default=0),
+            **summarize_token_counts(token_counts)
+        })
+        return chunks
+
+
+def create_chunker(chunker: str = CHUNKER):
+    """Create the configured chunker; both kinds expose `split_documents`."""
+    if chunker not in CHUNKERS:
+        raise ValueError(f"Unknown chunker {chunker!r}, expected one of {sorted(CHUNKERS)}")
+    if chunker == "character":
+        return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    return StructuralChunker()
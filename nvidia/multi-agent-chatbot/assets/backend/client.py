@@ -19,12 +19,122 @@
 This module provides a unified client interface for connecting to and managing
 multiple Model Context Protocol (MCP) servers. It handles server configuration,
 initialization, and tool retrieval across different server types.
+
+By default every tool call starts a fresh stdio server process. Servers named
+in MCP_PERSISTENT_SERVERS instead keep one long-lived session whose process
+serves all calls concurrently, so they can hold pooled clients and caches and
+batch across calls. A persistent session whose transport fails is dropped and
+reopened on the next call; a request that never reached the server is retried
+once on the new session.
+
+MCP_SERVERS_CONFIG names a JSON file of server configurations that replaces
+the built-in servers, e.g. to run against other or mock servers.
+
+`call_tool_streaming` calls a tool with a progress callback, which servers use
+to stream partial output such as generated code. Cancelling the awaiting
+task cancels the call on the server too: persistent stdio sessions record the
+JSON-RPC id of each tool call as it is sent, and per-call sessions stop their
+server process when they close.
 """
 
-from typing import List, Optional
+import asyncio
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
+import anyio
 from langchain_mcp_adapters.client import MultiServerMCPClient
-from mcp.types import Tool
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+from mcp.shared.message import SessionMessage
+from mcp.types import (
+    CONNECTION_CLOSED,
+    CallToolRequest,
+    CallToolRequestParams,
+    CallToolResult,
+    CancelledNotification,
+    CancelledNotificationParams,
+    ClientNotification,
+    ClientRequest,
+    JSONRPCRequest,
+    ListToolsResult,
+    RequestId,
+    RequestParams,
+    Tool,
+)
+
+from logger import logger
+
+
+MCP_PERSISTENT_SERVERS = [
+    name.strip() for name in os.getenv("MCP_PERSISTENT_SERVERS", "image-understanding-server,code-generation-server").split(",")
+    if name.strip()
+]
+MCP_SERVERS_CONFIG = os.getenv("MCP_SERVERS_CONFIG")
+
+# `_meta` key tagging a tool call, so its JSON-RPC id can be recorded when it is sent.
+CALL_KEY_META = "clientCallKey"
+
+# Raised when a request cannot be sent because the session's transport is closed.
+UNSENT_REQUEST_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, BrokenPipeError)
+
+
+def is_transport_error(error: BaseException) -> bool:
+    """Whether `error` means the session's connection to its server is gone."""
+    if isinstance(error, UNSENT_REQUEST_ERRORS + (anyio.EndOfStream, ConnectionError)):
+        return True
+    return isinstance(error, McpError) and error.error.code == CONNECTION_CLOSED
+
+
+class RequestIdRecorder:
+    """Wraps a session's write stream, recording the JSON-RPC id of each tagged request it sends.
+
+    ClientSession assigns request ids internally, but cancelling a call on the
+    server needs the id of its request.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.request_ids: Dict[str, RequestId] = {}
+
+    async def send(self, message: SessionMessage) -> None:
+        request = message.message.root
+        if isinstance(request, JSONRPCRequest):
+            key = ((request.params or {}).get("_meta") or {}).get(CALL_KEY_META)
+            if key is not None:
+                self.request_ids[key] = request.id
+        await self._stream.send(message)
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+    async def __aenter__(self) -> "RequestIdRecorder":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
+class PersistentSession:
+    """Stands in for a persistent server's session in the tools built from it.
+
+    Each call goes to the server's current session, so tools keep working
+    after the session has been reopened.
+    """
+
+    def __init__(self, client: "MCPClient", server_name: str):
+        self.client = client
+        self.server_name = server_name
+
+    async def list_tools(self, *args, **kwargs) -> ListToolsResult:
+        return await self.client._call_persistent(self.server_name, lambda session: session.list_tools(*args, **kwargs))
+
+    async def call_tool(self, *args, **kwargs) -> CallToolResult:
+        return await self.client._call_persistent(self.server_name, lambda session: session.call_tool(*args, **kwargs))
 
 
 class MCPClient:
@@ -34,8 +144,12 @@ class MCPClient:
     various MCP servers including RAG, image understanding, and weather services.
     """
     
-    def __init__(self):
-        """Initialize the MCP client with predefined server configurations."""
+    def __init__(self, persistent_servers: List[str] = MCP_PERSISTENT_SERVERS):
+        """Initialize the MCP client with predefined server configurations.
+        
+        Args:
+            persistent_servers: Servers that keep one session open instead of one per call
+        """
         self.server_configs = {
             "image-understanding-server": {
                 "command": "python",
@@ -58,7 +172,18 @@ class MCPClient:
                 "transport": "stdio",
             }
         }
+        if MCP_SERVERS_CONFIG:
+            with open(MCP_SERVERS_CONFIG, "r") as f:
+                self.server_configs = json.load(f)
+        self.persistent_servers = [name for name in persistent_servers if name in self.server_configs]
         self.mcp_client: MultiServerMCPClient | None = None
+        self._sessions: Dict[str, ClientSession] = {}
+        # Each persistent session is held open by its own task until its stop event is set.
+        self._session_tasks: Dict[str, asyncio.Task] = {}
+        self._session_stops: Dict[str, asyncio.Event] = {}
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._recorders: Dict[str, RequestIdRecorder] = {}
+        self._tool_servers: Dict[str, str] = {}
 
     async def init(self):
         """Initialize the multi-server MCP client.
@@ -86,8 +211,161 @@ class MCPClient:
             raise RuntimeError("MCP client not initialized. Call `await init()` first.")
         
         try:
-            tools = await self.mcp_client.get_tools()
+            tools = []
+            for server_name in self.server_configs:
+                if server_name in self.persistent_servers:
+                    server_tools = await load_mcp_tools(PersistentSession(self, server_name))
+                else:
+                    server_tools = await self.mcp_client.get_tools(server_name=server_name)
+                for tool in server_tools:
+                    self._tool_servers[tool.name] = server_name
+                tools.extend(server_tools)
             return tools
         except Exception as error:
             print("Error encountered connecting to MCP server. Is the server running? Is your config server path correct?\n")
-            raise error
\ No newline at end of file
+            raise error
+
+    @asynccontextmanager
+    async def _open_session(self, server_name: str) -> AsyncIterator[Tuple[ClientSession, Optional[RequestIdRecorder]]]:
+        """Open a session to a persistent server; stdio sessions also get a request id recorder."""
+        config = self.server_configs[server_name]
+        if config.get("transport") != "stdio":
+            async with self.mcp_client.session(server_name) as session:
+                yield session, None
+            return
+
+        # Same environment handling as the per-call sessions of MultiServerMCPClient.
+        env = dict(config.get("env") or {})
+        env.setdefault("PATH", os.environ.get("PATH", ""))
+        params = StdioServerParameters(command=config["command"], args=config["args"], env=env, cwd=config.get("cwd"))
+        async with stdio_client(params) as (read, write):
+            recorder = RequestIdRecorder(write)
+            async with ClientSession(read, recorder, **(config.get("session_kwargs") or {})) as session:
+                await session.initialize()
+                yield session, recorder
+
+    async def _hold_session(self, server_name: str, ready: asyncio.Future, stop: asyncio.Event) -> None:
+        """Keep a persistent server's session open until `stop` is set."""
+        try:
+            async with self._open_session(server_name) as (session, recorder):
+                if recorder is not None:
+                    self._recorders[server_name] = recorder
+                ready.set_result(session)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.debug({"message": "Error closing MCP session", "server": server_name, "error": str(e)})
+
+    async def _get_session(self, server_name: str) -> ClientSession:
+        """Return the long-lived session of a persistent server, opening it if it is not open."""
+        async with self._session_locks.setdefault(server_name, asyncio.Lock()):
+            task = self._session_tasks.get(server_name)
+            if server_name in self._sessions and task is not None and not task.done():
+                return self._sessions[server_name]
+            ready = asyncio.get_running_loop().create_future()
+            stop = asyncio.Event()
+            self._session_stops[server_name] = stop
+            self._session_tasks[server_name] = asyncio.create_task(self._hold_session(server_name, ready, stop))
+            session = await ready
+            self._sessions[server_name] = session
+            return session
+
+    def _discard_session(self, server_name: str, session: ClientSession, error: BaseException) -> None:
+        """Drop a persistent session whose transport failed, so the next call reconnects."""
+        if self._sessions.get(server_name) is not session:
+            return
+        del self._sessions[server_name]
+        self._session_stops.pop(server_name).set()
+        self._session_tasks.pop(server_name, None)
+        self._recorders.pop(server_name, None)
+        logger.warning({"message": "MCP session lost, reconnecting on next use", "server": server_name, "error": str(error)})
+
+    async def _call_persistent(self, server_name: str, call: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+        """Run `call` on a persistent server's session, reconnecting if the session is closed.
+
+        A request that could not be sent is retried once on a new session; one
+        that failed after it was sent is not, since the server may have acted on it.
+        """
+        for attempt in range(2):
+            session = await self._get_session(server_name)
+            try:
+                return await call(session)
+            except Exception as e:
+                if not is_transport_error(e):
+                    raise
+                self._discard_session(server_name, session, e)
+                if attempt or not isinstance(e, UNSENT_REQUEST_ERRORS):
+                    raise
+
+    async def call_tool_streaming(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        on_progress: Callable[[float, Optional[float], Optional[str]], Awaitable[None]]
+    ) -> CallToolResult:
+        """Call a tool and receive its progress notifications while it runs.
+        
+        Args:
+            tool_name: Name of a tool returned by `get_tools`
+            arguments: Tool arguments
+            on_progress: Awaited with (progress, total, message) for every progress notification
+            
+        Returns:
+            CallToolResult: The raw MCP tool result
+            
+        Raises:
+            KeyError: If the tool is unknown
+            asyncio.CancelledError: If the call was cancelled; the server is told to cancel it too
+        """
+        if not self.mcp_client:
+            raise RuntimeError("MCP client not initialized. Call `await init()` first.")
+        server_name = self._tool_servers[tool_name]
+
+        async def call(session: ClientSession) -> CallToolResult:
+            recorder = self._recorders.get(server_name)
+            key = uuid.uuid4().hex
+            request = ClientRequest(CallToolRequest(
+                method="tools/call",
+                params=CallToolRequestParams(
+                    name=tool_name,
+                    arguments=arguments,
+                    _meta=RequestParams.Meta(**{CALL_KEY_META: key})
+                )
+            ))
+            try:
+                return await session.send_request(request, CallToolResult, progress_callback=on_progress)
+            except asyncio.CancelledError:
+                # The SDK stops waiting for the response but does not tell the server.
+                request_id = recorder.request_ids.get(key) if recorder is not None else None
+                if request_id is not None:
+                    notification = CancelledNotification(
+                        method="notifications/cancelled",
+                        params=CancelledNotificationParams(requestId=request_id, reason="Cancelled by client")
+                    )
+                    try:
+                        await asyncio.shield(session.send_notification(ClientNotification(notification)))
+                    except Exception:
+                        pass
+                raise
+            finally:
+                if recorder is not None:
+                    recorder.request_ids.pop(key, None)
+
+        if server_name in self.persistent_servers:
+            return await self._call_persistent(server_name, call)
+        # Closing a per-call session stops its server process, which ends a cancelled call.
+        async with self.mcp_client.session(server_name) as session:
+            return await call(session)
+
+    async def close(self):
+        """Close persistent sessions and stop their server processes."""
+        self._sessions.clear()
+        for stop in self._session_stops.values():
+            stop.set()
+        tasks = list(self._session_tasks.values())
+        self._session_stops.clear()
+        self._session_tasks.clear()
+        self._recorders.clear()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -14,152 +14,292 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-"""ConfigManager for managing the configuration of the chat application."""
+"""ConfigManager for managing the configuration of the chat application.
 
+The configuration is held in memory as an immutable snapshot: readers get the
+current `ChatConfig` without touching the filesystem, and every update swaps
+in a new copy. Updates are recorded as operations and persisted after a short
+debounce with an atomic temp-file + rename, so a crash never leaves a torn
+file. Persisting takes an advisory file lock and replays the pending
+operations on top of the latest file contents, so concurrent uvicorn workers
+and the RAG MCP server (which share config.json) do not overwrite each
+other's changes. Changes made by other processes are picked up by a stat of
+the file at most once every CONFIG_RELOAD_INTERVAL seconds.
+"""
+
+import atexit
+import fcntl
 import json
 import os
-import logging
+import tempfile
 import threading
-from typing import List
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
 
 from logger import logger
 from models import ChatConfig
 
 
+CONFIG_WRITE_DELAY = float(os.getenv("CONFIG_WRITE_DELAY", 0.2))
+CONFIG_RELOAD_INTERVAL = float(os.getenv("CONFIG_RELOAD_INTERVAL", 1.0))
+
+ConfigOperation = Callable[[ChatConfig], ChatConfig]
+
+
+def _models_from_env() -> List[str]:
+    models = os.getenv("MODELS", "")
+    return [model.strip() for model in models.split(",") if model.strip()]
+
+
 class ConfigManager:
-    def __init__(self, config_path: str):
-        """Initialize the ConfigManager"""
+    def __init__(
+        self,
+        config_path: str,
+        write_delay: float = CONFIG_WRITE_DELAY,
+        reload_interval: float = CONFIG_RELOAD_INTERVAL
+    ):
+        """Initialize the ConfigManager.
+
+        Args:
+            config_path: Path of the JSON file shared by every process using the config
+            write_delay: Seconds to coalesce updates before persisting them (0 writes immediately)
+            reload_interval: Minimum seconds between checks for changes made by other processes
+        """
         self.config_path = config_path
+        self.write_delay = write_delay
+        self.reload_interval = reload_interval
         self.config = None
-        self._last_modified = 0
+        self._persisted: Optional[ChatConfig] = None
+        self._pending: List[ConfigOperation] = []
+        self._file_stamp: Optional[Tuple[int, int]] = None
+        self._last_checked = 0.0
         self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
         self._ensure_config_exists()
-        self.read_config()
-    
-    def _ensure_config_exists(self) -> None:
-        """Ensure config.json exists, creating it with default values if not."""
-        models = []
-        models = os.getenv("MODELS", "")
+        atexit.register(self.flush)
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.config_path)
+            return stat.st_mtime_ns, stat.st_ino
+        except FileNotFoundError:
+            return None
 
-        if models:
-            models = [model.strip() for model in models.split(",") if model.strip()]
-        else:
+    @contextmanager
+    def _file_lock(self):
+        """Hold an advisory lock that serializes config writes across processes."""
+        with open(self.config_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_file(self) -> ChatConfig:
+        with open(self.config_path, "r") as f:
+            return ChatConfig(**json.load(f))
+
+    def _write_file(self, config: ChatConfig) -> None:
+        """Write the config to a temporary file and atomically rename it into place."""
+        directory = os.path.dirname(os.path.abspath(self.config_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".config-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(config.model_dump(), f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _ensure_config_exists(self) -> None:
+        """Load config.json, creating it with default values or syncing MODELS into it."""
+        models = _models_from_env()
+        if not models:
             logger.warning("MODELS environment variable not set, using empty models list")
 
-        if not os.path.exists(self.config_path):
-            logger.debug(f"Config file {self.config_path} not found, creating default config")
-            default_config = ChatConfig(
+        default_config = ChatConfig(
+            sources=[],
+            models=models,
+            selected_model=models[0] if models else None,
+            selected_sources=[],
+            current_chat_id=None
+        )
+        with self._file_lock():
+            if not os.path.exists(self.config_path):
+                logger.debug(f"Config file {self.config_path} not found, creating default config")
+                config = default_config
+            else:
+                try:
+                    config = self._load_file()
+                    if models:
+                        config.models = models
+                        if not config.selected_model or config.selected_model not in models:
+                            config.selected_model = models[0]
+                    logger.debug(f"Updated existing config with models: {models}")
+                except Exception as e:
+                    logger.error(f"Error updating existing config: {e}")
+                    config = default_config
+            self._write_file(config)
+            self._file_stamp = self._stamp()
+        self._persisted = self.config = config
+        self._last_checked = time.monotonic()
+
+    def _reload_if_changed(self) -> None:
+        """Adopt changes written by other processes, keeping this process's unsaved updates."""
+        stamp = self._stamp()
+        if stamp is None or stamp == self._file_stamp:
+            return
+        config = self._load_file()
+        with self._lock:
+            self._persisted = config
+            self._file_stamp = stamp
+            for operation in self._pending:
+                config = operation(config)
+            self.config = config
+        logger.debug({"message": "Reloaded config changed by another process", "path": self.config_path})
+
+    def read_config(self) -> ChatConfig:
+        """Return the current config snapshot.
+
+        The snapshot is shared and must not be mutated; use `update` or the
+        `updated_*` helpers to change the config.
+        """
+        now = time.monotonic()
+        if now - self._last_checked >= self.reload_interval:
+            self._last_checked = now
+            try:
+                self._reload_if_changed()
+            except Exception as e:
+                logger.error(f"Error reading config: {e}")
+        if self.config is None:
+            models = _models_from_env()
+            self.config = ChatConfig(
                 sources=[],
                 models=models,
-                selected_model=models[0] if models else None,
+                selected_model=models[0] if models else "gpt-oss-120b",
                 selected_sources=[],
-                current_chat_id=None
+                current_chat_id="1"
             )
-            
-            with open(self.config_path, "w") as f:
-                json.dump(default_config.model_dump(), f, indent=2)
-        else:
-            try:
-                with open(self.config_path, "r") as f:
-                    data = json.load(f)
-                existing_config = ChatConfig(**data)
-                
-                if models:
-                    existing_config.models = models
-                    if not existing_config.selected_model or existing_config.selected_model not in models:
-                        existing_config.selected_model = models[0]
-                
-                with open(self.config_path, "w") as f:
-                    json.dump(existing_config.model_dump(), f, indent=2)
-                    
-                logger.debug(f"Updated existing config with models: {models}")
-            except Exception as e:
-                logger.error(f"Error updating existing config: {e}")
-                default_config = ChatConfig(
-                    sources=[],
-                    models=models,
-                    selected_model=models[0] if models else None,
-                    selected_sources=[],
-                    current_chat_id=None
-                )
-                with open(self.config_path, "w") as f:
-                    json.dump(default_config.model_dump(), f, indent=2)
-    
-    def read_config(self) -> ChatConfig:
-        """Read config from file, but only if it has changed since last read."""
+        return self.config
+
+    def update(self, operation: ConfigOperation) -> ChatConfig:
+        """Apply `operation` to the config and schedule the change to be persisted.
+
+        Args:
+            operation: Function returning a modified copy of the config it is given;
+                it is replayed on the latest file contents when the change is written
+
+        Returns:
+            The new config snapshot
+        """
+        self.read_config()
         with self._lock:
+            self.config = operation(self.config)
+            self._pending.append(operation)
+            if self.write_delay > 0 and self._timer is None:
+                self._timer = threading.Timer(self.write_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            config = self.config
+        if self.write_delay <= 0:
+            self.flush()
+        return config
+
+    def flush(self) -> None:
+        """Persist pending updates now."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                operations, self._pending = self._pending, []
+            if not operations:
+                return
+
             try:
-                current_mtime = os.path.getmtime(self.config_path)
-                if self.config is None or current_mtime > self._last_modified:
-                    with open(self.config_path, "r") as f:
-                        data = json.load(f)
-                    self.config = ChatConfig(**data)
-                    self._last_modified = current_mtime
-                return self.config
+                with self._file_lock():
+                    stamp = self._stamp()
+                    config = self._load_file() if stamp is not None and stamp != self._file_stamp else self._persisted
+                    for operation in operations:
+                        config = operation(config)
+                    self._write_file(config)
+                    stamp = self._stamp()
             except Exception as e:
-                logger.error(f"Error reading config: {e}")
-                if self.config is None:
-                    models = []
-                    models = os.getenv("MODELS", "")
-                    if models:
-                        models = [model.strip() for model in models.split(",") if model.strip()]
-                    
-                    self.config = ChatConfig(
-                        sources=[],
-                        models=models,
-                        selected_model=models[0] if models else "gpt-oss-120b",
-                        selected_sources=[],
-                        current_chat_id="1"
-                    )
-                return self.config
+                logger.error(f"Error writing config: {e}")
+                with self._lock:
+                    self._pending = operations + self._pending
+                return
+
+            with self._lock:
+                self._persisted = config
+                self._file_stamp = stamp
+                for operation in self._pending:
+                    config = operation(config)
+                self.config = config
+        logger.debug({"message": "Persisted config", "path": self.config_path, "operations": len(operations)})
 
     def write_config(self, new_config: ChatConfig) -> None:
-        """Thread-safe write config to file."""
-        with self._lock:
-            with open(self.config_path, "w") as f:
-                json.dump(new_config.model_dump(), f, indent=2)
-            self.config = new_config
-            self._last_modified = os.path.getmtime(self.config_path)
+        """Replace the whole config."""
+        new_config = new_config.model_copy(deep=True)
+        self.update(lambda config: new_config)
+
+    def _set(self, **changes) -> ChatConfig:
+        return self.update(lambda config: config.model_copy(update=changes))
 
     def get_sources(self) -> List[str]:
         """Return list of available sources."""
-        self.config = self.read_config()
-        return self.config.sources
+        return self.read_config().sources
     
     def get_selected_sources(self) -> List[str]:
         """Return list of selected sources."""
-        self.config = self.read_config()
-        return self.config.selected_sources
+        return self.read_config().selected_sources
     
     def get_available_models(self) -> List[str]:    
         """Return list of available models."""
-        self.config = self.read_config()
-        return self.config.models
+        return self.read_config().models
     
     def get_selected_model(self) -> str:
         """Return the selected model."""
-        self.config = self.read_config()
-        logger.debug(f"Selected model: {self.config.selected_model}")
-        return self.config.selected_model
+        selected_model = self.read_config().selected_model
+        logger.debug(f"Selected model: {selected_model}")
+        return selected_model
     
     def get_current_chat_id(self) -> str:
         """Return the current chat id."""
-        self.config = self.read_config()
-        return self.config.current_chat_id  
-    
+        return self.read_config().current_chat_id
     
+    def add_sources(self, new_sources: List[str]) -> None:
+        """Add sources that are not already known."""
+        def add(config: ChatConfig) -> ChatConfig:
+            missing = [source for source in new_sources if source not in config.sources]
+            return config.model_copy(update={"sources": config.sources + missing}) if missing else config
+        self.update(add)
+
+    def remove_source(self, source: str) -> None:
+        """Remove a source and deselect it."""
+        def remove(config: ChatConfig) -> ChatConfig:
+            return config.model_copy(update={
+                "sources": [name for name in config.sources if name != source],
+                "selected_sources": [name for name in (config.selected_sources or []) if name != source]
+            })
+        self.update(remove)
+
     def updated_selected_sources(self, new_sources: List[str]) -> None:
         """Update the selected sources in the config."""
-        self.config = self.read_config().model_copy(update={"selected_sources": new_sources})
-        self.write_config(self.config)
+        self._set(selected_sources=list(new_sources))
     
     def updated_selected_model(self, new_model: str) -> None:
         """Update the selected model in the config."""
-        self.config = self.read_config().model_copy(update={"selected_model": new_model})
+        self._set(selected_model=new_model)
         logger.debug(f"Updated selected model to: {new_model}")
-        self.write_config(self.config)
     
     def updated_current_chat_id(self, new_chat_id: str) -> None:
         """Update the current chat id in the config."""
-        self.config = self.read_config().model_copy(update={"current_chat_id": new_chat_id})
-        self.write_config(self.config)
+        self._set(current_chat_id=new_chat_id)
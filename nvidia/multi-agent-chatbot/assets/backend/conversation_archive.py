@@ -0,0 +1,316 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Cold storage for idle conversations.
+
+A background pass moves conversations that have not been written or restored
+for ARCHIVE_IDLE_SECONDS into the `conversation_archive` table as zstd
+compressed JSON and empties their `messages` column. Their search columns are
+left in place, so archived conversations still show up in chat search. Reading
+an archived conversation restores it in place, so callers never see the
+difference apart from the extra latency of the first read.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import asyncpg
+import zstandard
+
+from logger import logger
+
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+ARCHIVE_IDLE_SECONDS = int(os.getenv("ARCHIVE_IDLE_SECONDS", 30 * 24 * 3600))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 3600))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 100))
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", 10))
+ARCHIVE_LATENCY_SAMPLES = 1000
+
+
+def compress(data: bytes, level: int = ARCHIVE_ZSTD_LEVEL) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def summarize_latencies(samples: List[float]) -> Dict[str, float]:
+    """Return the median, 99th percentile and maximum of latencies in milliseconds."""
+    if not samples:
+        return {"p50_ms": 0, "p99_ms": 0, "max_ms": 0}
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(ordered[(len(ordered) - 1) // 2], 2),
+        "p99_ms": round(ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.99) - 1)], 2),
+        "max_ms": round(ordered[-1], 2)
+    }
+
+
+class ConversationArchive:
+    """Archives idle conversations of a PostgreSQLConversationStorage and restores them on access."""
+
+    def __init__(
+        self,
+        storage,
+        idle_seconds: int = ARCHIVE_IDLE_SECONDS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        level: int = ARCHIVE_ZSTD_LEVEL
+    ):
+        """Initialize the archive.
+        
+        Args:
+            storage: PostgreSQLConversationStorage whose pool and caches are used
+            idle_seconds: Time without a write or restore after which a conversation is archived
+            batch_size: Maximum conversations archived per transaction
+            level: zstd compression level
+        """
+        self.storage = storage
+        self.idle_seconds = idle_seconds
+        self.batch_size = batch_size
+        self.level = level
+
+        self.archived = 0
+        self.restored = 0
+        self.archive_errors = 0
+        self.restore_errors = 0
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+        self._archive_latencies: Deque[float] = deque(maxlen=ARCHIVE_LATENCY_SAMPLES)
+        self._restore_latencies: Deque[float] = deque(maxlen=ARCHIVE_LATENCY_SAMPLES)
+
+    @property
+    def pool(self):
+        return self.storage.pool
+
+    async def init(self) -> None:
+        """Create the archive table if it doesn't exist."""
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversation_archive (
+                    chat_id VARCHAR(255) PRIMARY KEY REFERENCES conversations(chat_id) ON DELETE CASCADE,
+                    data BYTEA NOT NULL,
+                    original_bytes INTEGER NOT NULL,
+                    compressed_bytes INTEGER NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    async def run(self, interval: float = ARCHIVE_INTERVAL) -> None:
+        """Archive idle conversations every `interval` seconds until cancelled."""
+        await self.index_all_archived()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                while await self.archive_idle() == self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.archive_errors += 1
+                logger.error({"message": "Conversation archive pass failed", "error": str(e)})
+
+    async def index_all_archived(self) -> None:
+        """Fill the search columns of every conversation archived without them."""
+        try:
+            while await self.index_archived() == self.batch_size:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error({"message": "Indexing archived conversations for search failed", "error": str(e)})
+
+    async def index_archived(self) -> int:
+        """Fill the search columns of one batch of conversations archived without them.
+        
+        Conversations archived before the search columns were kept have none; they
+        are indexed from their archived copies.
+        
+        Returns:
+            The number of conversations indexed
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT c.chat_id, a.data FROM conversations c
+                JOIN conversation_archive a ON a.chat_id = c.chat_id
+                WHERE c.archived AND c.search_text IS NULL
+                LIMIT $1
+                """,
+                self.batch_size
+            )
+            if not rows:
+                return 0
+            payloads = await asyncio.to_thread(lambda: [decompress(row["data"]).decode("utf-8") for row in rows])
+            await conn.executemany(
+                """
+                UPDATE conversations
+                SET search_vector = conversation_search_vector($2::jsonb),
+                    search_text = conversation_search_text($2::jsonb)
+                WHERE chat_id = $1 AND archived
+                """,
+                [(row["chat_id"], payload) for row, payload in zip(rows, payloads)]
+            )
+        logger.debug({"message": "Indexed archived conversations for search", "count": len(rows)})
+        return len(rows)
+
+    async def archive_idle(self) -> int:
+        """Archive one batch of idle conversations.
+        
+        Returns:
+            The number of conversations archived
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    DELETE FROM conversation_archive a USING conversations c
+                    WHERE a.chat_id = c.chat_id AND NOT c.archived
+                """)
+                rows = await conn.fetch(
+                    """
+                    SELECT chat_id, messages::text AS messages FROM conversations
+                    WHERE NOT archived
+                      AND GREATEST(updated_at, restored_at) < CURRENT_TIMESTAMP - make_interval(secs => $1)
+                    ORDER BY updated_at
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    self.idle_seconds, self.batch_size
+                )
+                rows = [row for row in rows if row["chat_id"] not in self.storage._pending_saves]
+                if not rows:
+                    return 0
+
+                started = time.perf_counter()
+                payloads = [row["messages"].encode("utf-8") for row in rows]
+                blobs = await asyncio.to_thread(lambda: [compress(payload, self.level) for payload in payloads])
+                await conn.executemany(
+                    """
+                    INSERT INTO conversation_archive (chat_id, data, original_bytes, compressed_bytes)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (chat_id) DO UPDATE SET
+                        data = EXCLUDED.data,
+                        original_bytes = EXCLUDED.original_bytes,
+                        compressed_bytes = EXCLUDED.compressed_bytes,
+                        archived_at = CURRENT_TIMESTAMP
+                    """,
+                    [
+                        (row["chat_id"], blob, len(payload), len(blob))
+                        for row, payload, blob in zip(rows, payloads, blobs)
+                    ]
+                )
+                chat_ids = [row["chat_id"] for row in rows]
+                await conn.execute(
+                    "UPDATE conversations SET messages = '[]'::jsonb, archived = TRUE WHERE chat_id = ANY($1::varchar[])",
+                    chat_ids
+                )
+                for chat_id in chat_ids:
+                    await self.storage._notify_change(conn, chat_id)
+            elapsed = (time.perf_counter() - started) * 1000
+
+        for chat_id in chat_ids:
+            self.storage._invalidate_cache(chat_id)
+        self.archived += len(rows)
+        self.original_bytes += sum(len(payload) for payload in payloads)
+        self.compressed_bytes += sum(len(blob) for blob in blobs)
+        self._archive_latencies.append(elapsed / len(rows))
+        logger.debug({
+            "message": "Archived idle conversations",
+            "count": len(rows),
+            "original_bytes": sum(len(payload) for payload in payloads),
+            "compressed_bytes": sum(len(blob) for blob in blobs),
+            "elapsed_ms": round(elapsed, 2)
+        })
+        return len(rows)
+
+    async def restore(self, conn: asyncpg.Connection, chat_id: str) -> Optional[str]:
+        """Move an archived conversation back into the `conversations` table.
+        
+        Args:
+            conn: Connection to restore on; must not be inside a transaction
+            chat_id: Chat identifier
+            
+        Returns:
+            The restored messages as JSON text, or None if the chat no longer exists
+        """
+        started = time.perf_counter()
+        try:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    """
+                    SELECT c.archived, c.messages::text AS messages, a.data
+                    FROM conversations c LEFT JOIN conversation_archive a ON a.chat_id = c.chat_id
+                    WHERE c.chat_id = $1
+                    FOR UPDATE OF c
+                    """,
+                    chat_id
+                )
+                if row is None:
+                    return None
+                if not row["archived"]:
+                    # Restored by another request while we waited for the lock.
+                    return row["messages"]
+                if row["data"] is None:
+                    raise RuntimeError(f"Conversation {chat_id} is marked archived but has no archived data")
+
+                messages = (await asyncio.to_thread(decompress, row["data"])).decode("utf-8")
+                await conn.execute(
+                    """
+                    UPDATE conversations SET messages = $2::jsonb, archived = FALSE, restored_at = CURRENT_TIMESTAMP
+                    WHERE chat_id = $1
+                    """,
+                    chat_id, messages
+                )
+                await conn.execute("DELETE FROM conversation_archive WHERE chat_id = $1", chat_id)
+        except Exception:
+            self.restore_errors += 1
+            raise
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.restored += 1
+        self._restore_latencies.append(elapsed)
+        logger.debug({"message": "Restored archived conversation", "chat_id": chat_id, "elapsed_ms": round(elapsed, 2)})
+        return messages
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Return this worker's archive and restore counters plus the archive table totals."""
+        async with self.pool.acquire() as conn:
+            totals = await conn.fetchrow("""
+                SELECT count(*) AS conversations,
+                       coalesce(sum(original_bytes), 0) AS original_bytes,
+                       coalesce(sum(compressed_bytes), 0) AS compressed_bytes
+                FROM conversation_archive a JOIN conversations c ON c.chat_id = a.chat_id
+                WHERE c.archived
+            """)
+        return {
+            "enabled": ARCHIVE_ENABLED,
+            "idle_seconds": self.idle_seconds,
+            "archived_conversations": totals["conversations"],
+            "archived_original_bytes": totals["original_bytes"],
+            "archived_compressed_bytes": totals["compressed_bytes"],
+            "archived": self.archived,
+            "restored": self.restored,
+            "archive_errors": self.archive_errors,
+            "restore_errors": self.restore_errors,
+            "compression_ratio": round(self.original_bytes / self.compressed_bytes, 2) if self.compressed_bytes else 0,
+            "archive_latency": summarize_latencies(list(self._archive_latencies)),
+            "restore_latency": summarize_latencies(list(self._restore_latencies))
+        }
@@ -0,0 +1,482 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Loading uploaded files into documents.
+
+Files are routed through a tiered parser registry keyed by MIME type, which
+is detected from magic bytes and the file extension. The cheapest adequate
+parser runs first: plain text is read directly, PDFs with a usable text layer
+are extracted with pypdf (or pdfminer), and Unstructured only handles scanned
+PDFs and complex formats. A raw text read is the last resort.
+
+Large PDFs are split into page ranges that are parsed in parallel worker
+processes and reassembled in page order, each document carrying its
+`page_number`. Given a `ParserPool`, every parser runs in a worker process
+that is killed if it exceeds its timeout, so a hung or crashing parser never
+runs in the serving process.
+"""
+
+import mimetypes
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from logger import logger
+from parser_pool import ParserPool
+
+
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", min(8, os.cpu_count() or 1)))
+PDF_PAGES_PER_RANGE = int(os.getenv("PDF_PAGES_PER_RANGE", 16))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 32))
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", 30))
+PARSE_FILE_TIMEOUT = float(os.getenv("PARSE_FILE_TIMEOUT", 600))
+# A PDF's text layer is used when this fraction of pages has at least PDF_TEXT_MIN_CHARS characters.
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", 64))
+PDF_TEXT_MIN_COVERAGE = float(os.getenv("PDF_TEXT_MIN_COVERAGE", 0.9))
+# "fast" tries the cheap parsers first; "unstructured" always starts with Unstructured.
+DOCUMENT_PARSER_MODE = os.getenv("DOCUMENT_PARSER_MODE", "fast").lower()
+
+TEXT_MIME_TYPES = {
+    "application/json", "application/xml", "application/x-yaml", "application/yaml",
+    "application/javascript", "application/x-sh", "application/sql", "application/toml"
+}
+OFFICE_ZIP_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".odt": "application/vnd.oasis.opendocument.text",
+    ".epub": "application/epub+zip",
+}
+MAGIC_NUMBERS = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"{\\rtf", "application/rtf"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+]
+
+
+@dataclass
+class ParsedFile:
+    """Documents parsed from a file, with the parser that produced them."""
+    documents: List[Document]
+    parser: str
+    mime_type: str
+    elapsed_s: float
+
+
+def clean_metadata(docs: List[Document], file_path: str, source_name: str) -> List[Document]:
+    """Replace document metadata with Milvus-compatible string values and the file's source."""
+    for doc in docs:
+        cleaned_metadata = {
+            "source": source_name,
+            "file_path": file_path,
+            "filename": os.path.basename(file_path),
+        }
+        for key, value in (doc.metadata or {}).items():
+            if key not in ["source", "file_path", "filename", "file_directory"] and value is not None:
+                cleaned_metadata[key] = str(value)
+        doc.metadata = cleaned_metadata
+    return docs
+
+
+def detect_mime_type(file_path: str) -> str:
+    """Detect a file's MIME type from its leading bytes, falling back to the extension."""
+    with open(file_path, "rb") as f:
+        head = f.read(4096)
+    ext = os.path.splitext(file_path)[1].lower()
+
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            if mime_type == "application/x-ole-storage":
+                return mimetypes.guess_type(file_path)[0] or "application/msword"
+            return mime_type
+    if head.startswith(b"PK\x03\x04"):
+        return OFFICE_ZIP_TYPES.get(ext, "application/zip")
+
+    sniff = head.lstrip().lower()
+    if sniff.startswith((b"<!doctype html", b"<html")):
+        return "text/html"
+
+    guessed = mimetypes.guess_type(file_path)[0]
+    if guessed and not guessed.startswith("text/") and guessed not in TEXT_MIME_TYPES:
+        return guessed
+    if _looks_like_text(head):
+        return guessed or "text/plain"
+    return guessed or "application/octet-stream"
+
+
+def _looks_like_text(head: bytes) -> bool:
+    if not head:
+        return True
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return True
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        # The sample may end in the middle of a multi-byte character.
+        return e.start >= len(head) - 3
+
+
+def _fallback_document(file_path: str, text: str) -> Document:
+    return Document(page_content=text or f"Document: {os.path.basename(file_path)}")
+
+
+def read_text_file(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16", errors="replace")
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def parse_text(file_path: str, source_name: str) -> Optional[List[Document]]:
+    """Read a text file directly."""
+    text = read_text_file(file_path)
+    if not text.strip():
+        return None
+    return clean_metadata([Document(page_content=text)], file_path, source_name)
+
+
+def parse_unstructured(file_path: str, source_name: str, **unstructured_kwargs) -> List[Document]:
+    """Parse a file with Unstructured; raises if Unstructured cannot handle it."""
+    from langchain_unstructured import UnstructuredLoader
+    docs = UnstructuredLoader(file_path, **unstructured_kwargs).load()
+    logger.info(f"Successfully loaded {len(docs)} documents from {file_path}")
+    return clean_metadata(docs, file_path, source_name)
+
+
+def parse_raw(file_path: str, source_name: str) -> Optional[List[Document]]:
+    """Last resort: read whatever text the file contains, or a placeholder document for binary files."""
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(4096)
+        file_text = read_text_file(file_path) if _looks_like_text(head) else ""
+    except Exception as read_error:
+        logger.info(f"Fallback read failed: {read_error}")
+        file_text = ""
+    if not file_text.strip():
+        logger.info("Creating a simple document as fallback (no text extracted)")
+        file_text = ""
+    return clean_metadata([_fallback_document(file_path, file_text)], file_path, source_name)
+
+
+def _run_in_pool(executor: Optional[ParserPool], fn: Callable, *args, timeout: float = PARSE_FILE_TIMEOUT):
+    """Run `fn(*args)` in the parser pool, or in the calling process without one."""
+    if executor is None:
+        return fn(*args)
+    return executor.run(fn, *args, timeout=timeout)
+
+
+def _pooled(parser: Callable[[str, str], Optional[List[Document]]]) -> Callable[..., Optional[List[Document]]]:
+    """Adapt a whole-file parser into a tier that runs in the parser pool when one is given."""
+    def tier(file_path: str, source_name: str, executor: Optional[ParserPool] = None) -> Optional[List[Document]]:
+        return _run_in_pool(executor, parser, file_path, source_name)
+    tier.__name__ = parser.__name__
+    return tier
+
+
+def count_pdf_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: Optional[int]) -> List[Document]:
+    """Extract the text layer of pages [start, end), one document per page.
+    
+    Uses pypdf, or pdfminer if pypdf cannot read the file.
+    """
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(file_path)
+    except Exception as e:
+        logger.info(f"pypdf could not open {file_path}, using pdfminer: {e}")
+        return _extract_pdf_pages_pdfminer(file_path, start, end)
+
+    end = len(reader.pages) if end is None else min(end, len(reader.pages))
+    docs = []
+    for index in range(start, end):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as per_page_err:
+            logger.info(f"Warning: failed to extract page {index + 1}: {per_page_err}")
+            text = ""
+        docs.append(Document(page_content=text, metadata={"page_number": index + 1}))
+    return docs
+
+
+def _extract_pdf_pages_pdfminer(file_path: str, start: int, end: Optional[int]) -> List[Document]:
+    """pdfminer counterpart of `extract_pdf_pages`; the file is laid out in a single pass."""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    page_numbers = None if end is None else range(start, end)
+    docs = []
+    for index, layout in enumerate(extract_pages(file_path, page_numbers=page_numbers)):
+        if end is not None:
+            index += start
+        elif index < start:
+            continue
+        text = "".join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+        docs.append(Document(page_content=text, metadata={"page_number": index + 1}))
+    return docs
+
+
+def has_text_layer(pages: List[Document]) -> bool:
+    """Whether enough pages carry extractable text to skip layout/OCR parsing."""
+    if not pages:
+        return False
+    with_text = sum(1 for page in pages if len(page.page_content.strip()) >= PDF_TEXT_MIN_CHARS)
+    return with_text / len(pages) >= PDF_TEXT_MIN_COVERAGE
+
+
+def load_pdf_page_range(file_path: str, source_name: str, start: int, end: int) -> List[Document]:
+    """Parse pages [start, end) of a PDF with Unstructured; runs in a worker process.
+    
+    The pages are copied into a temporary PDF so Unstructured only parses the
+    range; page numbers are offset back to the original document.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    fd, range_path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        reader = PdfReader(file_path)
+        writer = PdfWriter()
+        for index in range(start, end):
+            writer.add_page(reader.pages[index])
+        with open(range_path, "wb") as f:
+            writer.write(f)
+
+        try:
+            docs = parse_unstructured(range_path, source_name, starting_page_number=start + 1)
+        except Exception as e:
+            logger.info(f"Unstructured failed for pages {start + 1}-{end} of {file_path}, using pypdf: {e}")
+            docs = [doc for doc in extract_pdf_pages(file_path, start, end) if doc.page_content.strip()]
+    finally:
+        os.remove(range_path)
+
+    return clean_metadata(docs, file_path, source_name)
+
+
+def pdf_page_ranges(page_count: int, pages_per_range: int = PDF_PAGES_PER_RANGE) -> List[Tuple[int, int]]:
+    pages_per_range = max(1, pages_per_range)
+    return [(start, min(start + pages_per_range, page_count)) for start in range(0, page_count, pages_per_range)]
+
+
+def _run_page_ranges(
+    file_path: str,
+    executor: ParserPool,
+    range_fn: Callable[..., List[Document]],
+    range_args: tuple,
+    page_count: int,
+    pages_per_range: int,
+    page_timeout: float
+) -> Tuple[List[Document], int]:
+    """Run `range_fn` over page ranges on `executor`, falling back to text extraction per range.
+    
+    A range running longer than `page_timeout` seconds per page has its worker
+    process killed, so a hung parser cannot hold a pool slot.
+    
+    Returns:
+        Documents in page order and the number of ranges that fell back
+    """
+    ranges = pdf_page_ranges(page_count, pages_per_range)
+    futures = [
+        executor.submit(range_fn, *range_args, start, end, timeout=page_timeout * (end - start))
+        for start, end in ranges
+    ]
+
+    documents: List[Document] = []
+    fallback_ranges = 0
+    for (start, end), future in zip(ranges, futures):
+        try:
+            documents.extend(future.result())
+        except Exception as e:
+            fallback_ranges += 1
+            logger.warning({
+                "message": "PDF page range failed, using text-layer extraction",
+                "file_path": file_path,
+                "pages": f"{start + 1}-{end}",
+                "error": str(e) or e.__class__.__name__
+            })
+            documents.extend(executor.run(extract_pdf_pages, file_path, start, end, timeout=page_timeout * (end - start)))
+    return documents, fallback_ranges
+
+
+def parse_pdf_text_layer(
+    file_path: str,
+    source_name: str,
+    executor: Optional[ParserPool] = None,
+    pages_per_range: int = PDF_PAGES_PER_RANGE,
+    min_pages: int = PDF_PARALLEL_MIN_PAGES,
+    page_timeout: float = PDF_PAGE_TIMEOUT
+) -> Optional[List[Document]]:
+    """Extract a PDF's text layer page by page.
+    
+    Returns:
+        One document per non-empty page, or None if the PDF has no usable text layer
+        (e.g. scanned pages), so the next tier can run
+    """
+    page_count = _run_in_pool(executor, count_pdf_pages, file_path)
+    if executor is not None and page_count >= min_pages:
+        pages, _ = _run_page_ranges(
+            file_path, executor, extract_pdf_pages, (file_path,), page_count, pages_per_range, page_timeout
+        )
+    else:
+        pages = _run_in_pool(executor, extract_pdf_pages, file_path, 0, None)
+
+    if not has_text_layer(pages):
+        logger.debug({"message": "PDF has no usable text layer", "file_path": file_path, "page_count": page_count})
+        return None
+    return clean_metadata([page for page in pages if page.page_content.strip()], file_path, source_name)
+
+
+def load_pdf_documents(
+    file_path: str,
+    source_name: str,
+    executor: Optional[ParserPool] = None,
+    pages_per_range: int = PDF_PAGES_PER_RANGE,
+    min_pages: int = PDF_PARALLEL_MIN_PAGES,
+    page_timeout: float = PDF_PAGE_TIMEOUT
+) -> Optional[List[Document]]:
+    """Parse a PDF with Unstructured in parallel page ranges and reassemble them in page order.
+    
+    PDFs shorter than `min_pages`, or without an executor, are parsed whole by a single
+    worker. A range that fails or exceeds `page_timeout` seconds per page falls back to
+    pypdf text extraction; a timed-out worker process is killed and replaced.
+    
+    Args:
+        file_path: Path of the PDF
+        source_name: Source name recorded in each document's metadata
+        executor: Process pool the ranges run on
+        pages_per_range: Pages parsed per task
+        min_pages: Minimum page count for splitting into ranges
+        page_timeout: Seconds allowed per page of a range
+        
+    Returns:
+        Documents ordered by page
+    """
+    try:
+        page_count = _run_in_pool(executor, count_pdf_pages, file_path)
+    except Exception as e:
+        logger.info(f"Could not read PDF page count for {file_path}, parsing whole file: {e}")
+        page_count = 0
+    if executor is None or page_count < min_pages:
+        return _run_in_pool(executor, parse_unstructured, file_path, source_name)
+
+    start_time = time.time()
+    documents, fallback_ranges = _run_page_ranges(
+        file_path, executor, load_pdf_page_range, (file_path, source_name), page_count, pages_per_range, page_timeout
+    )
+    documents = clean_metadata([doc for doc in documents if doc.page_content.strip()], file_path, source_name)
+
+    logger.debug({
+        "message": "Parsed PDF in page ranges",
+        "file_path": file_path,
+        "page_count": page_count,
+        "fallback_ranges": fallback_ranges,
+        "document_count": len(documents),
+        "elapsed_s": round(time.time() - start_time, 3)
+    })
+    return documents or None
+
+
+# Parser tiers, cheapest first. A parser returns None (or raises) when it is not adequate
+# for the file, and the next tier runs. `raw` always runs last.
+PARSERS: Dict[str, Callable[..., Optional[List[Document]]]] = {
+    "text": _pooled(parse_text),
+    "pdf_text": parse_pdf_text_layer,
+    "unstructured_pdf": load_pdf_documents,
+    "unstructured": _pooled(parse_unstructured),
+    "raw": _pooled(parse_raw),
+}
+
+# Ordered (MIME type or prefix, parser tiers) rules; the first match wins.
+PARSER_REGISTRY: List[Tuple[str, List[str]]] = [
+    ("application/pdf", ["pdf_text", "unstructured_pdf"]),
+    ("text/html", ["unstructured", "text"]),
+    ("text/", ["text"]),
+    *[(mime_type, ["text"]) for mime_type in sorted(TEXT_MIME_TYPES)],
+    ("", ["unstructured"]),
+]
+
+
+def parser_chain(mime_type: str, mode: str = DOCUMENT_PARSER_MODE) -> List[str]:
+    """Return the parser tiers to try, in order, for a MIME type."""
+    for prefix, parsers in PARSER_REGISTRY:
+        if mime_type.startswith(prefix):
+            chain = list(parsers)
+            break
+    if mode == "unstructured":
+        chain = ["unstructured_pdf", "pdf_text"] if mime_type == "application/pdf" else ["unstructured"]
+    return chain + ["raw"]
+
+
+def parse_file(file_path: str, source_name: str, executor: Optional[ParserPool] = None) -> ParsedFile:
+    """Parse a file with the cheapest adequate parser for its format.
+    
+    Args:
+        file_path: Path of the file to parse
+        source_name: Source name recorded in each document's metadata
+        executor: Optional parser pool; every parser then runs in a worker process
+            (large PDFs in parallel page ranges) and is killed if it exceeds its
+            timeout. Without it every parser runs in the calling process
+            
+    Returns:
+        The documents along with the parser used, the detected MIME type and the parse time
+    """
+    start_time = time.time()
+    mime_type = detect_mime_type(file_path)
+    docs: List[Document] = []
+    for parser in parser_chain(mime_type):
+        try:
+            docs = PARSERS[parser](file_path, source_name, executor)
+        except Exception as e:
+            logger.info({
+                "message": "Parser failed, trying next tier",
+                "file_path": file_path,
+                "parser": parser,
+                "error": str(e)
+            })
+            continue
+        if docs:
+            break
+
+    elapsed_s = time.time() - start_time
+    logger.debug({
+        "message": "Parsed file",
+        "file_path": file_path,
+        "mime_type": mime_type,
+        "parser": parser,
+        "document_count": len(docs),
+        "elapsed_s": round(elapsed_s, 3)
+    })
+    return ParsedFile(documents=docs, parser=parser, mime_type=mime_type, elapsed_s=elapsed_s)
+
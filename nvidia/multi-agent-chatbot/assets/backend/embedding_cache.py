@@ -0,0 +1,388 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Persistent content-hash embedding cache.
+
+Embeddings are stored in SQLite keyed by (model, sha256(text)) as float16 blobs.
+The database runs in WAL mode so the backend and the RAG MCP server can share
+one file. The cache is bounded by its size in bytes and evicts least recently
+used rows once the bound is exceeded. Access times and hit/miss counters are
+buffered in memory and written in batches, so reads do not take the database
+write lock.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embeddings import CustomEmbeddings
+from ingestion_manifest import hash_text
+from logger import logger
+
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "indices", "embedding_cache.sqlite3")
+)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+# Access times and counters are flushed after this many seconds or buffered lookups.
+EMBEDDING_CACHE_FLUSH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_FLUSH_INTERVAL", 30))
+EMBEDDING_CACHE_FLUSH_ENTRIES = int(os.getenv("EMBEDDING_CACHE_FLUSH_ENTRIES", 4096))
+
+SQLITE_MAX_VARIABLES = 900
+# Approximate per-row storage besides the vector: key, model name and b-tree overhead.
+ROW_OVERHEAD_BYTES = 64
+
+
+def text_key(text: str) -> bytes:
+    """Cache key for `text`: the raw sha256 digest used as the primary key."""
+    return bytes.fromhex(hash_text(text))
+
+
+def to_blob(vector: List[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float16).tobytes()
+
+
+def from_blob(blob: bytes) -> List[float]:
+    return np.frombuffer(blob, dtype=np.float16).astype(np.float32).tolist()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache with LRU eviction and hit/miss counters."""
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+        flush_interval: float = EMBEDDING_CACHE_FLUSH_INTERVAL,
+        flush_entries: int = EMBEDDING_CACHE_FLUSH_ENTRIES
+    ):
+        """Initialize the cache and create its tables.
+
+        Args:
+            path: SQLite database file shared by every process using the cache
+            max_bytes: Maximum size of the cached vectors, including per-row overhead, before eviction
+            flush_interval: Seconds between writes of buffered access times and counters
+            flush_entries: Number of buffered access times that triggers an early write
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_entries = max(1, flush_entries)
+        self._local = threading.local()
+        self._bytes_since_eviction = 0
+        self._eviction_lock = threading.Lock()
+
+        self._pending_lock = threading.Lock()
+        self._pending_access: Dict[Tuple[str, bytes], float] = {}
+        self._pending_hits = 0
+        self._pending_misses = 0
+        self._last_flush = time.monotonic()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._create_tables()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self) -> None:
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash BLOB NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0,
+                evictions INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO cache_stats (id) VALUES (1)")
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[bytes, List[float]]:
+        """Look up cached vectors for the given texts.
+
+        Only reads the database; the access times of hits are buffered and
+        written by `flush`.
+
+        Returns:
+            Mapping of text key to vector for every text found in the cache
+        """
+        keys = list({text_key(text) for text in texts})
+        found: Dict[bytes, List[float]] = {}
+        conn = self._conn()
+
+        for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            chunk = keys[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *chunk]
+            ).fetchall()
+            for key, vector in rows:
+                found[key] = from_blob(vector)
+
+        hits, misses = len(found), len(keys) - len(found)
+        now = time.time()
+        with self._pending_lock:
+            self._hits += hits
+            self._misses += misses
+            self._pending_hits += hits
+            self._pending_misses += misses
+            for key in found:
+                self._pending_access[(model, key)] = now
+            due = (
+                len(self._pending_access) >= self.flush_entries
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+        return found
+
+    def flush(self) -> None:
+        """Write buffered access times and hit/miss counters in one transaction."""
+        with self._pending_lock:
+            access, self._pending_access = self._pending_access, {}
+            hits, misses = self._pending_hits, self._pending_misses
+            self._pending_hits = self._pending_misses = 0
+            self._last_flush = time.monotonic()
+        if not access and not hits and not misses:
+            return
+
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "UPDATE embeddings SET last_access = MAX(last_access, ?) WHERE model = ? AND text_hash = ?",
+                    [(accessed, model, key) for (model, key), accessed in access.items()]
+                )
+                conn.execute(
+                    "UPDATE cache_stats SET hits = hits + ?, misses = misses + ? WHERE id = 1",
+                    (hits, misses)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # Access times only order eviction and counters are informational,
+            # so a failed write is logged and dropped rather than retried.
+            logger.warning({
+                "message": "Failed to write embedding cache access times",
+                "entries": len(access),
+                "error": str(e)
+            })
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> List[List[float]]:
+        """Store vectors for the given texts and evict old entries if over capacity.
+
+        Returns:
+            The vectors at the float16 precision they are stored and served at
+        """
+        if not texts:
+            return []
+        now = time.time()
+        rows = []
+        stored = []
+        for text, vector in zip(texts, vectors):
+            blob = to_blob(vector)
+            rows.append((model, text_key(text), len(vector), blob, now))
+            stored.append(from_blob(blob))
+
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._bytes_since_eviction += sum(len(row[3]) + ROW_OVERHEAD_BYTES for row in rows)
+        if self._bytes_since_eviction >= max(1, self.max_bytes // 100):
+            self.evict()
+        return stored
+
+    def _size_bytes(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        """Return the entry count and approximate stored bytes."""
+        count, vector_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        return count, vector_bytes + count * ROW_OVERHEAD_BYTES
+
+    def evict(self) -> int:
+        """Evict least recently used entries down to 90% of the byte bound."""
+        self.flush()
+        with self._eviction_lock:
+            self._bytes_since_eviction = 0
+            conn = self._conn()
+            count, size = self._size_bytes(conn)
+            if size <= self.max_bytes:
+                return 0
+
+            excess = size - int(self.max_bytes * 0.9)
+            # Delete the oldest rows until their cumulative size covers the excess.
+            removed = conn.execute("""
+                DELETE FROM embeddings WHERE (model, text_hash) IN (
+                    SELECT model, text_hash FROM (
+                        SELECT model, text_hash, LENGTH(vector) + ? AS row_bytes,
+                               SUM(LENGTH(vector) + ?) OVER (
+                                   ORDER BY last_access ASC, text_hash ASC ROWS UNBOUNDED PRECEDING
+                               ) AS freed
+                        FROM embeddings
+                    ) WHERE freed - row_bytes < ?
+                )
+            """, (ROW_OVERHEAD_BYTES, ROW_OVERHEAD_BYTES, excess)).rowcount
+            conn.execute("UPDATE cache_stats SET evictions = evictions + ? WHERE id = 1", (removed,))
+            self._evictions += removed
+            logger.debug({
+                "message": "Evicted embedding cache entries",
+                "evicted": removed,
+                "remaining": count - removed
+            })
+            return removed
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache statistics for this process and across all processes sharing the file."""
+        self.flush()
+        conn = self._conn()
+        entries, size = self._size_bytes(conn)
+        hits, misses, evictions = conn.execute(
+            "SELECT hits, misses, evictions FROM cache_stats WHERE id = 1"
+        ).fetchone()
+        total = hits + misses
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate_percent": round(hits / total * 100, 2) if total else 0,
+            "process_hits": self._hits,
+            "process_misses": self._misses,
+            "process_evictions": self._evictions
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from an `EmbeddingCache`.
+
+    Only texts missing from the cache are sent to the wrapped embeddings, and
+    identical texts within one call are embedded once.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", embeddings.__class__.__name__)
+
+    def __getattr__(self, name):
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def _lookup(self, texts: List[str]):
+        cached = self.cache.get_many(self.model, texts)
+        missing = list(dict.fromkeys(
+            text for text in texts if text_key(text) not in cached
+        ))
+        return cached, missing
+
+    def _store(self, cached: Dict[bytes, List[float]], missing: List[str], vectors: List[List[float]]) -> None:
+        stored = self.cache.put_many(self.model, missing, vectors)
+        for text, vector in zip(missing, stored):
+            cached[text_key(text)] = vector
+
+    def _assemble(self, texts: List[str], cached: Dict[bytes, List[float]]) -> List[List[float]]:
+        return [cached[text_key(text)] for text in texts]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        cached, missing = self._lookup(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(missing)
+            self._store(cached, missing, vectors)
+
+        logger.debug({
+            "message": "Embedding cache lookup",
+            "text_count": len(texts),
+            "embedded_count": len(missing)
+        })
+        return self._assemble(texts, cached)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        cached, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(missing)
+            await asyncio.to_thread(self._store, cached, missing, vectors)
+        return self._assemble(texts, cached)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def create_default_embeddings(model: str = "qwen3-embedding-custom") -> Embeddings:
+    """Create the default embedding client, wrapped with the shared cache when enabled."""
+    embeddings = CustomEmbeddings(model=model)
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    try:
+        return CachedEmbeddings(embeddings, EmbeddingCache())
+    except Exception as e:
+        logger.warning({
+            "message": "Embedding cache unavailable, continuing without it",
+            "path": EMBEDDING_CACHE_PATH,
+            "error": str(e)
+        })
+        return embeddings
@@ -0,0 +1,279 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Batched, pooled client for the OpenAI-compatible embedding server.
+
+Texts are grouped into batched `input` arrays bounded by a byte budget, and
+batches are sent with bounded concurrency over a shared connection pool.
+Transient failures (connection errors, timeouts, 429 and 5xx responses) are
+retried with exponential backoff. An async variant is provided for the query
+path so retrieval does not block the event loop.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import httpx
+import requests
+from langchain_core.embeddings import Embeddings
+from requests.adapters import HTTPAdapter
+
+from logger import logger
+
+
+EMBEDDING_HOST = os.getenv("EMBEDDING_HOST", "http://qwen3-embedding:8000")
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", 64))
+EMBEDDING_MAX_BATCH_BYTES = int(os.getenv("EMBEDDING_MAX_BATCH_BYTES", 256 * 1024))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 4))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", 120))
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class EmbeddingServerError(RuntimeError):
+    """Raised when the embedding server returns a non-retryable error or retries are exhausted."""
+
+
+class CustomEmbeddings(Embeddings):
+    """Wraps qwen3 embedding model to match OpenAI format"""
+
+    def __init__(
+        self,
+        model: str = "Qwen3-Embedding-4B-Q8_0.gguf",
+        host: str = EMBEDDING_HOST,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        max_batch_bytes: int = EMBEDDING_MAX_BATCH_BYTES,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        timeout: float = EMBEDDING_TIMEOUT,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+    ):
+        """Initialize the embedding client.
+
+        Args:
+            model: Model name sent with each request
+            host: Base URL of the OpenAI-compatible embedding server
+            max_batch_size: Maximum number of texts per request
+            max_batch_bytes: Maximum UTF-8 payload bytes per request
+            max_concurrency: Maximum number of requests in flight
+            max_retries: Retries per batch for transient failures
+            timeout: Per-request timeout in seconds
+            backoff_base: Initial backoff delay in seconds
+            backoff_max: Upper bound on a single backoff delay in seconds
+        """
+        self.model = model
+        self.url = f"{host}/v1/embeddings"
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_bytes = max(1, max_batch_bytes)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Content-Type": "application/json"})
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __call__(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts)
+
+    def _batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """Split texts into contiguous [start, end) ranges that fit the batch budget."""
+        ranges = []
+        start, batch_bytes = 0, 0
+        for i, text in enumerate(texts):
+            text_bytes = len(text.encode("utf-8"))
+            batch_len = i - start
+            if batch_len and (batch_len >= self.max_batch_size or batch_bytes + text_bytes > self.max_batch_bytes):
+                ranges.append((start, i))
+                start, batch_bytes = i, 0
+            batch_bytes += text_bytes
+        if start < len(texts):
+            ranges.append((start, len(texts)))
+        return ranges
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def _parse_response(self, data: dict, expected: int) -> List[List[float]]:
+        items = data.get("data") or []
+        if len(items) != expected:
+            raise EmbeddingServerError(f"Embedding server returned {len(items)} vectors for {expected} inputs")
+        items = sorted(items, key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in items]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix="embeddings"
+                )
+            return self._executor
+
+    def _post_batch(self, batch: List[str]) -> List[List[float]]:
+        """Send one batched request, retrying transient failures with backoff."""
+        payload = {"input": batch, "model": self.model}
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                    raise requests.HTTPError(f"retryable status {response.status_code}", response=response)
+                response.raise_for_status()
+                return self._parse_response(response.json(), len(batch))
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                retryable = status is None or status in RETRYABLE_STATUS_CODES
+                if not retryable or attempt >= self.max_retries:
+                    raise EmbeddingServerError(f"Embedding request failed: {e}") from e
+                delay = self._backoff(attempt)
+                logger.warning({
+                    "message": "Embedding request failed, retrying",
+                    "attempt": attempt + 1,
+                    "batch_size": len(batch),
+                    "delay": round(delay, 2),
+                    "error": str(e)
+                })
+                time.sleep(delay)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed a list of document texts. Required by Milvus library."""
+        if not texts:
+            return []
+
+        ranges = self._batches(texts)
+        if len(ranges) == 1:
+            return self._post_batch(texts)
+
+        start_time = time.time()
+        executor = self._get_executor()
+        futures = [executor.submit(self._post_batch, texts[start:end]) for start, end in ranges]
+
+        embeddings: List[List[float]] = []
+        for future in futures:
+            embeddings.extend(future.result())
+
+        logger.debug({
+            "message": "Embedded documents",
+            "text_count": len(texts),
+            "batch_count": len(ranges),
+            "elapsed_s": round(time.time() - start_time, 3)
+        })
+        return embeddings
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a single query text. Required by Milvus library."""
+        return self._post_batch([text])[0]
+
+    async def _get_async_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """Return an async client bound to the running event loop.
+
+        A client created on a different loop is closed once it is replaced.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            stale = self._async_client
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                headers={"Content-Type": "application/json"}
+            )
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_loop = loop
+            if stale is not None:
+                try:
+                    await stale.aclose()
+                except Exception as e:
+                    logger.debug({"message": "Error closing stale embedding client", "error": str(e)})
+        return self._async_client, self._async_semaphore
+
+    async def _apost_batch(self, batch: List[str]) -> List[List[float]]:
+        """Async counterpart of `_post_batch`."""
+        client, semaphore = await self._get_async_client()
+        payload = {"input": batch, "model": self.model}
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    response = await client.post(self.url, json=payload)
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                    raise httpx.HTTPStatusError(
+                        f"retryable status {response.status_code}",
+                        request=response.request,
+                        response=response
+                    )
+                response.raise_for_status()
+                return self._parse_response(response.json(), len(batch))
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                retryable = status is None or status in RETRYABLE_STATUS_CODES
+                if not retryable or attempt >= self.max_retries:
+                    raise EmbeddingServerError(f"Embedding request failed: {e}") from e
+                delay = self._backoff(attempt)
+                logger.warning({
+                    "message": "Async embedding request failed, retrying",
+                    "attempt": attempt + 1,
+                    "batch_size": len(batch),
+                    "delay": round(delay, 2),
+                    "error": str(e)
+                })
+                await asyncio.sleep(delay)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed document texts without blocking the event loop."""
+        if not texts:
+            return []
+        results = await asyncio.gather(*[
+            self._apost_batch(texts[start:end]) for start, end in self._batches(texts)
+        ])
+        return [embedding for batch in results for embedding in batch]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Embed a single query text without blocking the event loop."""
+        return (await self._apost_batch([text]))[0]
+
+    def close(self) -> None:
+        """Release pooled connections and worker threads."""
+        self._session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def aclose(self) -> None:
+        """Release pooled connections, including the async client."""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -0,0 +1,219 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Uploaded image handles and their pre-computed variants.
+
+An upload is stored once under a short content-derived handle together with
+two downscaled variants: "vlm" (longest side IMAGE_VLM_MAX_SIDE, JPEG or
+WebP) which is what the vision model receives, and "thumb" for the UI.
+Decoding and resizing are CPU-bound, so they run in a process pool.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from logger import logger
+
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 64_000_000))
+IMAGE_VLM_MAX_SIDE = int(os.getenv("IMAGE_VLM_MAX_SIDE", 1024))
+IMAGE_VLM_FORMAT = os.getenv("IMAGE_VLM_FORMAT", "jpeg").lower()
+IMAGE_VLM_QUALITY = int(os.getenv("IMAGE_VLM_QUALITY", 85))
+IMAGE_THUMB_MAX_SIDE = int(os.getenv("IMAGE_THUMB_MAX_SIDE", 256))
+
+VARIANTS = ("original", "vlm", "thumb")
+ENCODINGS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+# Formats the vision model accepts as-is when an upload is already small enough.
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+EXIF_ORIENTATION = 0x0112
+
+
+class ImageError(ValueError):
+    """Raised when an upload is not a decodable image or exceeds the limits."""
+
+
+@dataclass
+class ImageVariant:
+    """One stored rendition of an image."""
+    content_type: str
+    data: bytes
+    width: int
+    height: int
+
+
+def image_handle(data: bytes) -> str:
+    """Return a short, URL-safe handle derived from the image content."""
+    return base64.urlsafe_b64encode(hashlib.sha256(data).digest()[:12]).decode("ascii")
+
+
+def to_data_uri(variant: ImageVariant) -> str:
+    return f"data:{variant.content_type};base64,{base64.b64encode(variant.data).decode('ascii')}"
+
+
+def _encode(image, encoding: str, quality: int) -> bytes:
+    from PIL import Image
+
+    pil_format, _ = ENCODINGS[encoding]
+    has_alpha = "A" in image.getbands() or "transparency" in image.info
+    if pil_format == "JPEG" and has_alpha:
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, quality=quality, optimize=pil_format == "JPEG")
+    return buffer.getvalue()
+
+
+def _downscale(image, max_side: int):
+    image = image.copy()
+    image.thumbnail((max_side, max_side))
+    return image
+
+
+def downscale_for_vlm(
+    data: bytes,
+    max_side: int = IMAGE_VLM_MAX_SIDE,
+    encoding: str = IMAGE_VLM_FORMAT,
+    quality: int = IMAGE_VLM_QUALITY
+) -> ImageVariant:
+    """Fit an image within `max_side` pixels for the vision model.
+
+    EXIF orientation is applied, and images that are already small enough in
+    a format the model accepts are returned unchanged when re-encoding would
+    not make them smaller.
+
+    Raises:
+        ImageError: If the data is not a decodable image or has too many pixels
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            source_format = source.format
+            if source.width * source.height > IMAGE_MAX_PIXELS:
+                raise ImageError(f"Image has more than {IMAGE_MAX_PIXELS} pixels")
+            rotated = source.getexif().get(EXIF_ORIENTATION, 1) != 1
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except ImageError:
+        raise
+    except Exception as e:
+        raise ImageError(f"Not a valid image: {e}") from e
+
+    if max(image.size) <= max_side and source_format in PASSTHROUGH_FORMATS and not rotated:
+        encoded = _encode(image, encoding, quality)
+        if len(encoded) >= len(data):
+            return ImageVariant(PASSTHROUGH_FORMATS[source_format], data, image.width, image.height)
+        return ImageVariant(ENCODINGS[encoding][1], encoded, image.width, image.height)
+
+    resized = _downscale(image, max_side)
+    return ImageVariant(ENCODINGS[encoding][1], _encode(resized, encoding, quality), resized.width, resized.height)
+
+
+def render_variants(data: bytes) -> Dict[str, ImageVariant]:
+    """Decode an upload and render every stored variant. Runs in a worker process."""
+    from PIL import Image
+
+    vlm = downscale_for_vlm(data)
+    with Image.open(io.BytesIO(vlm.data)) as image:
+        image.load()
+        thumb = _downscale(image, IMAGE_THUMB_MAX_SIDE)
+    with Image.open(io.BytesIO(data)) as source:
+        original_type = Image.MIME.get(source.format, "application/octet-stream")
+        original_size = source.size
+    return {
+        "original": ImageVariant(original_type, data, *original_size),
+        "vlm": vlm,
+        "thumb": ImageVariant("image/webp", _encode(thumb, "webp", 80), thumb.width, thumb.height),
+    }
+
+
+class ImageProcessor:
+    """Renders image variants in a process pool and stores them under a handle."""
+
+    def __init__(self, storage, max_workers: int = IMAGE_WORKERS):
+        """Initialize the processor.
+
+        Args:
+            storage: PostgreSQLConversationStorage used to persist variants
+            max_workers: Number of worker processes decoding and resizing images
+        """
+        if IMAGE_VLM_FORMAT not in ENCODINGS:
+            raise ValueError(f"Unknown IMAGE_VLM_FORMAT {IMAGE_VLM_FORMAT!r}, expected one of {sorted(ENCODINGS)}")
+        self.storage = storage
+        self.max_workers = max(1, max_workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def store(self, data: bytes) -> Dict[str, object]:
+        """Store an upload and its variants, returning the handle and variant sizes.
+
+        Uploads with identical content share one handle and are rendered once.
+
+        Raises:
+            ImageError: If the upload is too large or not a decodable image
+        """
+        if len(data) > IMAGE_MAX_UPLOAD_BYTES:
+            raise ImageError(f"Image exceeds the limit of {IMAGE_MAX_UPLOAD_BYTES} bytes")
+
+        handle = image_handle(data)
+        variants = await self.storage.touch_image_variants(handle)
+        if not variants:
+            loop = asyncio.get_running_loop()
+            rendered = await loop.run_in_executor(self._get_pool(), render_variants, data)
+            await self.storage.store_image_variants(handle, rendered)
+            variants = {name: (variant.width, variant.height, len(variant.data)) for name, variant in rendered.items()}
+            logger.debug({
+                "message": "Stored image variants",
+                "image_id": handle,
+                "original_bytes": len(data),
+                "vlm_bytes": len(rendered["vlm"].data),
+                "vlm_size": [rendered["vlm"].width, rendered["vlm"].height]
+            })
+
+        return {
+            "image_id": handle,
+            "variants": {
+                name: {"width": width, "height": height, "bytes": size, "url": f"/images/{handle}/{name}"}
+                for name, (width, height, size) in variants.items()
+            }
+        }
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,757 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Staged document ingestion pipeline.
+
+Files move through four stages connected by bounded queues:
+
+    parse (process pool) -> chunk (thread) -> embed (batched) -> insert (bulk)
+
+Large PDFs are parsed as parallel page ranges on the same process pool.
+
+Each stage runs a fixed number of workers, so a large upload cannot starve the
+serving event loop and the queues apply backpressure between stages. Progress
+is tracked per job and per file.
+
+Ingestion is incremental: a file whose content hash matches the manifest entry
+for its source is skipped, and a changed file only embeds and inserts chunks
+whose hash is new, deleting the chunks that disappeared and refreshing the
+file-level metadata of the chunks it keeps. Uploads of the same source are
+serialized from the chunk diff through the insert; parsing runs unlocked.
+With a job store they are serialized across workers too, by a lease on the
+source in Postgres.
+
+With an `IngestionJobStore`, every job and file state change is persisted to
+Postgres and pushed to subscribers, and unfinished jobs left behind by a
+stopped worker are resumed.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from ingestion_jobs import UNFINISHED_JOB_STATES, IngestionJobStore
+from ingestion_manifest import hash_file, hash_text
+from logger import logger
+from document_loaders import PDF_PARSE_WORKERS, parse_file
+from parser_pool import ParserPool
+from vector_store import VectorStore
+
+
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+INGEST_CHUNK_WORKERS = int(os.getenv("INGEST_CHUNK_WORKERS", 2))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 2))
+INGEST_INSERT_BATCH_SIZE = int(os.getenv("INGEST_INSERT_BATCH_SIZE", 1000))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+# Finished jobs are kept in memory for this long, and at most this many of them.
+INGEST_JOB_RETENTION_SECONDS = float(os.getenv("INGEST_JOB_RETENTION_SECONDS", 3600))
+INGEST_MAX_FINISHED_JOBS = int(os.getenv("INGEST_MAX_FINISHED_JOBS", 256))
+# How often an upload retries the lease on a source that another worker is indexing.
+INGEST_SOURCE_LEASE_POLL_SECONDS = float(os.getenv("INGEST_SOURCE_LEASE_POLL_SECONDS", 1))
+
+TERMINAL_FILE_STATES = {"indexed", "unchanged", "failed"}
+FINISHING_JOB_STATES = {"flushing", "completed", "completed_with_errors", "failed"}
+
+
+@dataclass
+class FileProgress:
+    """Progress of a single file within an ingestion job."""
+    filename: str
+    file_path: str
+    state: str = "queued"
+    file_hash: Optional[str] = None
+    bytes: int = 0
+    parser: Optional[str] = None
+    parse_seconds: Optional[float] = None
+    chunks: int = 0
+    tokens: int = 0
+    max_chunk_tokens: int = 0
+    new_chunks: int = 0
+    deleted_chunks: int = 0
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "filename": self.filename,
+            "state": self.state,
+            "bytes": self.bytes,
+            "parser": self.parser,
+            "parse_seconds": self.parse_seconds,
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "max_chunk_tokens": self.max_chunk_tokens,
+            "new_chunks": self.new_chunks,
+            "deleted_chunks": self.deleted_chunks,
+            "error": self.error,
+            "elapsed_s": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None
+        }
+
+    def to_row(self) -> Dict[str, Any]:
+        """Return the fields persisted in the job table."""
+        return {
+            "file_path": self.file_path,
+            "filename": self.filename,
+            "state": self.state,
+            "file_hash": self.file_hash,
+            "bytes": self.bytes,
+            "parser": self.parser,
+            "parse_seconds": self.parse_seconds,
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "max_chunk_tokens": self.max_chunk_tokens,
+            "new_chunks": self.new_chunks,
+            "deleted_chunks": self.deleted_chunks,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "FileProgress":
+        return cls(**{key: value for key, value in row.items() if key in cls.__dataclass_fields__})
+
+
+@dataclass
+class IngestionJob:
+    """An ingestion request covering one or more files."""
+    task_id: str
+    files: Dict[str, FileProgress]
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "files": [progress.to_dict() for progress in self.files.values()]
+        }
+
+
+@dataclass
+class _WorkItem:
+    job: IngestionJob
+    progress: FileProgress
+    documents: List[Document] = field(default_factory=list)
+    vectors: List[List[float]] = field(default_factory=list)
+    chunk_hashes: List[str] = field(default_factory=list)
+    deleted_hashes: List[str] = field(default_factory=list)
+    kept_hashes: List[str] = field(default_factory=list)
+    replace_source: bool = False
+    source_lock: Optional[asyncio.Lock] = None
+    source_leased: bool = False
+
+
+class IngestionPipeline:
+    """Runs document ingestion off the serving event loop with bounded concurrency per stage."""
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        config_manager,
+        parse_workers: int = INGEST_PARSE_WORKERS,
+        chunk_workers: int = INGEST_CHUNK_WORKERS,
+        embed_workers: int = INGEST_EMBED_WORKERS,
+        insert_batch_size: int = INGEST_INSERT_BATCH_SIZE,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        job_store: Optional[IngestionJobStore] = None,
+        job_retention_seconds: float = INGEST_JOB_RETENTION_SECONDS,
+        max_finished_jobs: int = INGEST_MAX_FINISHED_JOBS
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            vector_store: VectorStore used for chunking, embedding and inserts
+            config_manager: ConfigManager updated with new sources as files are indexed
+            parse_workers: Number of files parsed concurrently (the process pool has at least PDF_PARSE_WORKERS processes)
+            chunk_workers: Number of concurrent chunking workers
+            embed_workers: Number of files embedded concurrently
+            insert_batch_size: Target row count for a bulk insert
+            queue_size: Capacity of each inter-stage queue
+            job_store: Optional persistent job table; without it jobs live only in memory
+            job_retention_seconds: How long a finished job stays in memory
+            max_finished_jobs: Maximum number of finished jobs kept in memory
+        """
+        self.vector_store = vector_store
+        self.config_manager = config_manager
+        self.parse_workers = max(1, parse_workers)
+        self.chunk_workers = max(1, chunk_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.insert_batch_size = max(1, insert_batch_size)
+        self.queue_size = queue_size
+        self.job_store = job_store
+        self.job_retention_seconds = job_retention_seconds
+        self.max_finished_jobs = max(0, max_finished_jobs)
+
+        self.jobs: Dict[str, IngestionJob] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._source_locks: Dict[str, asyncio.Lock] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._lock_waiters: set = set()
+        self._parse_q: Optional[asyncio.Queue] = None
+        self._chunk_q: Optional[asyncio.Queue] = None
+        self._embed_q: Optional[asyncio.Queue] = None
+        self._insert_q: Optional[asyncio.Queue] = None
+        self._process_pool: Optional[ParserPool] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Start the worker pool and stage workers."""
+        if self._workers:
+            return
+        self._parse_q = asyncio.Queue()
+        self._chunk_q = asyncio.Queue(maxsize=self.queue_size)
+        self._embed_q = asyncio.Queue(maxsize=self.queue_size)
+        self._insert_q = asyncio.Queue(maxsize=self.queue_size)
+        # Large PDFs fan out into page ranges, so the pool can be wider than the parse stage.
+        self._process_pool = ParserPool(max_workers=max(self.parse_workers, PDF_PARSE_WORKERS))
+
+        self._workers = (
+            [asyncio.create_task(self._parse_worker()) for _ in range(self.parse_workers)]
+            + [asyncio.create_task(self._chunk_worker()) for _ in range(self.chunk_workers)]
+            + [asyncio.create_task(self._embed_worker()) for _ in range(self.embed_workers)]
+            + [asyncio.create_task(self._insert_worker())]
+        )
+        if self.job_store is not None:
+            await self.job_store.init()
+            self._workers.append(asyncio.create_task(self._lease_worker()))
+        logger.debug({
+            "message": "Ingestion pipeline started",
+            "parse_workers": self.parse_workers,
+            "chunk_workers": self.chunk_workers,
+            "embed_workers": self.embed_workers,
+            "insert_batch_size": self.insert_batch_size
+        })
+
+    async def stop(self) -> None:
+        """Cancel stage workers and shut down the parser processes."""
+        tasks = self._workers + list(self._lock_waiters)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        if self._process_pool:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+    async def submit(self, task_id: str, file_paths: List[str], file_hashes: Optional[Dict[str, str]] = None) -> IngestionJob:
+        """Queue files that are already saved on disk for ingestion.
+        
+        Args:
+            task_id: Identifier used to report progress
+            file_paths: Paths of the saved files
+            file_hashes: Optional SHA-256 per path, computed while uploading; missing hashes are computed here
+        """
+        file_hashes = file_hashes or {}
+        job = IngestionJob(
+            task_id=task_id,
+            files={
+                path: FileProgress(
+                    filename=os.path.basename(path),
+                    file_path=path,
+                    file_hash=file_hashes.get(path),
+                    bytes=os.path.getsize(path)
+                )
+                for path in file_paths
+            }
+        )
+        if not job.files:
+            job.status = "completed"
+            job.finished_at = time.time()
+        self._prune_jobs()
+        self.jobs[task_id] = job
+        if self.job_store is not None:
+            try:
+                await self.job_store.create_job(task_id, job.status, [progress.to_row() for progress in job.files.values()])
+            except Exception as e:
+                logger.warning({
+                    "message": "Failed to persist ingestion job",
+                    "task_id": task_id,
+                    "error": str(e)
+                })
+
+        for progress in job.files.values():
+            await self._parse_q.put(_WorkItem(job=job, progress=progress))
+        return job
+
+    def _prune_jobs(self) -> None:
+        """Forget finished jobs that are too old or beyond the retention count.
+
+        With a job store their status can still be read from Postgres.
+        """
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at
+        )
+        cutoff = time.time() - self.job_retention_seconds
+        excess = len(finished) - self.max_finished_jobs
+        for index, job in enumerate(finished):
+            if index < excess or job.finished_at < cutoff:
+                del self.jobs[job.task_id]
+
+    async def get_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return job status and per-file progress, or None for unknown tasks.
+        
+        Jobs run by another worker, or finished before a restart, are read from the job store.
+        """
+        job = self.jobs.get(task_id)
+        if job is not None:
+            return job.to_dict()
+        if self.job_store is None:
+            return None
+        row = await self.job_store.get_job(task_id)
+        if row is None:
+            return None
+        return {
+            "status": row["status"],
+            "files": [FileProgress.from_row(file_row).to_dict() for file_row in row["files"]]
+        }
+
+    async def events(self, task_id: str, poll_interval: float = 1.0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield a status snapshot, then progress events until the job finishes.
+        
+        Jobs run by this worker push events as they happen; jobs run by another
+        worker are polled from the job store and yielded when they change.
+        """
+        job = self.jobs.get(task_id)
+        if job is None:
+            last = None
+            while True:
+                status = await self.get_status(task_id)
+                if status is None:
+                    return
+                # elapsed_s keeps growing while a file is in progress, so it is not a change.
+                key = (
+                    status["status"],
+                    [{k: v for k, v in file.items() if k != "elapsed_s"} for file in status["files"]]
+                )
+                if key != last:
+                    yield {"type": "snapshot", "task_id": task_id, **status}
+                    last = key
+                if status["status"] not in UNFINISHED_JOB_STATES:
+                    return
+                await asyncio.sleep(poll_interval)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, []).append(queue)
+        try:
+            yield {"type": "snapshot", "task_id": task_id, **job.to_dict()}
+            if job.status not in UNFINISHED_JOB_STATES:
+                return
+            while True:
+                event = await queue.get()
+                yield event
+                if event["type"] == "job" and event["status"] not in UNFINISHED_JOB_STATES:
+                    return
+        finally:
+            subscribers = self._subscribers.get(task_id, [])
+            if queue in subscribers:
+                subscribers.remove(queue)
+            if not subscribers:
+                self._subscribers.pop(task_id, None)
+
+    def _publish(self, job: IngestionJob, progress: Optional[FileProgress] = None) -> None:
+        event = {
+            "type": "file" if progress is not None else "job",
+            "task_id": job.task_id,
+            "status": job.status,
+            "file": progress.to_dict() if progress is not None else None
+        }
+        for queue in self._subscribers.get(job.task_id, []):
+            queue.put_nowait(event)
+
+    async def _persist_file(self, item: _WorkItem) -> None:
+        self._publish(item.job, item.progress)
+        if self.job_store is None:
+            return
+        try:
+            await self.job_store.update_file(item.job.task_id, item.progress.to_row())
+        except Exception as e:
+            logger.warning({
+                "message": "Failed to persist ingestion file state",
+                "task_id": item.job.task_id,
+                "filename": item.progress.filename,
+                "error": str(e)
+            })
+
+    async def _persist_status(self, job: IngestionJob) -> None:
+        self._publish(job)
+        if self.job_store is None:
+            return
+        try:
+            await self.job_store.update_status(job.task_id, job.status)
+        except Exception as e:
+            logger.warning({
+                "message": "Failed to persist ingestion job status",
+                "task_id": job.task_id,
+                "status": job.status,
+                "error": str(e)
+            })
+
+    async def _set_state(self, item: _WorkItem, state: str) -> None:
+        item.progress.state = state
+        if item.progress.started_at is None:
+            item.progress.started_at = time.time()
+        if item.job.status == "queued":
+            item.job.status = "processing"
+            await self._persist_status(item.job)
+        await self._persist_file(item)
+
+    async def _lease_worker(self) -> None:
+        """Keep this worker's job leases alive and resume jobs abandoned by other workers."""
+        interval = max(1, self.job_store.lease_seconds // 3)
+        while True:
+            try:
+                await self.job_store.renew_leases()
+                for row in await self.job_store.claim_expired_jobs():
+                    await self._resume_job(row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning({"message": "Ingestion job lease maintenance failed", "error": str(e)})
+            await asyncio.sleep(interval)
+
+    async def _resume_job(self, row: Dict[str, Any]) -> None:
+        """Requeue the unfinished files of a job claimed from the job store."""
+        job = IngestionJob(
+            task_id=row["task_id"],
+            files={file_row["file_path"]: FileProgress.from_row(file_row) for file_row in row["files"]},
+            status="processing"
+        )
+        self._prune_jobs()
+        self.jobs[job.task_id] = job
+        resumed = 0
+        for progress in job.files.values():
+            if progress.state in TERMINAL_FILE_STATES:
+                continue
+            item = _WorkItem(job=job, progress=progress)
+            if not os.path.exists(progress.file_path):
+                await self._fail(item, FileNotFoundError(f"Uploaded file {progress.file_path} no longer exists"))
+                continue
+            # A crash mid-insert may have left some chunks behind, so replace the source in full.
+            item.replace_source = True
+            progress.state, progress.started_at, progress.finished_at, progress.error = "queued", None, None, None
+            await self._parse_q.put(item)
+            resumed += 1
+
+        logger.info({"message": "Resumed ingestion job", "task_id": job.task_id, "file_count": resumed})
+        await self._maybe_complete(job)
+
+    async def _fail(self, item: _WorkItem, error: Exception) -> None:
+        logger.error({
+            "message": "Error ingesting file",
+            "task_id": item.job.task_id,
+            "filename": item.progress.filename,
+            "stage": item.progress.state,
+            "error": str(error)
+        }, exc_info=error)
+        item.progress.error = str(error)
+        await self._finish(item, "failed")
+
+    async def _finish(self, item: _WorkItem, state: str) -> None:
+        item.progress.state = state
+        item.progress.finished_at = time.time()
+        item.documents, item.vectors = [], []
+        if item.source_leased:
+            item.source_leased = False
+            try:
+                await self.job_store.release_source(item.progress.filename, item.job.task_id)
+            except Exception as e:
+                logger.warning({
+                    "message": "Failed to release ingestion source lease",
+                    "task_id": item.job.task_id,
+                    "filename": item.progress.filename,
+                    "error": str(e)
+                })
+        if item.source_lock is not None:
+            item.source_lock.release()
+            item.source_lock = None
+        self._leave_source(item.progress.filename)
+        await self._persist_file(item)
+        await self._maybe_complete(item.job)
+
+    def _enter_source(self, source: str) -> None:
+        self._in_flight[source] = self._in_flight.get(source, 0) + 1
+
+    def _leave_source(self, source: str) -> None:
+        remaining = self._in_flight.get(source, 0) - 1
+        if remaining > 0:
+            self._in_flight[source] = remaining
+            return
+        self._in_flight.pop(source, None)
+        lock = self._source_locks.get(source)
+        if lock is not None and not lock.locked():
+            del self._source_locks[source]
+
+    async def _parse_worker(self) -> None:
+        while True:
+            item = await self._parse_q.get()
+            try:
+                source = item.progress.filename
+                self._enter_source(source)
+                await self._set_state(item, "hashing")
+                if item.progress.file_hash is None:
+                    item.progress.file_hash = await asyncio.to_thread(hash_file, item.progress.file_path)
+                # Only skip early when no other upload of the source is in flight; otherwise
+                # the check is repeated under the source lock before the diff.
+                if self._in_flight[source] == 1:
+                    indexed_hash = await asyncio.to_thread(self.vector_store.manifest.get_file_hash, source)
+                    if indexed_hash == item.progress.file_hash:
+                        logger.debug({"message": "Skipping unchanged file", "source": source})
+                        await asyncio.to_thread(self._register_sources, [source])
+                        await self._finish(item, "unchanged")
+                        continue
+
+                await self._set_state(item, "parsing")
+                parsed = await asyncio.to_thread(
+                    parse_file,
+                    item.progress.file_path,
+                    item.progress.filename,
+                    self._process_pool
+                )
+                item.documents = parsed.documents
+                item.progress.parser = parsed.parser
+                item.progress.parse_seconds = round(parsed.elapsed_s, 3)
+                await self._chunk_q.put(item)
+            except Exception as e:
+                await self._fail(item, e)
+            finally:
+                self._parse_q.task_done()
+
+    async def _chunk_worker(self) -> None:
+        while True:
+            item = await self._chunk_q.get()
+            try:
+                await self._set_state(item, "chunking")
+                chunks = await asyncio.to_thread(self.vector_store.split_documents, item.documents)
+                lock = self._source_locks.setdefault(item.progress.filename, asyncio.Lock())
+                if not lock.locked():
+                    await lock.acquire()
+                    item.source_lock = lock
+                if item.source_lock is not None and await self._lease_source(item):
+                    await self._diff_locked(item, chunks)
+                else:
+                    # Another upload of this source is between its diff and insert, on this
+                    # worker or another one; wait for it in a separate task so the chunk
+                    # stage keeps serving other files.
+                    waiter = asyncio.create_task(self._diff_when_unlocked(item, chunks, lock))
+                    self._lock_waiters.add(waiter)
+                    waiter.add_done_callback(self._lock_waiters.discard)
+            except Exception as e:
+                await self._fail(item, e)
+            finally:
+                self._chunk_q.task_done()
+
+    async def _diff_when_unlocked(self, item: _WorkItem, chunks: List[Document], lock: asyncio.Lock) -> None:
+        try:
+            if item.source_lock is None:
+                await lock.acquire()
+                item.source_lock = lock
+            while not await self._lease_source(item):
+                await asyncio.sleep(INGEST_SOURCE_LEASE_POLL_SECONDS)
+            await self._diff_locked(item, chunks)
+        except Exception as e:
+            await self._fail(item, e)
+
+    async def _lease_source(self, item: _WorkItem) -> bool:
+        """Try to take the job store's lease on the item's source.
+
+        Returns:
+            False if another worker holds the source, True otherwise. Without a
+            job store, or if it cannot be reached, uploads are only serialized
+            within this worker.
+        """
+        if self.job_store is None:
+            return True
+        try:
+            item.source_leased = await self.job_store.acquire_source(item.progress.filename, item.job.task_id)
+        except Exception as e:
+            logger.warning({
+                "message": "Failed to lease ingestion source, indexing without it",
+                "task_id": item.job.task_id,
+                "filename": item.progress.filename,
+                "error": str(e)
+            })
+            return True
+        return item.source_leased
+
+    async def _diff_locked(self, item: _WorkItem, chunks: List[Document]) -> None:
+        """Diff against the manifest under the source lock and pass the item on.
+
+        The source lock, and the source lease when there is a job store, are
+        held until the item is finished, so the manifest the diff is computed
+        against cannot change before the insert.
+        """
+        source = item.progress.filename
+        indexed_hash = await asyncio.to_thread(self.vector_store.manifest.get_file_hash, source)
+        if indexed_hash == item.progress.file_hash and not item.replace_source:
+            logger.debug({"message": "Skipping unchanged file", "source": source})
+            await asyncio.to_thread(self._register_sources, [source])
+            await self._finish(item, "unchanged")
+            return
+
+        await asyncio.to_thread(self._diff_chunks, item, chunks)
+        if item.documents:
+            await self._embed_q.put(item)
+        else:
+            await self._insert_q.put(item)
+
+    async def _embed_worker(self) -> None:
+        while True:
+            item = await self._embed_q.get()
+            try:
+                await self._set_state(item, "embedding")
+                texts = [doc.page_content for doc in item.documents]
+                item.vectors = await asyncio.to_thread(self.vector_store.embeddings.embed_documents, texts)
+                await self._insert_q.put(item)
+            except Exception as e:
+                await self._fail(item, e)
+            finally:
+                self._embed_q.task_done()
+
+    async def _insert_worker(self) -> None:
+        """Group whatever embedded files are ready into bulk inserts of roughly `insert_batch_size` rows."""
+        while True:
+            items: List[_WorkItem] = [await self._insert_q.get()]
+            rows = len(items[0].documents)
+            while rows < self.insert_batch_size and not self._insert_q.empty():
+                next_item = self._insert_q.get_nowait()
+                items.append(next_item)
+                rows += len(next_item.documents)
+
+            for item in items:
+                await self._set_state(item, "indexing")
+            try:
+                for item in items:
+                    source = item.progress.filename
+                    if item.replace_source:
+                        await asyncio.to_thread(self.vector_store.delete_source_chunks, source)
+                    else:
+                        if item.deleted_hashes:
+                            await asyncio.to_thread(self.vector_store.delete_source_chunks, source, item.deleted_hashes)
+                        if item.kept_hashes:
+                            await asyncio.to_thread(
+                                self.vector_store.update_chunk_metadata,
+                                source,
+                                item.kept_hashes,
+                                {"file_path": item.progress.file_path, "content_hash": item.progress.file_hash}
+                            )
+
+                texts, vectors, metadatas = [], [], []
+                for item in items:
+                    texts.extend(doc.page_content for doc in item.documents)
+                    metadatas.extend(doc.metadata for doc in item.documents)
+                    vectors.extend(item.vectors)
+                if texts:
+                    await asyncio.to_thread(self.vector_store.insert_embeddings, texts, vectors, metadatas)
+
+                for item in items:
+                    await asyncio.to_thread(
+                        self.vector_store.manifest.record,
+                        item.progress.filename,
+                        item.progress.file_hash,
+                        item.progress.file_path,
+                        item.chunk_hashes
+                    )
+                await asyncio.to_thread(self._register_sources, [item.progress.filename for item in items])
+                for item in items:
+                    await self._finish(item, "indexed")
+            except Exception as e:
+                for item in items:
+                    # The index may be partially updated, so force a full re-index next time.
+                    await asyncio.to_thread(self.vector_store.manifest.remove, item.progress.filename)
+                    await self._fail(item, e)
+            finally:
+                for _ in items:
+                    self._insert_q.task_done()
+
+    def _diff_chunks(self, item: _WorkItem, chunks: List[Document]) -> None:
+        """Hash chunks, drop duplicates and keep only chunks not already indexed for the source."""
+        source = item.progress.filename
+        unique: Dict[str, Document] = {}
+        for chunk in chunks:
+            chunk_hash = hash_text(chunk.page_content)
+            if chunk_hash in unique:
+                continue
+            chunk.metadata["chunk_hash"] = chunk_hash
+            chunk.metadata["content_hash"] = item.progress.file_hash
+            unique[chunk_hash] = chunk
+        item.chunk_hashes = list(unique)
+
+        indexed = self.vector_store.manifest.get_chunk_hashes(source)
+        if item.replace_source or indexed is None or not self.vector_store.supports_chunk_hashes:
+            item.replace_source = True
+            item.documents = list(unique.values())
+        else:
+            item.documents = [chunk for chunk_hash, chunk in unique.items() if chunk_hash not in indexed]
+            item.deleted_hashes = sorted(indexed - unique.keys())
+            item.kept_hashes = sorted(indexed & unique.keys())
+
+        item.progress.chunks = len(unique)
+        token_counts = [chunk.metadata.get("token_count", 0) for chunk in unique.values()]
+        item.progress.tokens = sum(token_counts)
+        item.progress.max_chunk_tokens = max(token_counts, default=0)
+        item.progress.new_chunks = len(item.documents)
+        item.progress.deleted_chunks = len(item.deleted_hashes)
+        logger.debug({
+            "message": "Computed chunk diff",
+            "source": source,
+            "chunk_count": len(unique),
+            "duplicate_count": len(chunks) - len(unique),
+            "new_count": len(item.documents),
+            "deleted_count": len(item.deleted_hashes),
+            "kept_count": len(item.kept_hashes),
+            "replace_source": item.replace_source
+        })
+
+    def _register_sources(self, file_names: List[str]) -> None:
+        config = self.config_manager.read_config()
+        new_sources = [name for name in file_names if name not in config.sources]
+        if new_sources:
+            self.config_manager.add_sources(new_sources)
+            logger.debug({"message": "Updated config with new sources", "sources": new_sources})
+
+    async def _maybe_complete(self, job: IngestionJob) -> None:
+        states = [progress.state for progress in job.files.values()]
+        if not all(state in TERMINAL_FILE_STATES for state in states) or job.status in FINISHING_JOB_STATES:
+            return
+
+        job.status = "flushing"
+        await self._persist_status(job)
+        if any(state == "indexed" for state in states):
+            await asyncio.to_thread(self.vector_store.flush_store)
+
+        failed = states.count("failed")
+        if failed == 0:
+            job.status = "completed"
+        elif failed == len(states):
+            job.status = "failed"
+        else:
+            job.status = "completed_with_errors"
+        job.finished_at = time.time()
+        await self._persist_status(job)
+        logger.debug({
+            "message": "Ingestion job finished",
+            "task_id": job.task_id,
+            "status": job.status,
+            "file_count": len(states),
+            "failed_count": failed
+        })
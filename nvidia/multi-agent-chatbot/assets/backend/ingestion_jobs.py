@@ -0,0 +1,261 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""PostgreSQL-backed ingestion job table.
+
+Jobs and their per-file progress are stored in Postgres, so status survives
+restarts and is visible to every backend worker. Each unfinished job is leased
+by the worker running it; a worker renews its leases while it is alive, and
+jobs whose lease expired (e.g. after a crash or restart) are claimed and
+resumed by another worker.
+
+Sources are leased the same way while a worker diffs and indexes a new upload
+of them, so uploads of one file that reach different workers are indexed one
+after the other.
+"""
+
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+from logger import logger
+
+
+INGEST_JOB_LEASE_SECONDS = int(os.getenv("INGEST_JOB_LEASE_SECONDS", 60))
+
+UNFINISHED_JOB_STATES = ["queued", "processing", "flushing"]
+
+FILE_COLUMNS = [
+    "file_path", "filename", "state", "file_hash", "bytes", "parser", "parse_seconds", "chunks",
+    "tokens", "max_chunk_tokens", "new_chunks", "deleted_chunks", "error", "started_at", "finished_at"
+]
+
+
+class IngestionJobStore:
+    """Stores ingestion jobs in the conversation database's connection pool."""
+
+    def __init__(self, storage, lease_seconds: int = INGEST_JOB_LEASE_SECONDS):
+        """Initialize the job store.
+        
+        Args:
+            storage: PostgreSQLConversationStorage whose pool is shared
+            lease_seconds: How long a job stays claimed without a lease renewal
+        """
+        self.storage = storage
+        self.lease_seconds = lease_seconds
+        self.worker_id = uuid.uuid4().hex
+
+    @property
+    def pool(self):
+        return self.storage.pool
+
+    async def init(self) -> None:
+        """Create the job tables if they don't exist."""
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    task_id VARCHAR(255) PRIMARY KEY,
+                    status VARCHAR(32) NOT NULL,
+                    owner VARCHAR(64),
+                    lease_expires_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_files (
+                    task_id VARCHAR(255) NOT NULL REFERENCES ingestion_jobs(task_id) ON DELETE CASCADE,
+                    file_path TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    state VARCHAR(32) NOT NULL,
+                    file_hash VARCHAR(64),
+                    bytes BIGINT DEFAULT 0,
+                    parser VARCHAR(32),
+                    parse_seconds DOUBLE PRECISION,
+                    chunks INTEGER DEFAULT 0,
+                    tokens BIGINT DEFAULT 0,
+                    max_chunk_tokens INTEGER DEFAULT 0,
+                    new_chunks INTEGER DEFAULT 0,
+                    deleted_chunks INTEGER DEFAULT 0,
+                    error TEXT,
+                    started_at DOUBLE PRECISION,
+                    finished_at DOUBLE PRECISION,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (task_id, file_path)
+                )
+            """)
+            await conn.execute("ALTER TABLE ingestion_files ADD COLUMN IF NOT EXISTS parser VARCHAR(32)")
+            await conn.execute("ALTER TABLE ingestion_files ADD COLUMN IF NOT EXISTS parse_seconds DOUBLE PRECISION")
+            await conn.execute("ALTER TABLE ingestion_files ADD COLUMN IF NOT EXISTS tokens BIGINT DEFAULT 0")
+            await conn.execute("ALTER TABLE ingestion_files ADD COLUMN IF NOT EXISTS max_chunk_tokens INTEGER DEFAULT 0")
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_sources (
+                    source TEXT PRIMARY KEY,
+                    task_id VARCHAR(255) NOT NULL,
+                    owner VARCHAR(64) NOT NULL,
+                    lease_expires_at TIMESTAMP NOT NULL
+                )
+            """)
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_unfinished
+                ON ingestion_jobs(lease_expires_at)
+                WHERE status IN ('queued', 'processing', 'flushing')
+            """)
+
+    async def create_job(self, task_id: str, status: str, files: List[Dict[str, Any]]) -> None:
+        """Insert a job leased by this worker along with its files."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO ingestion_jobs (task_id, status, owner, lease_expires_at)
+                    VALUES ($1, $2, $3, CURRENT_TIMESTAMP + make_interval(secs => $4))
+                    """,
+                    task_id, status, self.worker_id, self.lease_seconds
+                )
+                await conn.executemany(
+                    f"""
+                    INSERT INTO ingestion_files (task_id, {', '.join(FILE_COLUMNS)})
+                    VALUES ($1, {', '.join(f'${i + 2}' for i in range(len(FILE_COLUMNS)))})
+                    """,
+                    [(task_id, *[row.get(column) for column in FILE_COLUMNS]) for row in files]
+                )
+
+    async def update_file(self, task_id: str, row: Dict[str, Any]) -> None:
+        """Persist the current progress of one file."""
+        columns = [column for column in FILE_COLUMNS if column not in ("file_path", "filename")]
+        assignments = ", ".join(f"{column} = ${i + 3}" for i, column in enumerate(columns))
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                f"""
+                UPDATE ingestion_files SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                WHERE task_id = $1 AND file_path = $2
+                """,
+                task_id, row["file_path"], *[row.get(column) for column in columns]
+            )
+
+    async def update_status(self, task_id: str, status: str) -> None:
+        """Persist a job status; finished jobs release their lease."""
+        finished = status not in UNFINISHED_JOB_STATES
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE ingestion_jobs
+                SET status = $2,
+                    owner = CASE WHEN $3 THEN NULL ELSE owner END,
+                    lease_expires_at = CASE WHEN $3 THEN NULL ELSE lease_expires_at END,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE task_id = $1
+                """,
+                task_id, status, finished
+            )
+
+    async def get_job(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job and its files, or None if the job is unknown."""
+        async with self.pool.acquire() as conn:
+            job = await conn.fetchrow("SELECT task_id, status FROM ingestion_jobs WHERE task_id = $1", task_id)
+            if job is None:
+                return None
+            files = await conn.fetch(
+                f"SELECT {', '.join(FILE_COLUMNS)} FROM ingestion_files WHERE task_id = $1 ORDER BY file_path",
+                task_id
+            )
+        return {"task_id": job["task_id"], "status": job["status"], "files": [dict(row) for row in files]}
+
+    async def renew_leases(self) -> None:
+        """Extend the lease on every unfinished job and every source held by this worker."""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE ingestion_jobs
+                SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $2)
+                WHERE owner = $1 AND status = ANY($3::varchar[])
+                """,
+                self.worker_id, self.lease_seconds, UNFINISHED_JOB_STATES
+            )
+            await conn.execute(
+                """
+                UPDATE ingestion_sources
+                SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $2)
+                WHERE owner = $1
+                """,
+                self.worker_id, self.lease_seconds
+            )
+
+    async def acquire_source(self, source: str, task_id: str) -> bool:
+        """Take the lease on a source if it is free or expired.
+        
+        Returns:
+            True if this worker now holds the source
+        """
+        async with self.pool.acquire() as conn:
+            acquired = await conn.fetchval(
+                """
+                INSERT INTO ingestion_sources (source, task_id, owner, lease_expires_at)
+                VALUES ($1, $2, $3, CURRENT_TIMESTAMP + make_interval(secs => $4))
+                ON CONFLICT (source) DO UPDATE SET
+                    task_id = EXCLUDED.task_id,
+                    owner = EXCLUDED.owner,
+                    lease_expires_at = EXCLUDED.lease_expires_at
+                WHERE ingestion_sources.lease_expires_at < CURRENT_TIMESTAMP
+                RETURNING source
+                """,
+                source, task_id, self.worker_id, self.lease_seconds
+            )
+        return acquired is not None
+
+    async def release_source(self, source: str, task_id: str) -> None:
+        """Release a source lease taken by `acquire_source`."""
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM ingestion_sources WHERE source = $1 AND task_id = $2 AND owner = $3",
+                source, task_id, self.worker_id
+            )
+
+    async def claim_expired_jobs(self) -> List[Dict[str, Any]]:
+        """Take over unfinished jobs whose lease has expired.
+        
+        Returns:
+            The claimed jobs with their files, in creation order
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                UPDATE ingestion_jobs
+                SET owner = $1, lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $2)
+                WHERE task_id IN (
+                    SELECT task_id FROM ingestion_jobs
+                    WHERE status = ANY($3::varchar[])
+                      AND (lease_expires_at IS NULL OR lease_expires_at < CURRENT_TIMESTAMP)
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING task_id
+                """,
+                self.worker_id, self.lease_seconds, UNFINISHED_JOB_STATES
+            )
+        jobs = []
+        for row in rows:
+            job = await self.get_job(row["task_id"])
+            if job is not None:
+                jobs.append(job)
+        if jobs:
+            logger.info({
+                "message": "Claimed unfinished ingestion jobs",
+                "worker_id": self.worker_id,
+                "task_ids": [job["task_id"] for job in jobs]
+            })
+        return jobs
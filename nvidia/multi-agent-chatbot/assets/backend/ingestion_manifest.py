@@ -0,0 +1,134 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Per-source manifest of indexed content for incremental ingestion.
+
+For every source the manifest records the content hash of the file that was
+indexed and the hashes of the chunks currently stored in Milvus. Ingestion
+compares a new upload against it to skip unchanged files and to replace only
+the chunks that changed.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Set
+
+from logger import logger
+
+
+INGESTION_MANIFEST_PATH = os.getenv(
+    "INGESTION_MANIFEST_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "indices", "ingestion_manifest.sqlite3")
+)
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class IngestionManifest:
+    """SQLite-backed record of which file and chunk hashes are indexed per source."""
+
+    def __init__(self, path: str = INGESTION_MANIFEST_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._create_tables()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self) -> None:
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                file_path TEXT,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS source_chunks (
+                source TEXT NOT NULL REFERENCES sources(source) ON DELETE CASCADE,
+                chunk_hash TEXT NOT NULL,
+                PRIMARY KEY (source, chunk_hash)
+            ) WITHOUT ROWID
+        """)
+
+    def get_file_hash(self, source: str) -> Optional[str]:
+        """Return the content hash of the file last indexed for `source`, if any."""
+        row = self._conn().execute("SELECT file_hash FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def get_chunk_hashes(self, source: str) -> Optional[Set[str]]:
+        """Return the chunk hashes indexed for `source`, or None if the source is unknown."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM sources WHERE source = ?", (source,)).fetchone() is None:
+            return None
+        rows = conn.execute("SELECT chunk_hash FROM source_chunks WHERE source = ?", (source,)).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, source: str, file_hash: str, file_path: str, chunk_hashes: Iterable[str]) -> None:
+        """Replace the manifest entry for `source` with the newly indexed state."""
+        chunk_hashes = list(chunk_hashes)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+            conn.execute(
+                "INSERT INTO sources (source, file_hash, file_path, chunk_count, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (source, file_hash, file_path, len(chunk_hashes), time.time())
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO source_chunks (source, chunk_hash) VALUES (?, ?)",
+                [(source, chunk_hash) for chunk_hash in chunk_hashes]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.debug({
+            "message": "Recorded ingestion manifest entry",
+            "source": source,
+            "chunk_count": len(chunk_hashes)
+        })
+
+    def remove(self, source: str) -> None:
+        """Forget `source`, forcing a full re-index the next time it is ingested."""
+        self._conn().execute("DELETE FROM sources WHERE source = ?", (source,))
+
+    def clear(self) -> None:
+        """Forget every source, e.g. after the collection was dropped."""
+        self._conn().execute("DELETE FROM sources")
@@ -24,22 +24,31 @@ This module provides the main HTTP API endpoints and WebSocket connections for:
 - Vector store operations
 """
 
-import base64
+import asyncio
 import json
 import os
+import shutil
 import uuid
-from contextlib import asynccontextmanager
-from typing import List, Optional, Dict
+from contextlib import aclosing, asynccontextmanager
+from typing import List, Optional
 
-from fastapi import FastAPI, File, Form, UploadFile, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 
 from agent import ChatAgent
+from chat_turns import ChatBusyError, ChatTurnLeases
 from config import ConfigManager
+from images import IMAGE_MAX_UPLOAD_BYTES, VARIANTS, ImageError, ImageProcessor, to_data_uri
+from ingestion import IngestionPipeline
+from ingestion_jobs import IngestionJobStore
 from logger import logger, log_request, log_response, log_error
-from models import ChatIdRequest, ChatRenameRequest, SelectedModelRequest
+from model_cascade import ModelCascade
+from model_health import ModelRouter
+from models import ChatIdRequest, ChatRenameRequest, SelectedModelRequest, UploadSessionRequest
 from postgres_storage import PostgreSQLConversationStorage
-from utils import process_and_ingest_files_background
+from turn_streams import TurnStream, TurnStreams
+from uploads import UPLOAD_ROOT, ResumableUploads, UploadError, content_length, save_multipart_files
 from vector_store import create_vector_store_with_config
 
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "postgres")
@@ -47,6 +56,7 @@ POSTGRES_PORT = int(os.getenv("POSTGRES_PORT", 5432))
 POSTGRES_DB = os.getenv("POSTGRES_DB", "chatbot")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "chatbot_user")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "chatbot_password")
+MILVUS_URI = os.getenv("MILVUS_URI", "http://milvus:19530")
 
 config_manager = ConfigManager("./config.json")
 
@@ -58,12 +68,23 @@ postgres_storage = PostgreSQLConversationStorage(
     password=POSTGRES_PASSWORD
 )
 
-vector_store = create_vector_store_with_config(config_manager)
+vector_store = create_vector_store_with_config(config_manager, uri=MILVUS_URI)
 
 vector_store._initialize_store()
 
+ingestion_pipeline = IngestionPipeline(
+    vector_store,
+    config_manager,
+    job_store=IngestionJobStore(postgres_storage)
+)
+chat_turns = ChatTurnLeases(postgres_storage)
+turn_streams = TurnStreams()
+model_cascade = ModelCascade()
+model_router = ModelRouter(config_manager, extra_models=[model_cascade.small_model])
+resumable_uploads = ResumableUploads()
+image_processor = ImageProcessor(postgres_storage)
+
 agent: ChatAgent | None = None
-indexing_tasks: Dict[str, str] = {}
 
 
 @asynccontextmanager
@@ -75,11 +96,17 @@ async def lifespan(app: FastAPI):
     try:
         await postgres_storage.init_pool()
         logger.info("PostgreSQL storage initialized successfully")
+        await chat_turns.init()
+        await ingestion_pipeline.start()
+        resumable_uploads.start()
+        await model_router.start()
         logger.debug("Initializing ChatAgent...")
         agent = await ChatAgent.create(
             vector_store=vector_store,
             config_manager=config_manager,
-            postgres_storage=postgres_storage
+            postgres_storage=postgres_storage,
+            model_router=model_router,
+            model_cascade=model_cascade
         )
         logger.info("ChatAgent initialized successfully.")
     except Exception as e:
@@ -88,12 +115,32 @@ async def lifespan(app: FastAPI):
 
     yield
     
+    await turn_streams.close()
+
+    try:
+        if agent:
+            await agent.close()
+    except Exception as e:
+        logger.error(f"Error closing MCP sessions: {e}")
+
+    await model_router.stop()
+    await resumable_uploads.stop()
+
+    try:
+        await ingestion_pipeline.stop()
+        await asyncio.to_thread(vector_store.flush_store, True)
+    except Exception as e:
+        logger.error(f"Error stopping ingestion pipeline: {e}")
+
     try:
         await postgres_storage.close()
         logger.debug("PostgreSQL storage closed successfully")
     except Exception as e:
         logger.error(f"Error closing PostgreSQL storage: {e}")
 
+    await asyncio.to_thread(config_manager.flush)
+    image_processor.close()
+
 
 app = FastAPI(
     title="Chatbot API",
@@ -111,44 +158,131 @@ app.add_middleware(
 )
 
 
+async def _turn_events(chat_id: str, turn_id: str, message: str, image_data: Optional[str]):
+    """Run one turn under the chat's lease and yield its agent events."""
+    async with chat_turns.turn(chat_id, turn_id):
+        async with aclosing(agent.query(query_text=message, chat_id=chat_id, image_data=image_data)) as events:
+            async for event in events:
+                # The agent also yields the final reply as a bare string; clients get it with the history sync.
+                if isinstance(event, dict):
+                    yield event
+
+
+async def _forward_turn(websocket: WebSocket, stream: TurnStream, after: int) -> None:
+    """Send a turn's events after sequence number `after` until it ends.
+    
+    While the turn runs, a {"type": "cancel"} message stops it. A client that
+    disconnects only stops following; the turn keeps running so it can resume.
+    """
+    async def send_events():
+        async for event in stream.follow(after):
+            await websocket.send_json(event)
+
+    async def receive_cancel():
+        while True:
+            client_message = json.loads(await websocket.receive_text())
+            if client_message.get("type") == "cancel":
+                stream.cancel()
+            else:
+                await websocket.send_json({"type": "error", "content": "A reply is still being generated"})
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(receive_cancel())
+    try:
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (sender, receiver):
+            task.cancel()
+        await asyncio.gather(sender, receiver, return_exceptions=True)
+    for task in done:
+        task.result()
+
+
 @app.websocket("/ws/chat/{chat_id}")
-async def websocket_endpoint(websocket: WebSocket, chat_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    chat_id: str,
+    seq: Optional[int] = None,
+    version: Optional[int] = None,
+    turn_id: Optional[str] = None,
+    turn_seq: int = 0
+):
     """WebSocket endpoint for real-time chat communication.
     
+    Clients that pass the `seq` and `version` of their last history event
+    receive only the messages added since, as "history_delta" events, both on
+    connect and after each reply. Clients that pass neither receive the full
+    "history" every time.
+    
+    Every event of a turn carries its `turn_id` and a `seq` number, from
+    "turn_start" to "turn_end". If a turn on this chat is still running when a
+    client connects, the server sends "turn_resume" after the history and
+    replays the turn's events after `turn_seq` when `turn_id` names that turn,
+    or from the start otherwise.
+    
     Args:
         websocket: WebSocket connection
         chat_id: Unique chat identifier
+        seq: Number of stored messages the client already has
+        version: History version the client last synced to
+        turn_id: Turn the client was following when it disconnected
+        turn_seq: Last event sequence number the client received for `turn_id`
     """
     logger.debug(f"WebSocket connection attempt for chat_id: {chat_id}")
     try:
         await websocket.accept()
         logger.debug(f"WebSocket connection accepted for chat_id: {chat_id}")
         
-        history_messages = await postgres_storage.get_messages(chat_id)
-        history = [postgres_storage._message_to_dict(msg) for i, msg in enumerate(history_messages) if i != 0]
-        await websocket.send_json({"type": "history", "messages": history})
+        # Look up the running turn before reading history, so a turn that ends in between is replayed.
+        stream = turn_streams.get(chat_id)
+        delta_sync = seq is not None and version is not None
+        sync = await postgres_storage.get_history_since(chat_id, seq, version)
+        await websocket.send_json(sync)
+        
+        async def send_sync():
+            nonlocal sync
+            if delta_sync:
+                sync = await postgres_storage.get_history_since(chat_id, sync["seq"], sync["version"])
+            else:
+                sync = await postgres_storage.get_history_since(chat_id)
+            await websocket.send_json(sync)
+        
+        if stream:
+            after = turn_seq if stream.turn_id == turn_id else 0
+            await websocket.send_json({
+                "type": "turn_resume",
+                "turn_id": stream.turn_id,
+                "message": stream.message,
+                "seq": after
+            })
+            await _forward_turn(websocket, stream, after)
+            await send_sync()
         
         while True:
             data = await websocket.receive_text()
             client_message = json.loads(data)
+            if client_message.get("type") == "cancel":
+                # The turn it targeted already ended.
+                continue
             new_message = client_message.get("message")
             image_id = client_message.get("image_id")
             
             image_data = None
             if image_id:
-                image_data = await postgres_storage.get_image(image_id)
+                variant = await postgres_storage.get_image_variant(image_id, "vlm")
+                image_data = to_data_uri(variant) if variant else await postgres_storage.get_image(image_id)
                 logger.debug(f"Retrieved image data for image_id: {image_id}, data length: {len(image_data) if image_data else 0}")
             
             try:
-                async for event in agent.query(query_text=new_message, chat_id=chat_id, image_data=image_data):
-                    await websocket.send_json(event)
-            except Exception as query_error:
-                logger.error(f"Error in agent.query: {str(query_error)}", exc_info=True)
-                await websocket.send_json({"type": "error", "content": f"Error processing request: {str(query_error)}"})
+                new_turn_id = uuid.uuid4().hex
+                stream = turn_streams.start(
+                    chat_id, new_turn_id, new_message, _turn_events(chat_id, new_turn_id, new_message, image_data)
+                )
+                await _forward_turn(websocket, stream, 0)
+            except ChatBusyError as busy_error:
+                await websocket.send_json({"type": "error", "content": str(busy_error)})
         
-            final_messages = await postgres_storage.get_messages(chat_id)
-            final_history = [postgres_storage._message_to_dict(msg) for i, msg in enumerate(final_messages) if i != 0]
-            await websocket.send_json({"type": "history", "messages": final_history})
+            await send_sync()
             
     except WebSocketDisconnect:
         logger.debug(f"Client disconnected from chat {chat_id}")
@@ -158,61 +292,101 @@ async def websocket_endpoint(websocket: WebSocket, chat_id: str):
 
 @app.post("/upload-image")
 async def upload_image(image: UploadFile = File(...), chat_id: str = Form(...)):
-    """Upload and store an image for chat processing.
+    """Upload an image for chat processing.
+    
+    The image is stored once under a short handle along with a downscaled
+    variant for the vision model and a thumbnail for the UI. Send the handle
+    back as `image_id` on the chat websocket.
     
     Args:
         image: Uploaded image file
         chat_id: Chat identifier for context
         
     Returns:
-        Dictionary with generated image_id
+        Dictionary with the image_id handle and the size and URL of each variant
     """
-    image_data = await image.read()
-    image_base64 = base64.b64encode(image_data).decode('utf-8')
-    data_uri = f"data:{image.content_type};base64,{image_base64}"
-    image_id = str(uuid.uuid4())
-    await postgres_storage.store_image(image_id, data_uri)
-    return {"image_id": image_id}
+    image_data = await image.read(IMAGE_MAX_UPLOAD_BYTES + 1)
+    try:
+        return await image_processor.store(image_data)
+    except ImageError as e:
+        status_code = 413 if len(image_data) > IMAGE_MAX_UPLOAD_BYTES else 400
+        raise HTTPException(status_code=status_code, detail=str(e))
+
+
+@app.get("/images/{image_id}/{variant}")
+async def get_image(image_id: str, variant: str):
+    """Serve a stored image variant ("original", "vlm" or "thumb").
+    
+    Handles are derived from the image content, so responses can be cached.
+    """
+    if variant not in VARIANTS:
+        raise HTTPException(status_code=404, detail=f"Unknown variant '{variant}'")
+    stored = await postgres_storage.get_image_variant(image_id, variant)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(
+        content=stored.data,
+        media_type=stored.content_type,
+        headers={"Cache-Control": "private, max-age=3600, immutable"}
+    )
+
+
+INGEST_REQUEST_BODY = {
+    "requestBody": {
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}}
+                }
+            }
+        }
+    }
+}
 
 
-@app.post("/ingest")
-async def ingest_files(files: Optional[List[UploadFile]] = File(None), background_tasks: BackgroundTasks = None):
+@app.post("/ingest", openapi_extra=INGEST_REQUEST_BODY)
+async def ingest_files(request: Request):
     """Ingest documents for vector search and RAG.
     
+    The multipart body is parsed as it arrives and the `files` parts are
+    streamed straight to disk and hashed, subject to per-file and per-request
+    size limits. A request whose Content-Length exceeds the limit is rejected
+    before its body is read.
+    
     Args:
-        files: List of uploaded files to process
-        background_tasks: FastAPI background tasks manager
+        request: Request with a multipart/form-data body of `files` parts
         
     Returns:
         Task information for tracking ingestion progress
     """
+    permanent_dir = None
     try:
-        log_request({"file_count": len(files) if files else 0}, "/ingest")
+        log_request({"content_length": content_length(request)}, "/ingest")
         
         task_id = str(uuid.uuid4())
+        permanent_dir = os.path.join(UPLOAD_ROOT, task_id)
+        os.makedirs(permanent_dir, exist_ok=True)
         
-        file_info = []
-        for file in files:
-            content = await file.read()
-            file_info.append({
-                "filename": file.filename,
-                "content": content
+        saved = await save_multipart_files(request, permanent_dir)
+        for upload in saved:
+            logger.debug({
+                "message": "Saved file",
+                "task_id": task_id,
+                "filename": upload.filename,
+                "size": upload.size,
+                "sha256": upload.sha256
             })
         
-        indexing_tasks[task_id] = "queued"
-        
-        background_tasks.add_task(
-            process_and_ingest_files_background,
-            file_info,
-            vector_store,
-            config_manager,
+        await ingestion_pipeline.submit(
             task_id,
-            indexing_tasks
+            [upload.path for upload in saved],
+            file_hashes={upload.path: upload.sha256 for upload in saved}
         )
         
         response = {
-            "message": f"Files queued for processing. Indexing {len(files)} files in the background.",
-            "files": [file.filename for file in files],
+            "message": f"Files queued for processing. Indexing {len(saved)} files in the background.",
+            "files": [upload.filename for upload in saved],
             "status": "queued",
             "task_id": task_id
         }
@@ -220,6 +394,11 @@ async def ingest_files(files: Optional[List[UploadFile]] = File(None), backgroun
         log_response(response, "/ingest")
         return response
             
+    except UploadError as e:
+        log_error(e, "/ingest")
+        if permanent_dir:
+            shutil.rmtree(permanent_dir, ignore_errors=True)
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         log_error(e, "/ingest")
         raise HTTPException(
@@ -228,6 +407,78 @@ async def ingest_files(files: Optional[List[UploadFile]] = File(None), backgroun
         )
 
 
+@app.post("/ingest/uploads")
+async def create_resumable_upload(request: UploadSessionRequest):
+    """Start a resumable chunked upload for a large file.
+    
+    Args:
+        request: Filename and total size in bytes
+        
+    Returns:
+        Upload id, resume offset and suggested chunk size
+    """
+    try:
+        return resumable_uploads.create(request.filename, request.size)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.get("/ingest/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """Get the offset a resumable upload should continue from."""
+    try:
+        return resumable_uploads.status(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.put("/ingest/uploads/{upload_id}")
+async def append_resumable_upload(upload_id: str, offset: int, request: Request):
+    """Append the raw request body to a resumable upload at the given offset.
+    
+    Args:
+        upload_id: Upload identifier returned when the upload was created
+        offset: Byte offset of this chunk; must equal the bytes already received
+        request: Request whose body is streamed to disk
+    """
+    try:
+        return await resumable_uploads.append(upload_id, offset, request.stream(), content_length(request))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.post("/ingest/uploads/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str):
+    """Finish a resumable upload and queue the file for ingestion."""
+    try:
+        task_id = str(uuid.uuid4())
+        permanent_dir = os.path.join(UPLOAD_ROOT, task_id)
+        os.makedirs(permanent_dir, exist_ok=True)
+        
+        upload = await resumable_uploads.complete(upload_id, permanent_dir)
+        await ingestion_pipeline.submit(task_id, [upload.path], file_hashes={upload.path: upload.sha256})
+        
+        return {
+            "message": "File queued for processing. Indexing 1 file in the background.",
+            "files": [upload.filename],
+            "status": "queued",
+            "task_id": task_id,
+            "sha256": upload.sha256
+        }
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.delete("/ingest/uploads/{upload_id}")
+async def abort_resumable_upload(upload_id: str):
+    """Discard a resumable upload and its partial data."""
+    try:
+        await resumable_uploads.abort(upload_id)
+        return {"status": "success", "message": f"Upload {upload_id} aborted"}
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
 @app.get("/ingest/status/{task_id}")
 async def get_indexing_status(task_id: str):
     """Get the status of a file ingestion task.
@@ -236,12 +487,45 @@ async def get_indexing_status(task_id: str):
         task_id: Unique task identifier
         
     Returns:
-        Current task status
+        Current task status and per-file progress
+    """
+    status = await ingestion_pipeline.get_status(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return status
+
+
+@app.get("/ingest/events/{task_id}")
+async def stream_indexing_events(task_id: str):
+    """Stream ingestion progress as Server-Sent Events.
+    
+    The first event is a snapshot of the job; later events report each file
+    state change and the final job status, after which the stream closes.
+    
+    Args:
+        task_id: Unique task identifier
     """
-    if task_id in indexing_tasks:
-        return {"status": indexing_tasks[task_id]}
-    else:
+    if await ingestion_pipeline.get_status(task_id) is None:
         raise HTTPException(status_code=404, detail="Task not found")
+    
+    async def event_stream():
+        async for event in ingestion_pipeline.events(task_id):
+            yield f"data: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/ingest/stats")
+async def get_chunk_stats():
+    """Get chunk size statistics (token counts, overlap) accumulated since startup."""
+    stats = vector_store.get_chunk_stats()
+    if stats is None:
+        raise HTTPException(status_code=404, detail="The configured chunker does not record statistics")
+    return stats
 
 
 @app.get("/sources")
@@ -254,6 +538,23 @@ async def get_sources():
         raise HTTPException(status_code=500, detail=f"Error getting sources: {str(e)}")
 
 
+@app.delete("/sources/{source_name}")
+async def delete_source(source_name: str):
+    """Delete a document source and all of its indexed chunks.
+    
+    Args:
+        source_name: Name of the source to delete
+    """
+    config = config_manager.read_config()
+    if source_name not in config.sources and vector_store.manifest.get_file_hash(source_name) is None:
+        raise HTTPException(status_code=404, detail=f"Source '{source_name}' not found")
+    try:
+        await asyncio.to_thread(vector_store.delete_source, source_name)
+        return {"status": "success", "message": f"Source '{source_name}' deleted successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting source: {str(e)}")
+
+
 @app.get("/selected_sources")
 async def get_selected_sources():
     """Get currently selected document sources for RAG."""
@@ -290,7 +591,7 @@ async def get_selected_model():
 
 @app.post("/selected_model")
 async def update_selected_model(request: SelectedModelRequest):
-    """Update the selected LLM model.
+    """Update the selected LLM model and start warming it up.
     
     Args:
         request: Model selection request with model name
@@ -298,6 +599,7 @@ async def update_selected_model(request: SelectedModelRequest):
     try:
         logger.debug(f"Updating selected model to: {request.model}")
         config_manager.updated_selected_model(request.model)
+        model_router.warm_up(request.model)
         return {"status": "success", "message": "Selected model updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating selected model: {str(e)}")
@@ -305,14 +607,26 @@ async def update_selected_model(request: SelectedModelRequest):
 
 @app.get("/available_models")
 async def get_available_models():
-    """Get list of all available LLM models."""
+    """Get list of available LLM models, leaving out models whose health checks are failing."""
     try:
-        models = config_manager.get_available_models()
+        models = model_router.available_models()
         return {"models": models}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting available models: {str(e)}")
 
 
+@app.get("/model_health")
+async def get_model_health():
+    """Get the routing table: each model's state, smoothed TTFT, probe latency and turns in flight."""
+    return {"models": model_router.routing_table()}
+
+
+@app.get("/model_cascade")
+async def get_model_cascade():
+    """Get small/large cascade decision counts by tier, outcome and deciding rule."""
+    return model_cascade.get_stats()
+
+
 @app.get("/chats")
 async def list_chats():
     """Get list of all chat conversations."""
@@ -323,6 +637,38 @@ async def list_chats():
         raise HTTPException(status_code=500, detail=f"Error listing chats: {str(e)}")
 
 
+@app.get("/chats/search")
+async def search_chats(q: str, limit: int = 20, offset: int = 0):
+    """Search the messages of all chats.
+    
+    Args:
+        q: Search text; supports quoted phrases, `or` and `-word`
+        limit: Chats per page (1-100)
+        offset: Chats to skip
+        
+    Returns:
+        The total number of matching chats and one ranked page of them, each
+        with snippets of its best matching messages (matches wrapped in <mark>)
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query must not be empty")
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100 and offset non-negative")
+    try:
+        return await postgres_storage.search_messages(q.strip(), limit=limit, offset=offset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching chats: {str(e)}")
+
+
+@app.get("/chats/archive/stats")
+async def get_archive_stats():
+    """Get cold-storage totals and this worker's archive and restore counts and latencies."""
+    try:
+        return await postgres_storage.archive.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting archive stats: {str(e)}")
+
+
 @app.get("/chat_id")
 async def get_chat_id():
     """Get the current active chat ID, creating a conversation if it doesn't exist."""
@@ -0,0 +1,194 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Small/large model cascade for chat turns.
+
+When CASCADE_SMALL_MODEL is set, a heuristic classifier sends simple turns
+(greetings, short factual questions) to the small model and keeps complex
+reasoning on the user-selected large model. The tool-selection step of a turn
+that looks like it needs a tool is tried on the small model first. If the
+small model starts answering instead of calling a tool, the step is escalated
+to the large model before any of the small model's text reaches the client.
+
+Every decision and its outcome is logged as a "Cascade decision" record, so
+the thresholds and patterns below can be tuned from the logs.
+"""
+
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from logger import logger
+
+
+CASCADE_SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL", "")
+CASCADE_SIMPLE_MAX_CHARS = int(os.getenv("CASCADE_SIMPLE_MAX_CHARS", 160))
+CASCADE_TOOL_SELECTION = os.getenv("CASCADE_TOOL_SELECTION", "true").lower() in ("1", "true", "yes")
+
+SMALL, LARGE = "small", "large"
+
+GREETING_PATTERN = re.compile(
+    r"^\W*(hi|hello|hey|yo|thanks|thank you|thx|ok|okay|cool|great|bye|goodbye|"
+    r"good (morning|afternoon|evening|night)|how are you)\b[\w\s,!.?']{0,20}$",
+    re.IGNORECASE
+)
+COMPLEX_PATTERN = re.compile(
+    r"```|\b(explain|why|compare|contrast|analy[sz]e|design|architect\w*|debug|prove|derive|"
+    r"step[- ]by[- ]step|trade-?offs?|optimi[sz]e|refactor|evaluate|pros and cons|plan)\b",
+    re.IGNORECASE
+)
+TOOL_HINT_PATTERN = re.compile(
+    r"\b(search|documents?|docs|files?|pdfs?|sources?|uploaded|code|script|program|function|"
+    r"image|picture|photo|screenshot|weather|rain|forecast)\b",
+    re.IGNORECASE
+)
+
+
+class CascadeEscalation(Exception):
+    """Raised to give up a small-model step so it is retried on the large model."""
+
+
+@dataclass
+class CascadeDecision:
+    """The model tier chosen for one generate step and why."""
+    tier: str
+    model: str
+    reason: str
+    # The small model may only call tools; if it starts answering, escalate.
+    speculative: bool = False
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+class ModelCascade:
+    """Chooses between a small and a large model for each generate step."""
+
+    def __init__(self, small_model: str = CASCADE_SMALL_MODEL, simple_max_chars: int = CASCADE_SIMPLE_MAX_CHARS):
+        """Initialize the cascade.
+        
+        Args:
+            small_model: Model for simple turns and tool selection; the cascade is off if empty
+            simple_max_chars: Longest user message that can count as simple
+        """
+        self.small_model = small_model
+        self.simple_max_chars = simple_max_chars
+        self._outcomes: Counter = Counter()
+        self._reasons: Counter = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.small_model)
+
+    def classify(self, query: str) -> Tuple[bool, str]:
+        """Classify a user message.
+        
+        Returns:
+            Whether the message is simple, and the rule that decided it
+        """
+        query = query.strip()
+        if GREETING_PATTERN.match(query):
+            return True, "greeting"
+        match = COMPLEX_PATTERN.search(query)
+        if match:
+            return False, f"complex:{match.group(0).lower().strip('`') or 'code'}"
+        if len(query) > self.simple_max_chars:
+            return False, "long_query"
+        if query.count("?") > 1 or query.count("\n") > 2:
+            return False, "multi_part"
+        return True, "short_query"
+
+    def decide(self, state: Dict[str, Any], large_model: str, small_supports_tools: bool) -> CascadeDecision:
+        """Choose the model for the next generate step of a turn.
+        
+        Args:
+            state: Current graph state
+            large_model: The user-selected model
+            small_supports_tools: Whether the small model can be offered the tools
+        """
+        if not self.enabled or self.small_model == large_model:
+            return CascadeDecision(LARGE, large_model, "cascade_off")
+
+        messages = state.get("messages", [])
+        query = next((_text(msg.content) for msg in reversed(messages) if isinstance(msg, HumanMessage)), "")
+        simple, reason = self.classify(query)
+        needs_tools = bool(state.get("image_data")) or bool(TOOL_HINT_PATTERN.search(query))
+
+        if messages and isinstance(messages[-1], ToolMessage):
+            # Answering from tool results.
+            if simple:
+                return CascadeDecision(SMALL, self.small_model, f"synthesis:{reason}")
+            return CascadeDecision(LARGE, large_model, f"synthesis:{reason}")
+        if simple and (small_supports_tools or not needs_tools):
+            return CascadeDecision(SMALL, self.small_model, reason)
+        if CASCADE_TOOL_SELECTION and needs_tools and small_supports_tools:
+            return CascadeDecision(SMALL, self.small_model, "tool_selection", speculative=True)
+        return CascadeDecision(LARGE, large_model, reason)
+
+    def escalate(self, decision: CascadeDecision, large_model: str) -> CascadeDecision:
+        """Return the large-model decision replacing a small-model step that was given up."""
+        return CascadeDecision(LARGE, large_model, f"escalated:{decision.reason}")
+
+    def record(
+        self,
+        decision: CascadeDecision,
+        outcome: str,
+        started: float,
+        chat_id: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> None:
+        """Log a decision with its outcome and count it.
+        
+        Args:
+            decision: The decision that was carried out
+            outcome: "tool_call", "answer", "escalated" or "error"
+            started: `time.monotonic()` when the step started
+            chat_id: Chat identifier
+            model: Model that actually ran, if failover picked a different one
+        """
+        if not self.enabled:
+            return
+        self._outcomes[f"{decision.tier}:{outcome}"] += 1
+        self._reasons[decision.reason.split(":")[0]] += 1
+        logger.info({
+            "message": "Cascade decision",
+            "chat_id": chat_id,
+            "tier": decision.tier,
+            "model": model or decision.model,
+            "reason": decision.reason,
+            "speculative": decision.speculative,
+            "outcome": outcome,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 2)
+        })
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return decision counts by tier and outcome, and by deciding rule."""
+        return {
+            "enabled": self.enabled,
+            "small_model": self.small_model or None,
+            "outcomes": dict(self._outcomes),
+            "reasons": dict(self._reasons)
+        }
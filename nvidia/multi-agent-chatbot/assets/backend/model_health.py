@@ -0,0 +1,306 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Health probing and failover routing for the chat model endpoints.
+
+A background prober polls every configured model's health endpoint and keeps
+a routing table of its state, its time to first token (TTFT) and the turns in
+flight on it. TTFT is measured from real turns and, for models that are idle,
+from a one-token warm-up request that also keeps the model loaded. Selecting a
+model warms it up right away, so the first turn after a switch does not pay
+the load cost. Turns for a model that is down or still loading are routed to
+the fastest ready model instead of hanging on it.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from logger import logger
+
+
+# Chat model endpoint; "{model}" is replaced by the model name.
+MODEL_BASE_URL = os.getenv("MODEL_BASE_URL", "http://{model}:8000/v1")
+MODEL_HEALTH_URL = os.getenv("MODEL_HEALTH_URL", MODEL_BASE_URL.rsplit("/v1", 1)[0] + "/health")
+MODEL_PROBE_INTERVAL = float(os.getenv("MODEL_PROBE_INTERVAL", 10))
+MODEL_PROBE_TIMEOUT = float(os.getenv("MODEL_PROBE_TIMEOUT", 3))
+# Consecutive failed probes before a model is considered down.
+MODEL_FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", 2))
+# Idle models get a warm-up request when their last TTFT sample is older than this.
+MODEL_WARMUP_INTERVAL = float(os.getenv("MODEL_WARMUP_INTERVAL", 300))
+MODEL_CONNECT_TIMEOUT = float(os.getenv("MODEL_CONNECT_TIMEOUT", 5))
+MODEL_FAILOVER = os.getenv("MODEL_FAILOVER", "true").lower() in ("1", "true", "yes")
+TTFT_SMOOTHING = 0.3
+
+READY, LOADING, DOWN, UNKNOWN = "ready", "loading", "down", "unknown"
+
+
+class ModelUnavailableError(Exception):
+    """Raised when the requested model is down and no other model is ready."""
+
+
+@dataclass
+class ModelStatus:
+    """Routing table entry for one model endpoint."""
+    model: str
+    state: str = UNKNOWN
+    consecutive_failures: int = 0
+    ttft_ms: Optional[float] = None
+    probe_ms: Optional[float] = None
+    in_flight: int = 0
+    last_error: Optional[str] = None
+    last_checked: Optional[float] = None
+    last_ttft_at: Optional[float] = None
+    warmed_at: Optional[float] = None
+
+
+class ModelRouter:
+    """Tracks the health of the configured models and picks the model each turn runs on."""
+
+    def __init__(self, config_manager, interval: float = MODEL_PROBE_INTERVAL, extra_models: Optional[List[str]] = None):
+        """Initialize the router.
+        
+        Args:
+            config_manager: ConfigManager listing the available models
+            interval: Seconds between probes of every model
+            extra_models: Models to probe that users cannot select, e.g. the cascade's small model
+        """
+        self.config_manager = config_manager
+        self.interval = interval
+        self.extra_models = [model for model in extra_models or [] if model]
+        self._status: Dict[str, ModelStatus] = {}
+        self._clients: Dict[str, AsyncOpenAI] = {}
+        self._warmups: Dict[str, asyncio.Task] = {}
+        self._probe_task: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def client(self, model: str) -> AsyncOpenAI:
+        """Return the shared client for `model`'s endpoint."""
+        client = self._clients.get(model)
+        if client is None:
+            client = AsyncOpenAI(
+                base_url=MODEL_BASE_URL.format(model=model),
+                api_key="api_key",
+                timeout=httpx.Timeout(600, connect=MODEL_CONNECT_TIMEOUT),
+                max_retries=1
+            )
+            self._clients[model] = client
+        return client
+
+    def status(self, model: str) -> ModelStatus:
+        status = self._status.get(model)
+        if status is None:
+            status = self._status[model] = ModelStatus(model=model)
+        return status
+
+    async def start(self) -> None:
+        """Start probing and warm up the selected model."""
+        self._http = httpx.AsyncClient(timeout=MODEL_PROBE_TIMEOUT)
+        self._probe_task = asyncio.create_task(self._probe_worker())
+        selected = self.config_manager.get_selected_model()
+        if selected:
+            self.warm_up(selected)
+
+    async def stop(self) -> None:
+        """Stop probing and cancel warm-ups in progress."""
+        tasks = [task for task in [self._probe_task, *self._warmups.values()] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._http:
+            await self._http.aclose()
+
+    def _probed_models(self) -> List[str]:
+        models = self.config_manager.get_available_models()
+        return models + [model for model in self.extra_models if model not in models]
+
+    async def _probe_worker(self) -> None:
+        while True:
+            models = self._probed_models()
+            await asyncio.gather(*(self.probe(model) for model in models))
+            now = time.monotonic()
+            for model in models:
+                status = self.status(model)
+                if status.state == READY and status.in_flight == 0 and (
+                    status.last_ttft_at is None or now - status.last_ttft_at >= MODEL_WARMUP_INTERVAL
+                ):
+                    self.warm_up(model)
+            await asyncio.sleep(self.interval)
+
+    async def probe(self, model: str) -> ModelStatus:
+        """Check `model`'s health endpoint and update its routing table entry.
+        
+        A 503 means the server is up but still loading the model. Servers
+        without a health route (404) are taken to be ready since they answered.
+        """
+        status = self.status(model)
+        started = time.perf_counter()
+        try:
+            response = await self._http.get(MODEL_HEALTH_URL.format(model=model))
+            status.probe_ms = round((time.perf_counter() - started) * 1000, 2)
+            if response.status_code == 503:
+                self._set_state(status, LOADING)
+                status.consecutive_failures = 0
+            elif response.status_code < 400 or response.status_code == 404:
+                self._set_state(status, READY)
+                status.consecutive_failures = 0
+                status.last_error = None
+            else:
+                self.record_failure(model, f"Health check returned HTTP {response.status_code}")
+        except Exception as e:
+            self.record_failure(model, f"{type(e).__name__}: {e}")
+        status.last_checked = time.time()
+        return status
+
+    def _set_state(self, status: ModelStatus, state: str) -> None:
+        if status.state != state:
+            logger.info({"message": "Model state changed", "model": status.model, "from": status.state, "to": state})
+            status.state = state
+
+    def record_failure(self, model: str, error: str, down: bool = False) -> None:
+        """Count a failed probe or request; the model is down after repeated failures.
+        
+        Args:
+            model: Model name
+            error: Description of the failure
+            down: Mark the model down right away, e.g. when a turn could not connect to it
+        """
+        status = self.status(model)
+        status.consecutive_failures += 1
+        status.last_error = error
+        if down or status.consecutive_failures >= MODEL_FAILURE_THRESHOLD:
+            self._set_state(status, DOWN)
+
+    def record_ttft(self, model: str, seconds: float) -> None:
+        """Fold a time-to-first-token sample into the model's smoothed TTFT."""
+        status = self.status(model)
+        ttft_ms = seconds * 1000
+        status.ttft_ms = round(ttft_ms if status.ttft_ms is None else
+                               TTFT_SMOOTHING * ttft_ms + (1 - TTFT_SMOOTHING) * status.ttft_ms, 2)
+        status.last_ttft_at = time.monotonic()
+        status.consecutive_failures = 0
+        self._set_state(status, READY)
+
+    def warm_up(self, model: str) -> None:
+        """Send `model` a one-token request in the background unless one is already running."""
+        task = self._warmups.get(model)
+        if task and not task.done():
+            return
+        self._warmups[model] = asyncio.create_task(self._warm_up(model))
+
+    async def _warm_up(self, model: str) -> None:
+        started = time.monotonic()
+        try:
+            async with self.track(model):
+                stream = await self.client(model).chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": "Hi"}],
+                    max_tokens=1,
+                    stream=True
+                )
+                try:
+                    async for _ in self.timed_stream(model, stream, started):
+                        break
+                finally:
+                    await stream.close()
+            self.status(model).warmed_at = time.time()
+            logger.debug({"message": "Warmed up model", "model": model, "ttft_ms": self.status(model).ttft_ms})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning({"message": "Model warm-up failed", "model": model, "error": str(e)})
+            self.record_failure(model, f"Warm-up failed: {e}")
+
+    @asynccontextmanager
+    async def track(self, model: str) -> AsyncIterator[None]:
+        """Count a request as in flight on `model` while the block runs."""
+        status = self.status(model)
+        status.in_flight += 1
+        try:
+            yield
+        finally:
+            status.in_flight -= 1
+
+    async def timed_stream(self, model: str, stream, started: float) -> AsyncIterator[Any]:
+        """Pass a completion stream through, recording the TTFT of its first chunk.
+        
+        Args:
+            model: Model that produces the stream
+            stream: Completion stream
+            started: `time.monotonic()` when the request was sent
+        """
+        first = True
+        async for chunk in stream:
+            if first:
+                self.record_ttft(model, time.monotonic() - started)
+                first = False
+            yield chunk
+
+    def route(self, requested: str) -> str:
+        """Pick the model a turn for `requested` runs on.
+        
+        The requested model is used unless it is down or loading. Otherwise the
+        ready model with the lowest TTFT and fewest turns in flight is used. A
+        loading model with no ready alternative is still used, since it will
+        answer once loaded.
+        
+        Raises:
+            ModelUnavailableError: If the requested model is down and no other model is ready
+        """
+        state = self.status(requested).state
+        if state in (READY, UNKNOWN):
+            return requested
+
+        if MODEL_FAILOVER:
+            ready = [
+                self.status(model) for model in self.config_manager.get_available_models()
+                if model != requested and self.status(model).state == READY
+            ]
+            if ready:
+                best = min(ready, key=lambda status: (status.ttft_ms is None, status.ttft_ms or 0, status.in_flight))
+                logger.warning({
+                    "message": "Routing turn to another model",
+                    "requested": requested,
+                    "requested_state": state,
+                    "model": best.model
+                })
+                return best.model
+
+        if state == LOADING:
+            return requested
+        raise ModelUnavailableError(
+            f"Model {requested} is unavailable: {self.status(requested).last_error or 'health checks failing'}"
+        )
+
+    def available_models(self) -> List[str]:
+        """Return the configured models that are not down."""
+        return [model for model in self.config_manager.get_available_models() if self.status(model).state != DOWN]
+
+    def routing_table(self) -> List[Dict[str, Any]]:
+        """Return the routing table entry of every probed model."""
+        table = []
+        for model in self._probed_models():
+            entry = asdict(self.status(model))
+            entry.pop("last_ttft_at")
+            entry["healthy"] = entry["state"] == READY
+            table.append(entry)
+        return table
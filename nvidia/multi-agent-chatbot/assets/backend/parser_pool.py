@@ -0,0 +1,173 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Process pool for document parsing whose tasks can be killed on timeout.
+
+`concurrent.futures.ProcessPoolExecutor` cannot stop a running task: a
+timeout only stops waiting while the hung worker keeps its slot, so a few
+pathological files can block all parsing. Here every worker process has its
+own pipe, a task that exceeds its timeout gets its worker terminated and
+replaced, and the other workers are unaffected.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+from logger import logger
+
+
+class ParserTimeoutError(TimeoutError):
+    """Raised when a task exceeds its timeout; its worker process was killed."""
+
+
+class ParserCrashedError(RuntimeError):
+    """Raised when a worker process died while running a task."""
+
+
+def _worker_main(conn) -> None:
+    """Run tasks received over `conn` until told to stop."""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args, kwargs = task
+        try:
+            result = (True, fn(*args, **kwargs))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # The result or exception could not be pickled.
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+@dataclass
+class _Worker:
+    process: Any
+    conn: Any
+
+
+class ParserPool(Executor):
+    """Executor running tasks in worker processes that are killed when a task times out."""
+
+    def __init__(self, max_workers: int, mp_context=None):
+        """Start the worker processes.
+
+        Args:
+            max_workers: Number of worker processes
+            mp_context: Multiprocessing context (defaults to "spawn")
+        """
+        self.max_workers = max(1, max_workers)
+        self._ctx = mp_context or multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._dispatch = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="parser-dispatch")
+        self.killed = 0
+        for _ in range(self.max_workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = _Worker(process=process, conn=parent_conn)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _kill(self, worker: _Worker) -> None:
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.process.kill()
+        worker.process.join(5)
+        worker.conn.close()
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)` in a worker process and return its result.
+
+        The timeout counts from when a worker picks the task up, not from
+        when it was queued.
+
+        Raises:
+            ParserTimeoutError: If the task ran longer than `timeout` seconds
+            ParserCrashedError: If the worker process died
+        """
+        if self._shutdown:
+            raise RuntimeError("ParserPool is shut down")
+        worker = self._idle.get()
+        timed_out = False
+        try:
+            worker.conn.send((fn, args, kwargs))
+            if worker.conn.poll(timeout):
+                ok, value = worker.conn.recv()
+            else:
+                timed_out = True
+        except (EOFError, OSError) as e:
+            exitcode = worker.process.exitcode
+            self._kill(worker)
+            self._release(None)
+            raise ParserCrashedError(f"Parser process died (exit code {exitcode}): {e}") from e
+        if timed_out:
+            self._kill(worker)
+            self.killed += 1
+            self._release(None)
+            raise ParserTimeoutError(f"{getattr(fn, '__name__', fn)} exceeded {timeout:g}s")
+        self._release(worker)
+        if ok:
+            return value
+        raise value
+
+    def _release(self, worker: Optional[_Worker]) -> None:
+        """Return `worker` to the idle queue, or a fresh one if it was killed."""
+        if self._shutdown:
+            if worker is not None:
+                self._kill(worker)
+            return
+        self._idle.put(worker if worker is not None else self._spawn())
+
+    def submit(self, fn: Callable, /, *args, timeout: Optional[float] = None, **kwargs) -> Future:
+        """Schedule `fn` and return a future; see `run` for the timeout."""
+        return self._dispatch.submit(self.run, fn, *args, timeout=timeout, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """Stop the worker processes; running tasks are killed unless `wait` is set."""
+        self._shutdown = True
+        self._dispatch.shutdown(wait=wait, cancel_futures=cancel_futures)
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(5 if wait else 0.1)
+            if worker.process.is_alive():
+                self._kill(worker)
+        logger.debug({"message": "Parser pool shut down", "pid": os.getpid(), "killed_tasks": self.killed})
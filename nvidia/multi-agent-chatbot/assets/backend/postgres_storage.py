@@ -14,20 +14,96 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-"""PostgreSQL-based conversation storage with caching and I/O optimization."""
+"""PostgreSQL-based conversation storage with caching and I/O optimization.
+
+Several backend workers can share one database. Every write publishes the
+changed chat on the `conversation_changes` channel and each worker drops its
+cached copy when another worker's change arrives. Caches are only used while
+the listener is connected; until it (re)connects every read goes to Postgres.
+
+Conversations that sit idle are moved to compressed cold storage by
+`ConversationArchive` and restored transparently on their next read.
+"""
 
 import json
+import os
 import time
-from typing import Dict, List, Optional, Any
+import uuid
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 import asyncio
 import asyncpg
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, BaseMessage, ToolMessage
 
+from conversation_archive import ARCHIVE_ENABLED, ConversationArchive
+from images import ImageVariant
 from logger import logger
 
 
+# Versions only move forward, even if another process saved the chat in between. A save
+# that rewrote the history ($5 = $4) marks whatever version it ends up at as rewritten.
+UPSERT_CONVERSATION_SQL = """
+    INSERT INTO conversations (chat_id, messages, message_count, version, rewritten_version)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (chat_id)
+    DO UPDATE SET 
+        messages = EXCLUDED.messages,
+        message_count = EXCLUDED.message_count,
+        version = GREATEST(conversations.version + 1, EXCLUDED.version),
+        rewritten_version = CASE
+            WHEN EXCLUDED.rewritten_version = EXCLUDED.version
+                THEN GREATEST(conversations.version + 1, EXCLUDED.version)
+            ELSE GREATEST(conversations.rewritten_version, EXCLUDED.rewritten_version)
+        END,
+        archived = FALSE,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING version, rewritten_version
+"""
+
+# JSON path to the contents of the user and assistant messages of a conversation.
+SEARCH_CONTENT_PATH = '$[*] ? (@.type == "HumanMessage" || @.type == "AIMessage").content'
+# Words of those messages. jsonb_to_tsvector parses each JSON string on its own, unescaped, so
+# "\nword" is not indexed as "nword" and phrases do not run across messages.
+SEARCH_VECTOR_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION conversation_search_vector(messages jsonb) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT jsonb_to_tsvector('english', jsonb_path_query_array(messages, '{SEARCH_CONTENT_PATH}'), '["string"]')
+    $$
+"""
+# Plain text of those messages for trigram matching: string contents and the text parts of
+# multi-part contents, unescaped, one per line.
+SEARCH_TEXT_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION conversation_search_text(messages jsonb) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT coalesce(string_agg(part #>> '{{}}', E'\\n'), '')
+        FROM (
+            SELECT jsonb_path_query(messages, '{SEARCH_CONTENT_PATH} ? (@.type() == "string")') AS part
+            UNION ALL
+            SELECT jsonb_path_query(messages, '{SEARCH_CONTENT_PATH}[*].text ? (@.type() == "string")')
+        ) AS parts
+    $$
+"""
+# The search columns are stored rather than generated so that archiving, which empties
+# `messages`, leaves them in place and archived chats stay searchable.
+SEARCH_COLUMNS_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION update_conversation_search_columns()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF NOT NEW.archived AND (TG_OP = 'INSERT' OR NEW.messages IS DISTINCT FROM OLD.messages) THEN
+            NEW.search_vector = conversation_search_vector(NEW.messages);
+            NEW.search_text = conversation_search_text(NEW.messages);
+        END IF;
+        RETURN NEW;
+    END;
+    $$ language 'plpgsql'
+"""
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8, MaxFragments=2"
+SEARCH_MATCHES_PER_CHAT = int(os.getenv("SEARCH_MATCHES_PER_CHAT", 3))
+
+CHANGES_CHANNEL = "conversation_changes"
+CACHE_LISTEN_CHECK_INTERVAL = float(os.getenv("CACHE_LISTEN_CHECK_INTERVAL", 5))
+
 @dataclass
 class CacheEntry:
     """Cache entry with TTL support."""
@@ -77,14 +153,27 @@ class PostgreSQLConversationStorage:
         self._metadata_cache: Dict[str, CacheEntry] = {}
         self._image_cache: Dict[str, CacheEntry] = {}
         self._chat_list_cache: Optional[CacheEntry] = None
+        # chat_id -> (version, rewritten_version); see `_bump_version`.
+        self._versions: Dict[str, Tuple[int, int]] = {}
         
         self._pending_saves: Dict[str, List[BaseMessage]] = {}
+        # chat_id -> (version, rewritten_version) the pending save was made at.
+        self._pending_versions: Dict[str, Tuple[int, int]] = {}
         self._save_lock = asyncio.Lock()
         self._batch_save_task: Optional[asyncio.Task] = None
         
         self._cache_hits = 0
         self._cache_misses = 0
         self._db_operations = 0
+        
+        self.worker_id = uuid.uuid4().hex
+        self._listening = False
+        self._listen_task: Optional[asyncio.Task] = None
+        self._invalidations = 0
+        self._trigram_search = False
+        
+        self.archive = ConversationArchive(self)
+        self._archive_task: Optional[asyncio.Task] = None
 
     async def init_pool(self) -> None:
         """Initialize the connection pool and create tables."""
@@ -103,9 +192,15 @@ class PostgreSQLConversationStorage:
             )
             
             await self._create_tables()
+            await self.archive.init()
             logger.debug("PostgreSQL connection pool initialized successfully")
             
             self._batch_save_task = asyncio.create_task(self._batch_save_worker())
+            self._listen_task = asyncio.create_task(self._listen_worker())
+            if ARCHIVE_ENABLED:
+                self._archive_task = asyncio.create_task(self.archive.run())
+            else:
+                self._archive_task = asyncio.create_task(self.archive.index_all_archived())
             
         except Exception as e:
             logger.error(f"Failed to initialize PostgreSQL pool: {e}")
@@ -143,6 +238,20 @@ class PostgreSQLConversationStorage:
 
     async def close(self) -> None:
         """Close the connection pool and cleanup."""
+        if self._archive_task:
+            self._archive_task.cancel()
+            try:
+                await self._archive_task
+            except asyncio.CancelledError:
+                pass
+        
+        if self._listen_task:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+        
         if self._batch_save_task:
             self._batch_save_task.cancel()
             try:
@@ -186,14 +295,80 @@ class PostgreSQLConversationStorage:
                 )
             """)
             
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_variants (
+                    image_id VARCHAR(64) NOT NULL,
+                    variant VARCHAR(16) NOT NULL,
+                    content_type VARCHAR(64) NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    data BYTEA NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP + INTERVAL '1 hour'),
+                    PRIMARY KEY (image_id, variant)
+                )
+            """)
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_image_variants_expires_at ON image_variants(expires_at)")
+            await conn.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS version BIGINT DEFAULT 0")
+            await conn.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS rewritten_version BIGINT DEFAULT 0")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations(updated_at)")
+            await conn.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS archived BOOLEAN DEFAULT FALSE")
+            await conn.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS restored_at TIMESTAMP")
+            await conn.execute(SEARCH_VECTOR_FUNCTION_SQL)
+            await conn.execute(SEARCH_TEXT_FUNCTION_SQL)
+            search_columns = {
+                row['attname']: row['generated']
+                for row in await conn.fetch("""
+                    SELECT attname, attgenerated = 's' AS generated FROM pg_attribute
+                    WHERE attrelid = 'conversations'::regclass
+                      AND attname IN ('search_vector', 'search_text') AND NOT attisdropped
+                """)
+            }
+            # Earlier versions generated search_vector from `messages` and indexed the trigram
+            # text by expression; both were emptied when a chat was archived.
+            await conn.execute("DROP INDEX IF EXISTS idx_conversations_search_trgm")
+            if search_columns.get('search_vector'):
+                await conn.execute("ALTER TABLE conversations ALTER COLUMN search_vector DROP EXPRESSION")
+            await conn.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector")
+            await conn.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_text TEXT")
+            await conn.execute(SEARCH_COLUMNS_FUNCTION_SQL)
+            await conn.execute("DROP TRIGGER IF EXISTS update_conversations_search_columns ON conversations")
+            await conn.execute("""
+                CREATE TRIGGER update_conversations_search_columns
+                    BEFORE INSERT OR UPDATE ON conversations
+                    FOR EACH ROW
+                    EXECUTE FUNCTION update_conversation_search_columns()
+            """)
+            if 'search_text' not in search_columns:
+                # Archived chats are indexed from their archived copies by the archive pass.
+                await conn.execute("""
+                    UPDATE conversations
+                    SET search_vector = conversation_search_vector(messages),
+                        search_text = conversation_search_text(messages)
+                    WHERE NOT archived
+                """)
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_search_vector ON conversations USING GIN (search_vector)")
+            try:
+                await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_conversations_search_text_trgm
+                    ON conversations USING GIN (search_text gin_trgm_ops)
+                """)
+                self._trigram_search = True
+            except asyncpg.PostgresError as e:
+                logger.warning({"message": "pg_trgm unavailable, chat search will not match misspellings", "error": str(e)})
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_images_expires_at ON images(expires_at)")
             
             await conn.execute("""
                 CREATE OR REPLACE FUNCTION update_updated_at_column()
                 RETURNS TRIGGER AS $$
                 BEGIN
-                    NEW.updated_at = CURRENT_TIMESTAMP;
+                    -- Only history writes count as activity, not archiving, restoring or reindexing.
+                    IF NEW.version = OLD.version THEN
+                        NEW.updated_at = OLD.updated_at;
+                    ELSE
+                        NEW.updated_at = CURRENT_TIMESTAMP;
+                    END IF;
                     RETURN NEW;
                 END;
                 $$ language 'plpgsql'
@@ -209,6 +384,79 @@ class PostgreSQLConversationStorage:
                     EXECUTE FUNCTION update_updated_at_column()
             """)
 
+    async def _listen_worker(self) -> None:
+        """Listen for changes made by other workers and drop the affected cache entries."""
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(
+                    host=self.host,
+                    port=self.port,
+                    database=self.database,
+                    user=self.user,
+                    password=self.password
+                )
+                await conn.add_listener(CHANGES_CHANNEL, self._on_change)
+                # Changes made while no listener was attached were missed.
+                self._clear_caches()
+                self._listening = True
+                logger.debug({"message": "Listening for conversation changes", "worker_id": self.worker_id})
+                while True:
+                    await asyncio.sleep(CACHE_LISTEN_CHECK_INTERVAL)
+                    await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning({"message": "Conversation change listener disconnected", "error": str(e)})
+            finally:
+                self._listening = False
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(CACHE_LISTEN_CHECK_INTERVAL)
+
+    def _on_change(self, conn, pid: int, channel: str, payload: str) -> None:
+        """Handle a change notification from any worker, including this one."""
+        try:
+            change = json.loads(payload)
+        except json.JSONDecodeError:
+            return
+        if change.get("worker") == self.worker_id:
+            return
+        self._invalidations += 1
+        chat_id = change.get("chat_id")
+        if chat_id:
+            self._invalidate_cache(chat_id)
+        else:
+            self._clear_caches()
+
+    async def _notify_change(self, conn: asyncpg.Connection, chat_id: Optional[str] = None) -> None:
+        """Tell other workers that `chat_id` (or every chat, if None) changed.
+        
+        Notifications are delivered when the surrounding transaction commits.
+        """
+        payload = json.dumps({"worker": self.worker_id, "chat_id": chat_id})
+        await conn.execute("SELECT pg_notify($1, $2)", CHANGES_CHANNEL, payload)
+
+    def _clear_caches(self) -> None:
+        """Drop every cached conversation, version and chat list; images are immutable and kept."""
+        self._message_cache.clear()
+        self._metadata_cache.clear()
+        self._versions.clear()
+        self._chat_list_cache = None
+
+    def refresh_if_stale(self, chat_id: str, version: Optional[int]) -> None:
+        """Drop the cached history of `chat_id` unless it is at `version`.
+        
+        Args:
+            chat_id: Chat identifier
+            version: Version of the chat currently stored in Postgres, or None if it is not stored
+        """
+        if chat_id in self._pending_saves:
+            return
+        cached = self._versions.get(chat_id)
+        if cached is not None and cached[0] != (version or 0):
+            self._invalidate_cache(chat_id)
+
     def _message_to_dict(self, message: BaseMessage) -> Dict:
         """Convert a message object to a dictionary for storage."""
         result = {
@@ -250,7 +498,12 @@ class PostgreSQLConversationStorage:
 
     def _get_cached_messages(self, chat_id: str) -> Optional[List[BaseMessage]]:
         """Get messages from cache if available and not expired."""
-        cache_entry = self._message_cache.get(chat_id)
+        pending = self._pending_saves.get(chat_id)
+        if pending is not None:
+            self._cache_hits += 1
+            return pending
+        
+        cache_entry = self._message_cache.get(chat_id) if self._listening else None
         if cache_entry and not cache_entry.is_expired():
             self._cache_hits += 1
             return cache_entry.data
@@ -269,6 +522,7 @@ class PostgreSQLConversationStorage:
     def _invalidate_cache(self, chat_id: str) -> None:
         """Invalidate cache entries for a chat."""
         self._message_cache.pop(chat_id, None)
+        self._versions.pop(chat_id, None)
         self._metadata_cache.pop(chat_id, None)
         self._chat_list_cache = None
 
@@ -294,7 +548,7 @@ class PostgreSQLConversationStorage:
         
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow(
-                "SELECT messages FROM conversations WHERE chat_id = $1",
+                "SELECT messages, version, rewritten_version, archived FROM conversations WHERE chat_id = $1",
                 chat_id
             )
             self._db_operations += 1
@@ -303,37 +557,110 @@ class PostgreSQLConversationStorage:
                 return []
             
             messages_data = row['messages']
+            if row['archived']:
+                messages_data = await self.archive.restore(conn, chat_id)
+                self._db_operations += 1
+                if messages_data is None:
+                    return []
             if isinstance(messages_data, str):
                 messages_data = json.loads(messages_data)
             messages = [self._dict_to_message(msg_data) for msg_data in messages_data]
             
+            self._versions[chat_id] = (row['version'] or 0, row['rewritten_version'] or 0)
             self._cache_messages(chat_id, messages)
             
             return messages[-limit:] if limit else messages
 
+    def _extends(self, previous: List[BaseMessage], messages: List[BaseMessage]) -> bool:
+        """Whether `messages` only appends to `previous` (the leading system message may differ)."""
+        if len(messages) < len(previous):
+            return False
+        return all(
+            old is new or self._message_to_dict(old) == self._message_to_dict(new)
+            for old, new in zip(previous[1:], messages[1:len(previous)])
+        )
+
+    async def _bump_version(self, chat_id: str, messages: List[BaseMessage]) -> Tuple[int, int]:
+        """Advance the chat's history version before `messages` replace the cached history.
+        
+        `rewritten_version` records the last version that did not simply append
+        messages; clients synced before it must reload the full history. When the
+        version is not cached (e.g. after an invalidation) it is read from Postgres
+        first, so versions never restart from zero.
+        """
+        if chat_id not in self._versions and chat_id not in self._pending_versions:
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT version, rewritten_version FROM conversations WHERE chat_id = $1",
+                    chat_id
+                )
+            self._db_operations += 1
+            if chat_id not in self._versions:
+                self._versions[chat_id] = (row['version'] or 0, row['rewritten_version'] or 0) if row else (0, 0)
+        version, rewritten_version = self._versions.get(chat_id) or self._pending_versions[chat_id]
+        version += 1
+        previous = self._message_cache.get(chat_id)
+        if previous is None or not self._extends(previous.data, messages):
+            rewritten_version = version
+        self._versions[chat_id] = (version, rewritten_version)
+        return version, rewritten_version
+
+    async def get_history_since(
+        self,
+        chat_id: str,
+        seq: Optional[int] = None,
+        version: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Build a history sync event for a client that has seen the first `seq` messages.
+        
+        Args:
+            chat_id: Chat identifier
+            seq: Number of stored messages the client already has, or None for a full history
+            version: History version the client's messages came from
+            
+        Returns:
+            A "history_delta" event with only the messages after `seq` when the
+            client's copy is still a prefix of the history, otherwise a full
+            "history" event. Both carry the `seq` and `version` to sync from next.
+        """
+        messages = await self.get_messages(chat_id)
+        current_version, rewritten_version = self._versions.get(chat_id, (0, 0))
+        delta = (
+            seq is not None and version is not None
+            and rewritten_version <= version <= current_version
+            and seq <= len(messages)
+        )
+        start = max(seq, 1) if delta else 1
+        return {
+            "type": "history_delta" if delta else "history",
+            "messages": [self._message_to_dict(msg) for msg in messages[start:]],
+            "seq": len(messages),
+            "version": current_version
+        }
+
     async def save_messages(self, chat_id: str, messages: List[BaseMessage]) -> None:
         """Save messages with batching for performance."""
+        versions = await self._bump_version(chat_id, messages)
         async with self._save_lock:
             self._pending_saves[chat_id] = messages.copy()
+            self._pending_versions[chat_id] = versions
         
         self._cache_messages(chat_id, messages)
     
     async def save_messages_immediate(self, chat_id: str, messages: List[BaseMessage]) -> None:
         """Save messages immediately without batching - for critical operations."""
         serialized_messages = [self._message_to_dict(msg) for msg in messages]
+        version, rewritten_version = await self._bump_version(chat_id, messages)
         
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO conversations (chat_id, messages, message_count)
-                VALUES ($1, $2, $3)
-                ON CONFLICT (chat_id)
-                DO UPDATE SET 
-                    messages = EXCLUDED.messages,
-                    message_count = EXCLUDED.message_count,
-                    updated_at = CURRENT_TIMESTAMP
-            """, chat_id, json.dumps(serialized_messages), len(messages))
+            async with conn.transaction():
+                row = await conn.fetchrow(UPSERT_CONVERSATION_SQL, chat_id, json.dumps(serialized_messages), len(messages), version, rewritten_version)
+                await self._notify_change(conn, chat_id)
             self._db_operations += 1
         
+        self._pending_saves.pop(chat_id, None)
+        self._pending_versions.pop(chat_id, None)
+        self._versions[chat_id] = (row['version'], row['rewritten_version'])
         self._cache_messages(chat_id, messages)
         self._chat_list_cache = None
 
@@ -348,22 +675,22 @@ class PostgreSQLConversationStorage:
                         continue
                     
                     saves_to_process = self._pending_saves.copy()
+                    versions_to_process = self._pending_versions.copy()
                     self._pending_saves.clear()
+                    self._pending_versions.clear()
                 
                 async with self.pool.acquire() as conn:
                     async with conn.transaction():
                         for chat_id, messages in saves_to_process.items():
                             serialized_messages = [self._message_to_dict(msg) for msg in messages]
+                            version, rewritten_version = versions_to_process.get(chat_id, (0, 0))
                             
-                            await conn.execute("""
-                                INSERT INTO conversations (chat_id, messages, message_count)
-                                VALUES ($1, $2, $3)
-                                ON CONFLICT (chat_id)
-                                DO UPDATE SET 
-                                    messages = EXCLUDED.messages,
-                                    message_count = EXCLUDED.message_count,
-                                    updated_at = CURRENT_TIMESTAMP
-                            """, chat_id, json.dumps(serialized_messages), len(messages))
+                            row = await conn.fetchrow(
+                                UPSERT_CONVERSATION_SQL,
+                                chat_id, json.dumps(serialized_messages), len(messages), version, rewritten_version
+                            )
+                            self._versions[chat_id] = (row['version'], row['rewritten_version'])
+                            await self._notify_change(conn, chat_id)
                 
                 self._db_operations += len(saves_to_process)
                 if saves_to_process:
@@ -386,10 +713,12 @@ class PostgreSQLConversationStorage:
         """Delete a conversation by chat_id."""
         try:
             async with self.pool.acquire() as conn:
-                result = await conn.execute(
-                    "DELETE FROM conversations WHERE chat_id = $1",
-                    chat_id
-                )
+                async with conn.transaction():
+                    result = await conn.execute(
+                        "DELETE FROM conversations WHERE chat_id = $1",
+                        chat_id
+                    )
+                    await self._notify_change(conn, chat_id)
                 self._db_operations += 1
                 
                 self._invalidate_cache(chat_id)
@@ -401,7 +730,7 @@ class PostgreSQLConversationStorage:
 
     async def list_conversations(self) -> List[str]:
         """List all conversation IDs with caching."""
-        if self._chat_list_cache and not self._chat_list_cache.is_expired():
+        if self._listening and self._chat_list_cache and not self._chat_list_cache.is_expired():
             self._cache_hits += 1
             return self._chat_list_cache.data
         
@@ -422,6 +751,105 @@ class PostgreSQLConversationStorage:
             
             return chat_ids
 
+    async def search_messages(self, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Full-text search over the user and assistant messages of all chats.
+        
+        Chats are matched with `websearch_to_tsquery` syntax (quoted phrases,
+        `or`, `-word`) against the indexed `search_vector` and, when pg_trgm is
+        available, by trigram word similarity so misspelled words still match.
+        Messages waiting in the save batch are not searchable yet. Archived
+        chats are matched on the search columns kept when they were archived;
+        their snippet is taken from that stored text and has no message index.
+        
+        Args:
+            query: Search text
+            limit: Maximum number of chats to return
+            offset: Number of chats to skip, for pagination
+            
+        Returns:
+            The total number of matching chats and one page of them, best match
+            first, each with its best matching messages and highlighted snippets
+        """
+        similarity = "word_similarity($1, c.search_text)" if self._trigram_search else "0"
+        fuzzy_match = "OR $1 <% c.search_text" if self._trigram_search else ""
+        message_similarity = "word_similarity($1, m.value->>'content')" if self._trigram_search else "0"
+        
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT c.chat_id, c.updated_at, c.archived, meta.name,
+                       ts_rank_cd(c.search_vector, q) AS rank,
+                       {similarity} AS similarity,
+                       count(*) OVER () AS total
+                FROM conversations c
+                CROSS JOIN websearch_to_tsquery('english', $1) AS q
+                LEFT JOIN chat_metadata meta ON meta.chat_id = c.chat_id
+                WHERE c.search_vector @@ q {fuzzy_match}
+                ORDER BY rank DESC, similarity DESC, c.updated_at DESC
+                LIMIT $2 OFFSET $3
+            """, query, limit, offset)
+            
+            matches: Dict[str, List[Dict[str, Any]]] = {}
+            if rows:
+                snippet_rows = await conn.fetch(f"""
+                    SELECT r.chat_id, s.message_index, s.type, s.snippet
+                    FROM unnest($2::varchar[]) AS r(chat_id)
+                    CROSS JOIN LATERAL (
+                        (SELECT m.idx - 1 AS message_index,
+                               m.value->>'type' AS type,
+                               ts_headline('english', m.value->>'content', q, '{SEARCH_HEADLINE_OPTIONS}') AS snippet
+                        FROM conversations c
+                        CROSS JOIN jsonb_array_elements(c.messages) WITH ORDINALITY AS m(value, idx)
+                        CROSS JOIN websearch_to_tsquery('english', $1) AS q
+                        WHERE c.chat_id = r.chat_id
+                          AND m.value->>'type' IN ('HumanMessage', 'AIMessage')
+                          AND (to_tsvector('english', m.value->>'content') @@ q OR {message_similarity} > 0.3)
+                        ORDER BY ts_rank_cd(to_tsvector('english', m.value->>'content'), q) DESC,
+                                 {message_similarity} DESC,
+                                 m.idx DESC
+                        LIMIT $3)
+                        UNION ALL
+                        -- Archived chats have no messages to point at; highlight their stored text.
+                        SELECT NULL, NULL, ts_headline('english', c.search_text, q, '{SEARCH_HEADLINE_OPTIONS}')
+                        FROM conversations c
+                        CROSS JOIN websearch_to_tsquery('english', $1) AS q
+                        WHERE c.chat_id = r.chat_id AND c.archived
+                    ) AS s
+                """, query, [row['chat_id'] for row in rows], SEARCH_MATCHES_PER_CHAT)
+                for row in snippet_rows:
+                    matches.setdefault(row['chat_id'], []).append({
+                        "message_index": row['message_index'],
+                        "type": row['type'],
+                        "snippet": row['snippet']
+                    })
+            total = rows[0]['total'] if rows else 0
+            if not rows and offset > 0:
+                # Past the last page; the window count is only available on returned rows.
+                total = await conn.fetchval(f"""
+                    SELECT count(*) FROM conversations c
+                    CROSS JOIN websearch_to_tsquery('english', $1) AS q
+                    WHERE c.search_vector @@ q {fuzzy_match}
+                """, query)
+            self._db_operations += 2
+        
+        return {
+            "query": query,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "results": [
+                {
+                    "chat_id": row['chat_id'],
+                    "name": row['name'] or f"Chat {row['chat_id'][:8]}",
+                    "updated_at": row['updated_at'].isoformat() if row['updated_at'] else None,
+                    "rank": round(float(row['rank']), 6),
+                    "similarity": round(float(row['similarity']), 4),
+                    "archived": bool(row['archived']),
+                    "matches": matches.get(row['chat_id'], [])
+                }
+                for row in rows
+            ]
+        }
+
     async def store_image(self, image_id: str, image_base64: str) -> None:
         """Store base64 image data with TTL."""
         async with self.pool.acquire() as conn:
@@ -468,9 +896,72 @@ class PostgreSQLConversationStorage:
             
             return None
 
+    async def store_image_variants(self, image_id: str, variants: Dict[str, ImageVariant]) -> None:
+        """Store every variant of an image under its handle with a one hour TTL."""
+        async with self.pool.acquire() as conn:
+            await conn.executemany("""
+                INSERT INTO image_variants (image_id, variant, content_type, width, height, data)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (image_id, variant)
+                DO UPDATE SET 
+                    content_type = EXCLUDED.content_type,
+                    width = EXCLUDED.width,
+                    height = EXCLUDED.height,
+                    data = EXCLUDED.data,
+                    created_at = CURRENT_TIMESTAMP,
+                    expires_at = CURRENT_TIMESTAMP + INTERVAL '1 hour'
+            """, [
+                (image_id, name, variant.content_type, variant.width, variant.height, variant.data)
+                for name, variant in variants.items()
+            ])
+            self._db_operations += 1
+        
+        for name, variant in variants.items():
+            if name != "original":
+                self._image_cache[f"{image_id}/{name}"] = CacheEntry(data=variant, timestamp=time.time(), ttl=3600)
+
+    async def touch_image_variants(self, image_id: str) -> Dict[str, Tuple[int, int, int]]:
+        """Extend the TTL of a stored image.
+        
+        Returns:
+            Mapping of variant name to (width, height, bytes), empty if the image is not stored
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                UPDATE image_variants
+                SET expires_at = CURRENT_TIMESTAMP + INTERVAL '1 hour'
+                WHERE image_id = $1 AND expires_at > CURRENT_TIMESTAMP
+                RETURNING variant, width, height, octet_length(data) AS size
+            """, image_id)
+            self._db_operations += 1
+        return {row['variant']: (row['width'], row['height'], row['size']) for row in rows}
+
+    async def get_image_variant(self, image_id: str, variant: str) -> Optional[ImageVariant]:
+        """Retrieve one variant of a stored image, caching the small ones."""
+        key = f"{image_id}/{variant}"
+        cache_entry = self._image_cache.get(key)
+        if cache_entry and not cache_entry.is_expired():
+            self._cache_hits += 1
+            return cache_entry.data
+        
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT content_type, data, width, height FROM image_variants
+                WHERE image_id = $1 AND variant = $2 AND expires_at > CURRENT_TIMESTAMP
+            """, image_id, variant)
+            self._db_operations += 1
+        
+        if not row:
+            return None
+        image = ImageVariant(row['content_type'], bytes(row['data']), row['width'], row['height'])
+        if variant != "original":
+            self._image_cache[key] = CacheEntry(data=image, timestamp=time.time(), ttl=3600)
+            self._cache_misses += 1
+        return image
+
     async def get_chat_metadata(self, chat_id: str) -> Optional[Dict]:
         """Get chat metadata with caching."""
-        cache_entry = self._metadata_cache.get(chat_id)
+        cache_entry = self._metadata_cache.get(chat_id) if self._listening else None
         if cache_entry and not cache_entry.is_expired():
             self._cache_hits += 1
             return cache_entry.data
@@ -502,14 +993,16 @@ class PostgreSQLConversationStorage:
     async def set_chat_metadata(self, chat_id: str, name: str) -> None:
         """Set chat metadata."""
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO chat_metadata (chat_id, name)
-                VALUES ($1, $2)
-                ON CONFLICT (chat_id)
-                DO UPDATE SET 
-                    name = EXCLUDED.name,
-                    updated_at = CURRENT_TIMESTAMP
-            """, chat_id, name)
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO chat_metadata (chat_id, name)
+                    VALUES ($1, $2)
+                    ON CONFLICT (chat_id)
+                    DO UPDATE SET 
+                        name = EXCLUDED.name,
+                        updated_at = CURRENT_TIMESTAMP
+                """, chat_id, name)
+                await self._notify_change(conn, chat_id)
             self._db_operations += 1
         
         self._metadata_cache[chat_id] = CacheEntry(
@@ -524,7 +1017,10 @@ class PostgreSQLConversationStorage:
             result = await conn.execute(
                 "DELETE FROM images WHERE expires_at < CURRENT_TIMESTAMP"
             )
-            self._db_operations += 1
+            variants_result = await conn.execute(
+                "DELETE FROM image_variants WHERE expires_at < CURRENT_TIMESTAMP"
+            )
+            self._db_operations += 2
             
             expired_keys = [
                 key for key, entry in self._image_cache.items()
@@ -534,6 +1030,7 @@ class PostgreSQLConversationStorage:
                 del self._image_cache[key]
             
             deleted_count = int(result.split()[-1]) if result else 0
+            deleted_count += int(variants_result.split()[-1]) if variants_result else 0
             if deleted_count > 0:
                 logger.debug(f"Cleaned up {deleted_count} expired images")
             
@@ -551,7 +1048,9 @@ class PostgreSQLConversationStorage:
             "db_operations": self._db_operations,
             "cached_conversations": len(self._message_cache),
             "cached_metadata": len(self._metadata_cache),
-            "cached_images": len(self._image_cache)
+            "cached_images": len(self._image_cache),
+            "cache_listener_connected": self._listening,
+            "invalidations_received": self._invalidations
         }
 
     def load_conversation_history(self, chat_id: str) -> List[Dict]:
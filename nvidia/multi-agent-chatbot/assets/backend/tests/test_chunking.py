@@ -0,0 +1,94 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for the token-aware structural chunker in chunking.py."""
+import pytest
+from langchain_core.documents import Document
+
+from chunking import StructuralChunker, approximate_token_count, load_token_counter, parse_blocks
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def make_chunker(**kwargs):
+    kwargs.setdefault("chunk_tokens", 16)
+    kwargs.setdefault("overlap_tokens", 0)
+    kwargs.setdefault("min_tokens", 16)
+    return StructuralChunker(token_counter=count_words, **kwargs)
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def chunk(chunker, text):
+    return chunker.split_documents([Document(page_content=text, metadata={"source": "doc.md"})])
+
+
+def test_parse_blocks_recognises_structure():
+    text = "# Title\n\nSome prose.\n\n```python\nx = 1\n```\n\n| a | b |\n|---|---|\n| 1 | 2 |\n"
+    assert [block.kind for block in parse_blocks(text)] == ["heading", "paragraph", "code", "table"]
+
+
+def test_trailing_heading_moves_to_next_chunk_without_duplication():
+    text = f"# Intro\n\n{words('a', 10)}\n\n## Next\n\n{words('b', 10)}"
+
+    chunks = chunk(make_chunker(), text)
+
+    assert [doc.page_content for doc in chunks] == [
+        f"# Intro\n\n{words('a', 10)}",
+        f"## Next\n\n{words('b', 10)}",
+    ]
+    assert chunks[1].metadata["section"] == "Intro > Next"
+
+
+def test_heading_at_end_of_document_is_kept():
+    chunks = chunk(make_chunker(), f"{words('a', 4)}\n\n# Appendix")
+    assert [doc.page_content for doc in chunks] == [f"{words('a', 4)}\n\n# Appendix"]
+
+
+def test_chunks_stay_within_budget_and_carry_overlap():
+    chunker = make_chunker(overlap_tokens=4)
+    text = "\n\n".join(f"{words(p, 3)}." for p in "abcdefgh")
+
+    chunks = chunk(chunker, text)
+
+    assert len(chunks) > 1
+    assert all(doc.metadata["token_count"] <= 16 for doc in chunks)
+    # The last paragraph of a chunk opens the next one.
+    assert chunks[1].page_content.startswith(chunks[0].page_content.split("\n\n")[-1])
+
+
+def test_oversized_table_repeats_its_header():
+    rows = "\n".join(f"| {i} | {words('v', 4)} |" for i in range(8))
+    chunks = chunk(make_chunker(), f"| id | value |\n|---|---|\n{rows}")
+
+    assert len(chunks) > 1
+    assert all(doc.page_content.startswith("| id | value |\n|---|---|\n") for doc in chunks)
+
+
+def test_missing_tokenizer_file_falls_back_without_network(tmp_path, monkeypatch):
+    tokenizers = pytest.importorskip("tokenizers")
+
+    hub_calls = []
+    monkeypatch.setattr(tokenizers.Tokenizer, "from_pretrained", lambda *args, **kwargs: hub_calls.append(args))
+    count, name = load_token_counter(str(tmp_path / "missing-tokenizer.json"))
+
+    assert hub_calls == []
+    assert name == "approximate"
+    assert count is approximate_token_count
@@ -0,0 +1,83 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for operation replay across processes in config.py."""
+import json
+import os
+
+import pytest
+
+from config import ConfigManager
+
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODELS", "model-a,model-b")
+    return str(tmp_path / "config.json")
+
+
+def file_sources(path):
+    with open(path) as f:
+        return json.load(f)["sources"]
+
+
+def test_concurrent_writers_keep_each_others_changes(config_path):
+    first = ConfigManager(config_path, write_delay=0, reload_interval=0)
+    second = ConfigManager(config_path, write_delay=0, reload_interval=0)
+
+    first.add_sources(["a"])
+    second.add_sources(["b"])
+    first.updated_selected_model("model-b")
+
+    assert file_sources(config_path) == ["a", "b"]
+    assert second.get_selected_model() == "model-b"
+    assert first.get_sources() == ["a", "b"]
+
+
+def test_pending_updates_are_replayed_on_reload_and_flush(config_path):
+    debounced = ConfigManager(config_path, write_delay=60, reload_interval=0)
+    other = ConfigManager(config_path, write_delay=0, reload_interval=0)
+
+    debounced.add_sources(["a"])
+    assert file_sources(config_path) == []
+
+    other.add_sources(["b"])
+    # The other process's change is adopted without losing the unsaved one.
+    assert debounced.get_sources() == ["b", "a"]
+
+    debounced.flush()
+    assert file_sources(config_path) == ["b", "a"]
+    assert other.get_sources() == ["b", "a"]
+
+
+def test_failed_write_keeps_updates_pending(config_path, monkeypatch):
+    manager = ConfigManager(config_path, write_delay=60, reload_interval=0)
+    manager.remove_source("missing")
+    manager.add_sources(["a"])
+
+    def disk_full(config):
+        raise OSError("disk full")
+
+    write_file = manager._write_file
+    monkeypatch.setattr(manager, "_write_file", disk_full)
+    manager.flush()
+    assert file_sources(config_path) == []
+    assert manager.get_sources() == ["a"]
+
+    monkeypatch.setattr(manager, "_write_file", write_file)
+    manager.flush()
+    assert file_sources(config_path) == ["a"]
+    assert not [name for name in os.listdir(os.path.dirname(config_path)) if name.endswith(".tmp")]
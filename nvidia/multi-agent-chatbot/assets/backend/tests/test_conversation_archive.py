@@ -0,0 +1,93 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for keeping archived chats searchable, against fake connections."""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from conversation_archive import ConversationArchive, compress
+from postgres_storage import PostgreSQLConversationStorage
+
+
+class FakeConnection:
+    def __init__(self, fetches):
+        self.fetches = list(fetches)
+        self.queries = []
+        self.updates = []
+
+    async def fetch(self, query, *args):
+        self.queries.append(query)
+        return self.fetches.pop(0)
+
+    async def executemany(self, query, args):
+        self.queries.append(query)
+        self.updates.extend(args)
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+class FakeStorage:
+    def __init__(self, conn):
+        self.pool = FakePool(conn)
+
+
+MESSAGES = [{"type": "HumanMessage", "content": "where is the invoice"}]
+
+
+def test_chats_archived_without_search_columns_are_indexed_from_the_archive():
+    rows = [{"chat_id": f"chat-{i}", "data": compress(json.dumps(MESSAGES).encode("utf-8"))} for i in range(2)]
+    conn = FakeConnection([rows, []])
+    archive = ConversationArchive(FakeStorage(conn), batch_size=2)
+
+    asyncio.run(archive.index_all_archived())
+
+    assert [chat_id for chat_id, _ in conn.updates] == ["chat-0", "chat-1"]
+    assert all(json.loads(payload) == MESSAGES for _, payload in conn.updates)
+    # The update only touches chats that are still archived.
+    assert "AND archived" in conn.queries[1]
+    assert len(conn.queries) == 3
+
+
+def test_archived_chat_is_returned_with_its_stored_snippet():
+    updated_at = datetime(2026, 1, 1)
+    chat_rows = [{
+        "chat_id": "archived-chat", "updated_at": updated_at, "archived": True, "name": None,
+        "rank": 0.5, "similarity": 0, "total": 1
+    }]
+    snippet_rows = [{
+        "chat_id": "archived-chat", "message_index": None, "type": None,
+        "snippet": "where is the <mark>invoice</mark>"
+    }]
+    conn = FakeConnection([chat_rows, snippet_rows])
+    storage = PostgreSQLConversationStorage()
+    storage.pool = FakePool(conn)
+
+    result = asyncio.run(storage.search_messages("invoice"))
+
+    assert result["total"] == 1
+    [chat] = result["results"]
+    assert chat["archived"] is True
+    assert chat["matches"] == [{"message_index": None, "type": None, "snippet": "where is the <mark>invoice</mark>"}]
+    assert "c.archived" in conn.queries[1]
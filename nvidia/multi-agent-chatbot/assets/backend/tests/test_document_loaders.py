@@ -0,0 +1,54 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for the tiered file parsers in document_loaders.py."""
+import pytest
+
+from document_loaders import extract_pdf_pages, parse_file
+from parser_pool import ParserPool
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ParserPool(max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_text_file_is_parsed_in_the_pool(tmp_path, pool):
+    path = tmp_path / "notes.md"
+    path.write_text("# Notes\n\nSome text.\n")
+
+    parsed = parse_file(str(path), "notes.md", pool)
+
+    assert parsed.parser == "text"
+    assert [doc.page_content for doc in parsed.documents] == ["# Notes\n\nSome text.\n"]
+    assert parsed.documents[0].metadata["source"] == "notes.md"
+
+
+def test_blank_pages_are_kept_in_page_order(tmp_path):
+    pypdf = pytest.importorskip("pypdf")
+    writer = pypdf.PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=200, height=200)
+    path = tmp_path / "blank.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+
+    pages = extract_pdf_pages(str(path), 0, None)
+
+    assert [page.metadata["page_number"] for page in pages] == [1, 2, 3]
+    assert [page.metadata["page_number"] for page in extract_pdf_pages(str(path), 1, 3)] == [2, 3]
@@ -0,0 +1,139 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for the SQLite embedding cache and the caching embeddings wrapper."""
+import asyncio
+import sqlite3
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import ROW_OVERHEAD_BYTES, CachedEmbeddings, EmbeddingCache, text_key
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic embeddings that record which texts were embedded."""
+
+    model = "test-model"
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def _vector(self, text):
+        rng = np.random.default_rng(sum(text.encode("utf-8")))
+        return rng.standard_normal(self.dim).tolist()
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), flush_interval=3600)
+
+
+def test_repeated_texts_are_embedded_once(cache):
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, cache)
+
+    first = embeddings.embed_documents(["a", "b", "a"])
+    second = embeddings.embed_documents(["b", "c", "a"])
+
+    assert inner.calls == [["a", "b"], ["c"]]
+    assert first[0] == first[2] == second[2]
+    assert first[1] == second[0]
+
+
+def test_hits_and_misses_have_the_same_precision(cache):
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, cache)
+
+    miss = embeddings.embed_query("hello")
+    hit = embeddings.embed_query("hello")
+
+    assert miss == hit
+    assert miss == np.asarray(inner._vector("hello"), dtype=np.float16).astype(np.float32).tolist()
+
+
+def test_async_path_uses_the_cache(cache):
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, cache)
+
+    async def run():
+        await embeddings.aembed_documents(["x", "y"])
+        return await embeddings.aembed_documents(["y", "x", "z"])
+
+    vectors = asyncio.run(run())
+
+    assert inner.calls == [["x", "y"], ["z"]]
+    assert len(vectors) == 3
+
+
+def test_reads_do_not_write_until_flushed(cache):
+    cache.put_many("m", ["a"], [[0.5, 0.25]])
+    stored_access = sqlite3.connect(cache.path).execute("SELECT last_access FROM embeddings").fetchone()[0]
+
+    assert cache.get_many("m", ["a", "b"]) == {text_key("a"): [0.5, 0.25]}
+    conn = sqlite3.connect(cache.path)
+    assert conn.execute("SELECT hits, misses FROM cache_stats").fetchone() == (0, 0)
+    assert conn.execute("SELECT last_access FROM embeddings").fetchone()[0] == stored_access
+
+    cache.flush()
+
+    assert conn.execute("SELECT hits, misses FROM cache_stats").fetchone() == (1, 1)
+    assert conn.execute("SELECT last_access FROM embeddings").fetchone()[0] >= stored_access
+
+
+def test_buffered_accesses_flush_after_entry_threshold(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), flush_interval=3600, flush_entries=2)
+    cache.put_many("m", ["a", "b"], [[1.0], [2.0]])
+
+    cache.get_many("m", ["a"])
+    cache.get_many("m", ["b"])
+
+    hits = sqlite3.connect(cache.path).execute("SELECT hits FROM cache_stats").fetchone()[0]
+    assert hits == 2
+
+
+def test_eviction_is_bounded_by_bytes_and_keeps_recent_entries(tmp_path):
+    dim = 64
+    row_bytes = dim * 2 + ROW_OVERHEAD_BYTES
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=row_bytes * 10, flush_interval=3600)
+    texts = [f"text {i}" for i in range(10)]
+    cache.put_many("m", texts, [[float(i)] * dim for i in range(10)])
+    cache.get_many("m", ["text 0"])
+    cache.flush()
+
+    cache.put_many("m", ["text 10", "text 11"], [[10.0] * dim, [11.0] * dim])
+    cache.evict()
+
+    stats = cache.get_stats()
+    assert stats["size_bytes"] <= cache.max_bytes * 0.9
+    assert stats["entries"] == 9
+    remaining = cache.get_many("m", texts + ["text 10", "text 11"])
+    assert text_key("text 0") in remaining
+    assert text_key("text 10") in remaining
+    assert text_key("text 11") in remaining
+    assert sum(text_key(text) not in remaining for text in texts[1:]) == 3
@@ -0,0 +1,140 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for request batching, retries and the async client in embeddings.py."""
+import asyncio
+import json
+
+import httpx
+import pytest
+import requests
+
+from embeddings import CustomEmbeddings, EmbeddingServerError
+
+
+def embedding_payload(inputs):
+    return {"data": [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(inputs)]}
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"status {self.status_code}", response=self)
+
+    def json(self):
+        return self._data
+
+
+def test_batches_respect_count_and_byte_budget():
+    embeddings = CustomEmbeddings(host="http://test", max_batch_size=3, max_batch_bytes=10)
+    texts = ["aaaa", "bbbb", "cc", "d", "e", "ffffffffffff", "g"]
+
+    ranges = embeddings._batches(texts)
+
+    assert ranges == [(0, 3), (3, 5), (5, 6), (6, 7)]
+    assert [i for start, end in ranges for i in range(start, end)] == list(range(len(texts)))
+
+
+def test_embed_documents_keeps_input_order_across_batches():
+    embeddings = CustomEmbeddings(host="http://test", max_batch_size=2, max_concurrency=3)
+    requests_seen = []
+
+    def post(url, json, timeout):
+        requests_seen.append(list(json["input"]))
+        return FakeResponse(200, embedding_payload(json["input"]))
+
+    embeddings._session.post = post
+    texts = ["a" * n for n in range(1, 8)]
+
+    vectors = embeddings.embed_documents(texts)
+
+    assert vectors == [[float(n)] for n in range(1, 8)]
+    assert sorted(len(batch) for batch in requests_seen) == [1, 2, 2, 2]
+    embeddings.close()
+
+
+def test_retries_transient_status_then_succeeds():
+    embeddings = CustomEmbeddings(host="http://test", max_retries=2, backoff_base=0)
+    statuses = [503, 429, 200]
+
+    def post(url, json, timeout):
+        status = statuses.pop(0)
+        return FakeResponse(status, embedding_payload(json["input"]) if status == 200 else None)
+
+    embeddings._session.post = post
+
+    assert embeddings.embed_query("abc") == [3.0]
+    assert statuses == []
+
+
+def test_client_error_is_not_retried():
+    embeddings = CustomEmbeddings(host="http://test", max_retries=3, backoff_base=0)
+    calls = []
+
+    def post(url, json, timeout):
+        calls.append(1)
+        return FakeResponse(400)
+
+    embeddings._session.post = post
+
+    with pytest.raises(EmbeddingServerError):
+        embeddings.embed_query("abc")
+    assert len(calls) == 1
+
+
+def test_async_path_retries_and_preserves_order():
+    embeddings = CustomEmbeddings(host="http://test", max_batch_size=2, max_retries=1, backoff_base=0)
+    failed = []
+
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        if not failed:
+            failed.append(inputs)
+            return httpx.Response(502)
+        return httpx.Response(200, json=embedding_payload(inputs))
+
+    async def run():
+        transport = httpx.MockTransport(handler)
+        embeddings._async_client = httpx.AsyncClient(transport=transport)
+        embeddings._async_semaphore = asyncio.Semaphore(2)
+        embeddings._async_loop = asyncio.get_running_loop()
+        try:
+            return await embeddings.aembed_documents(["a", "bb", "ccc", "dddd", "eeeee"])
+        finally:
+            await embeddings.aclose()
+
+    assert asyncio.run(run()) == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert len(failed) == 1
+
+
+def test_async_client_from_another_loop_is_closed():
+    embeddings = CustomEmbeddings(host="http://test")
+
+    async def get_client():
+        client, _ = await embeddings._get_async_client()
+        return client
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+
+    assert first is not second
+    assert first.is_closed
+    assert not second.is_closed
+    asyncio.run(second.aclose())
@@ -0,0 +1,83 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for the SSRF checks of the image fetcher in tools/mcp_servers/image_understanding.py."""
+import asyncio
+
+import httpx
+import pytest
+
+from tools.mcp_servers.image_understanding import ImageFetcher, is_public_address
+
+
+PUBLIC_URL = "http://93.184.216.34/cat.png"
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.1.2.3", "192.168.0.10", "169.254.169.254", "100.64.0.1", "::1", "fe80::1", "::ffff:10.0.0.1", "0.0.0.0"])
+def test_private_and_reserved_addresses_are_not_public(address):
+    assert not is_public_address(address)
+
+
+def test_global_addresses_are_public():
+    assert is_public_address("93.184.216.34")
+    assert is_public_address("2606:2800:220:1:248:1893:25c8:1946")
+
+
+def make_fetcher(handler, **kwargs):
+    fetcher = ImageFetcher(**kwargs)
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return fetcher
+
+
+@pytest.mark.parametrize("url", ["http://127.0.0.1/img.png", "http://169.254.169.254/latest/meta-data", "http://[::1]:8080/x"])
+def test_private_urls_are_refused_before_connecting(url):
+    requests = []
+    fetcher = make_fetcher(lambda request: requests.append(request) or httpx.Response(200, content=b"x"))
+
+    with pytest.raises(ValueError, match="private or reserved"):
+        asyncio.run(fetcher._download(url))
+    assert requests == []
+
+
+def test_redirect_to_private_address_is_refused():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(302, headers={"location": "http://169.254.169.254/latest/meta-data"})
+
+    with pytest.raises(ValueError, match="private or reserved"):
+        asyncio.run(make_fetcher(handler)._download(PUBLIC_URL))
+    assert len(requests) == 1
+
+
+def test_public_url_is_fetched_with_its_host_header():
+    def handler(request):
+        if request.url.path == "/old.png":
+            return httpx.Response(301, headers={"location": "/cat.png"})
+        return httpx.Response(200, content=b"image bytes")
+
+    seen = []
+    fetcher = make_fetcher(lambda request: seen.append(request) or handler(request))
+
+    assert asyncio.run(fetcher._download("http://93.184.216.34/old.png")) == b"image bytes"
+    assert [str(request.url) for request in seen] == ["http://93.184.216.34/old.png", PUBLIC_URL]
+    assert all(request.headers["host"] == "93.184.216.34" for request in seen)
+
+
+def test_private_urls_allowed_when_configured():
+    fetcher = make_fetcher(lambda request: httpx.Response(200, content=b"ok"), allow_private=True)
+    assert asyncio.run(fetcher._download("http://127.0.0.1/img.png")) == b"ok"
@@ -0,0 +1,329 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for the staged ingestion pipeline in ingestion.py."""
+import asyncio
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import ingestion
+from ingestion import FileProgress, IngestionJob, IngestionPipeline
+from ingestion_manifest import IngestionManifest, hash_file, hash_text
+
+
+def make_pipeline(**kwargs):
+    return IngestionPipeline(vector_store=None, config_manager=None, **kwargs)
+
+
+def finished_job(task_id, finished_at):
+    job = IngestionJob(task_id=task_id, files={}, status="completed")
+    job.finished_at = finished_at
+    return job
+
+
+def test_finished_jobs_are_pruned_by_age_and_count():
+    pipeline = make_pipeline(job_retention_seconds=60, max_finished_jobs=2)
+    now = time.time()
+    pipeline.jobs = {
+        "expired": finished_job("expired", now - 120),
+        "old": finished_job("old", now - 30),
+        "mid": finished_job("mid", now - 20),
+        "new": finished_job("new", now - 10),
+        "running": IngestionJob(task_id="running", files={"a": FileProgress("a", "a")}, status="processing"),
+    }
+
+    pipeline._prune_jobs()
+
+    assert set(pipeline.jobs) == {"mid", "new", "running"}
+
+
+class FakeConfig:
+    def __init__(self):
+        self.sources = []
+
+
+class FakeConfigManager:
+    def __init__(self):
+        self.config = FakeConfig()
+
+    def read_config(self):
+        return self.config
+
+    def add_sources(self, sources):
+        self.config.sources.extend(sources)
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+
+class FakeVectorStore:
+    """In-memory stand-in for VectorStore: rows are kept per source by chunk hash."""
+
+    supports_chunk_hashes = True
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.embeddings = FakeEmbeddings()
+        self.rows = {}
+        self.metadata_updates = []
+
+    def split_documents(self, documents):
+        return [
+            Document(page_content=part, metadata=dict(doc.metadata))
+            for doc in documents for part in doc.page_content.split("\n\n") if part.strip()
+        ]
+
+    def insert_embeddings(self, texts, vectors, metadatas):
+        for text, metadata in zip(texts, metadatas):
+            self.rows.setdefault(metadata["source"], {})[metadata["chunk_hash"]] = dict(metadata, text=text)
+
+    def delete_source_chunks(self, source, chunk_hashes=None):
+        rows = self.rows.get(source, {})
+        for chunk_hash in list(rows) if chunk_hashes is None else chunk_hashes:
+            rows.pop(chunk_hash, None)
+
+    def update_chunk_metadata(self, source, chunk_hashes, metadata):
+        self.metadata_updates.append((source, list(chunk_hashes)))
+        for chunk_hash in chunk_hashes:
+            self.rows[source][chunk_hash].update(metadata)
+        return len(chunk_hashes)
+
+    def flush_store(self, force=False):
+        return True
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    store = FakeVectorStore(IngestionManifest(path=str(tmp_path / "manifest.sqlite3")))
+    return IngestionPipeline(store, FakeConfigManager(), parse_workers=1)
+
+
+def write_upload(tmp_path, upload_dir, name, paragraphs):
+    directory = tmp_path / upload_dir
+    directory.mkdir(exist_ok=True)
+    path = directory / name
+    path.write_text("\n\n".join(paragraphs))
+    return str(path)
+
+
+async def ingest(pipeline, task_id, paths):
+    await pipeline.submit(task_id, paths)
+    for _ in range(600):
+        status = await pipeline.get_status(task_id)
+        if status["status"] not in ("queued", "processing", "flushing"):
+            return status
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {task_id} did not finish: {status}")
+
+
+def test_reupload_embeds_only_new_chunks_and_refreshes_kept_metadata(pipeline, tmp_path):
+    store = pipeline.vector_store
+
+    async def run():
+        await pipeline.start()
+        try:
+            first = write_upload(tmp_path, "t1", "a.txt", ["alpha", "beta", "gamma"])
+            status = await ingest(pipeline, "t1", [first])
+            assert status["files"][0]["state"] == "indexed"
+            assert sorted(store.embeddings.embedded) == ["alpha", "beta", "gamma"]
+
+            same = write_upload(tmp_path, "t2", "a.txt", ["alpha", "beta", "gamma"])
+            status = await ingest(pipeline, "t2", [same])
+            assert status["files"][0]["state"] == "unchanged"
+            assert len(store.embeddings.embedded) == 3
+
+            changed = write_upload(tmp_path, "t3", "a.txt", ["alpha", "beta", "delta", "alpha"])
+            status = await ingest(pipeline, "t3", [changed])
+            file_status = status["files"][0]
+            assert (file_status["new_chunks"], file_status["deleted_chunks"]) == (1, 1)
+            return changed
+        finally:
+            await pipeline.stop()
+
+    changed = asyncio.run(run())
+
+    rows = store.rows["a.txt"]
+    assert sorted(row["text"] for row in rows.values()) == ["alpha", "beta", "delta"]
+    assert store.embeddings.embedded[3:] == ["delta"]
+    assert {row["file_path"] for row in rows.values()} == {changed}
+    assert {row["content_hash"] for row in rows.values()} == {hash_file(changed)}
+    assert store.metadata_updates == [("a.txt", sorted([hash_text("alpha"), hash_text("beta")]))]
+    assert store.manifest.get_chunk_hashes("a.txt") == {hash_text(t) for t in ("alpha", "beta", "delta")}
+
+
+def test_source_lock_only_blocks_the_same_source(pipeline, tmp_path):
+    async def run():
+        await pipeline.start()
+        try:
+            lock = pipeline._source_locks.setdefault("a.txt", asyncio.Lock())
+            await lock.acquire()
+            blocked = write_upload(tmp_path, "t1", "a.txt", ["alpha"])
+            other = write_upload(tmp_path, "t2", "b.txt", ["beta"])
+            await pipeline.submit("t1", [blocked])
+
+            status = await ingest(pipeline, "t2", [other])
+            assert status["status"] == "completed"
+            # The blocked file was parsed and chunked but waits for the lock before its diff.
+            assert (await pipeline.get_status("t1"))["files"][0]["state"] == "chunking"
+
+            lock.release()
+            for _ in range(600):
+                if (await pipeline.get_status("t1"))["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+            return (await pipeline.get_status("t1"))["status"]
+        finally:
+            await pipeline.stop()
+
+    assert asyncio.run(run()) == "completed"
+    assert set(pipeline.vector_store.rows) == {"a.txt", "b.txt"}
+
+
+class FailingJobStore:
+    lease_seconds = 30
+
+    async def init(self):
+        pass
+
+    async def create_job(self, task_id, status, files):
+        raise ConnectionError("postgres is down")
+
+    async def update_file(self, task_id, row):
+        raise ConnectionError("postgres is down")
+
+    async def update_status(self, task_id, status):
+        raise ConnectionError("postgres is down")
+
+    async def renew_leases(self):
+        pass
+
+    async def claim_expired_jobs(self):
+        return []
+
+    async def acquire_source(self, source, task_id):
+        raise ConnectionError("postgres is down")
+
+    async def release_source(self, source, task_id):
+        raise ConnectionError("postgres is down")
+
+
+class LeasingJobStore(FailingJobStore):
+    """Job store whose source leases are held in memory, shared as if by several workers."""
+
+    def __init__(self, leases):
+        self.leases = leases
+
+    async def create_job(self, task_id, status, files):
+        pass
+
+    async def update_file(self, task_id, row):
+        pass
+
+    async def update_status(self, task_id, status):
+        pass
+
+    async def acquire_source(self, source, task_id):
+        return self.leases.setdefault(source, task_id) == task_id
+
+    async def release_source(self, source, task_id):
+        if self.leases.get(source) == task_id:
+            del self.leases[source]
+
+
+def test_job_store_errors_do_not_fail_ingestion(pipeline, tmp_path):
+    pipeline.job_store = FailingJobStore()
+
+    async def run():
+        await pipeline.start()
+        try:
+            return await ingest(pipeline, "t1", [write_upload(tmp_path, "t1", "a.txt", ["alpha"])])
+        finally:
+            await pipeline.stop()
+
+    assert asyncio.run(run())["status"] == "completed"
+    assert "a.txt" in pipeline.vector_store.rows
+
+
+def test_source_leased_by_another_worker_waits_without_blocking_other_sources(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "INGEST_SOURCE_LEASE_POLL_SECONDS", 0.01)
+    # Another worker is indexing a.txt.
+    leases = {"a.txt": "other-worker-task"}
+    pipeline.job_store = LeasingJobStore(leases)
+
+    async def run():
+        await pipeline.start()
+        try:
+            await pipeline.submit("t1", [write_upload(tmp_path, "t1", "a.txt", ["alpha"])])
+            status = await ingest(pipeline, "t2", [write_upload(tmp_path, "t2", "b.txt", ["beta"])])
+            assert status["status"] == "completed"
+            assert (await pipeline.get_status("t1"))["files"][0]["state"] == "chunking"
+            assert "a.txt" not in pipeline.vector_store.rows
+
+            del leases["a.txt"]
+            for _ in range(600):
+                if (await pipeline.get_status("t1"))["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+            return (await pipeline.get_status("t1"))["status"]
+        finally:
+            await pipeline.stop()
+
+    assert asyncio.run(run()) == "completed"
+    assert set(pipeline.vector_store.rows) == {"a.txt", "b.txt"}
+    # Both uploads released their leases once indexed.
+    assert leases == {}
+
+
+class PolledJobStore:
+    """Job store for a job run by another worker, changing state after a few reads."""
+
+    def __init__(self, reads_before_done):
+        self.reads = 0
+        self.reads_before_done = reads_before_done
+        self.started_at = time.time()
+
+    async def get_job(self, task_id):
+        self.reads += 1
+        done = self.reads > self.reads_before_done
+        file_row = FileProgress(
+            filename="a.txt",
+            file_path="/uploads/a.txt",
+            state="indexed" if done else "embedding",
+            started_at=self.started_at,
+            finished_at=time.time() if done else None
+        ).to_row()
+        return {"task_id": task_id, "status": "completed" if done else "processing", "files": [file_row]}
+
+
+def test_polled_events_are_only_sent_when_the_job_changes():
+    pipeline = make_pipeline(job_store=PolledJobStore(reads_before_done=4))
+
+    async def run():
+        return [event async for event in pipeline.events("remote", poll_interval=0.01)]
+
+    events = asyncio.run(run())
+
+    # The in-progress file's elapsed time grows on every poll without counting as a change.
+    assert [event["status"] for event in events] == ["processing", "completed"]
+    assert pipeline.job_store.reads == 5
@@ -0,0 +1,180 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for persistent MCP session reconnects in client.py."""
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+
+import anyio
+import pytest
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, ErrorData
+
+from client import MCPClient, PersistentSession
+
+
+class FakeSession:
+    def __init__(self, number, error=None):
+        self.number = number
+        self.error = error
+        self.calls = 0
+
+    async def call_tool(self, name, arguments, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return f"{name} on session {self.number}"
+
+
+class FakeServers:
+    """Stands in for MultiServerMCPClient; each session() opens the next scripted session."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.opened = []
+        self.closed = []
+
+    @asynccontextmanager
+    async def session(self, server_name):
+        session = FakeSession(len(self.opened) + 1, self.errors.pop(0) if self.errors else None)
+        self.opened.append(session)
+        try:
+            yield session
+        finally:
+            self.closed.append(session.number)
+
+
+def make_client(servers):
+    client = MCPClient(persistent_servers=["code-generation-server"])
+    client.server_configs["code-generation-server"]["transport"] = "fake"
+    client.mcp_client = servers
+    return client
+
+
+def test_unsent_request_reconnects_and_retries():
+    async def run():
+        servers = FakeServers(anyio.ClosedResourceError())
+        client = make_client(servers)
+        result = await PersistentSession(client, "code-generation-server").call_tool("write_code", {})
+        await asyncio.sleep(0)
+        await client.close()
+        return servers, result
+
+    servers, result = asyncio.run(run())
+    assert result == "write_code on session 2"
+    assert [session.calls for session in servers.opened] == [1, 1]
+    assert servers.closed == [1, 2]
+
+
+def test_connection_lost_mid_call_is_not_retried_but_next_call_reconnects():
+    async def run():
+        servers = FakeServers(McpError(ErrorData(code=CONNECTION_CLOSED, message="Connection closed")))
+        client = make_client(servers)
+        session = PersistentSession(client, "code-generation-server")
+        with pytest.raises(McpError):
+            await session.call_tool("write_code", {})
+        result = await session.call_tool("write_code", {})
+        await client.close()
+        return servers, result
+
+    servers, result = asyncio.run(run())
+    assert result == "write_code on session 2"
+    assert [session.calls for session in servers.opened] == [1, 1]
+
+
+def test_tool_errors_keep_the_session():
+    async def run():
+        servers = FakeServers(ValueError("bad arguments"))
+        client = make_client(servers)
+        with pytest.raises(ValueError):
+            await PersistentSession(client, "code-generation-server").call_tool("write_code", {})
+        await client.close()
+        return servers
+
+    servers = asyncio.run(run())
+    assert len(servers.opened) == 1
+
+
+SLOW_SERVER = """
+import asyncio
+import sys
+
+from mcp.server.fastmcp import Context, FastMCP
+
+mcp = FastMCP("slow-server")
+
+
+@mcp.tool()
+async def echo(text: str) -> str:
+    return text
+
+
+@mcp.tool()
+async def wait_forever(ctx: Context) -> str:
+    await ctx.report_progress(0, None, "started")
+    try:
+        await asyncio.sleep(60)
+    except asyncio.CancelledError:
+        with open(sys.argv[1], "w") as f:
+            f.write("cancelled")
+        raise
+    return "finished"
+
+
+mcp.run()
+"""
+
+
+def test_cancelling_a_streaming_call_cancels_it_on_the_persistent_server(tmp_path):
+    script = tmp_path / "slow_server.py"
+    script.write_text(SLOW_SERVER)
+    marker = tmp_path / "cancelled"
+
+    async def run():
+        client = MCPClient(persistent_servers=["slow-server"])
+        client.server_configs = {
+            "slow-server": {"command": sys.executable, "args": [str(script), str(marker)], "transport": "stdio"}
+        }
+        client.persistent_servers = ["slow-server"]
+        await client.init()
+        try:
+            await client.get_tools()
+            echoed = await client.call_tool_streaming("echo", {"text": "hi"}, on_progress)
+            assert echoed.content[0].text == "hi"
+
+            started = asyncio.Event()
+
+            async def on_started(progress, total, message):
+                started.set()
+
+            call = asyncio.create_task(client.call_tool_streaming("wait_forever", {}, on_started))
+            await asyncio.wait_for(started.wait(), 30)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+            for _ in range(100):
+                if marker.exists():
+                    break
+                await asyncio.sleep(0.1)
+        finally:
+            await client.close()
+
+    async def on_progress(progress, total, message):
+        pass
+
+    asyncio.run(run())
+    assert marker.read_text() == "cancelled"
@@ -0,0 +1,53 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for the killable parser process pool in parser_pool.py."""
+import operator
+import os
+import time
+
+import pytest
+
+from parser_pool import ParserPool, ParserTimeoutError
+
+
+@pytest.fixture
+def pool():
+    pool = ParserPool(max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_run_returns_results_and_raises_task_errors(pool):
+    assert pool.run(operator.add, 2, 3) == 5
+    assert pool.submit(operator.mul, 4, 5).result() == 20
+    with pytest.raises(ValueError):
+        pool.run(int, "not a number")
+    assert pool.run(operator.add, 1, 1) == 2
+
+
+def test_timed_out_task_is_killed_and_worker_replaced(pool):
+    first_pid = pool.run(os.getpid)
+
+    started = time.monotonic()
+    with pytest.raises(ParserTimeoutError):
+        pool.run(time.sleep, 60, timeout=0.5)
+    assert time.monotonic() - started < 30
+    assert pool.killed == 1
+
+    # The single slot is usable again, served by a new process.
+    second_pid = pool.run(os.getpid, timeout=30)
+    assert second_pid != first_pid
@@ -0,0 +1,80 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for history versioning in postgres_storage.py, against a fake connection pool."""
+import asyncio
+from contextlib import asynccontextmanager
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from postgres_storage import PostgreSQLConversationStorage
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetchrow(self, query, *args):
+        self.queries.append(query)
+        return self.rows.get(args[0])
+
+
+class FakePool:
+    def __init__(self, rows):
+        self.conn = FakeConnection(rows)
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def make_storage(rows):
+    storage = PostgreSQLConversationStorage()
+    storage.pool = FakePool(rows)
+    return storage
+
+
+HISTORY = [SystemMessage(content="system"), HumanMessage(content="hi"), AIMessage(content="hello")]
+
+
+def test_uncached_version_is_read_from_the_database():
+    storage = make_storage({"chat": {"version": 7, "rewritten_version": 3}})
+
+    asyncio.run(storage.save_messages("chat", HISTORY))
+
+    # Without a cached history the save cannot be shown to append, so it counts as a rewrite.
+    assert storage._versions["chat"] == (8, 8)
+    assert storage._pending_versions["chat"] == (8, 8)
+    assert len(storage.pool.conn.queries) == 1
+
+
+def test_append_after_invalidation_continues_from_stored_version():
+    storage = make_storage({"chat": {"version": 7, "rewritten_version": 3}})
+    storage._cache_messages("chat", HISTORY)
+
+    asyncio.run(storage.save_messages("chat", HISTORY + [HumanMessage(content="more")]))
+    assert storage._versions["chat"] == (8, 3)
+
+    asyncio.run(storage.save_messages("chat", HISTORY + [HumanMessage(content="more"), AIMessage(content="ok")]))
+    assert storage._versions["chat"] == (9, 3)
+    assert len(storage.pool.conn.queries) == 1
+
+
+def test_new_chat_starts_at_version_one():
+    storage = make_storage({})
+    asyncio.run(storage.save_messages("new", HISTORY))
+    assert storage._versions["new"] == (1, 1)
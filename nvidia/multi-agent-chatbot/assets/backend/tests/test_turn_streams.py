@@ -0,0 +1,146 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for resuming turn event streams in turn_streams.py."""
+import asyncio
+
+import pytest
+
+import turn_streams
+from chat_turns import ChatBusyError
+from turn_streams import TurnStream, TurnStreams
+
+
+async def collect(stream, after=0):
+    return [event async for event in stream.follow(after)]
+
+
+async def tokens(count, gate=None):
+    for i in range(count):
+        if gate is not None and i == count // 2:
+            await gate.wait()
+        yield {"type": "token", "data": str(i)}
+
+
+def test_resume_replays_missed_events_then_follows_live():
+    async def scenario():
+        streams = TurnStreams()
+        gate = asyncio.Event()
+        stream = streams.start("chat", "turn", "hi", tokens(4, gate))
+
+        seen = []
+        async for event in stream.follow():
+            seen.append(event)
+            if event["type"] == "token" and event["data"] == "1":
+                break
+        # The client drops here and reconnects after more events were published.
+        gate.set()
+        await asyncio.sleep(0)
+        resumed = await collect(stream, after=seen[-1]["seq"])
+        return seen, resumed, streams
+
+    seen, resumed, streams = asyncio.run(scenario())
+
+    events = seen + resumed
+    assert [event["seq"] for event in events] == list(range(1, 7))
+    assert [event["type"] for event in events] == ["turn_start"] + ["token"] * 4 + ["turn_end"]
+    assert all(event["turn_id"] == "turn" for event in events)
+    assert events[-1]["cancelled"] is False
+    assert streams.get("chat") is None
+
+
+def test_resume_after_dropped_events_reports_a_gap():
+    async def scenario():
+        stream = TurnStream("chat", "turn", "hi", max_events=2)
+        for i in range(5):
+            stream.publish({"type": "token", "data": str(i)})
+        stream.finish()
+        return await collect(stream, after=1)
+
+    events = asyncio.run(scenario())
+
+    # The fourth event trims the buffer back to two, so events 1 and 2 are gone.
+    assert events[0] == {"type": "turn_gap", "turn_id": "turn", "seq": 2}
+    assert [event["seq"] for event in events[1:]] == [3, 4, 5]
+
+
+def test_turn_without_clients_is_cancelled(monkeypatch):
+    monkeypatch.setattr(turn_streams, "TURN_STREAM_ORPHAN_SECONDS", 0)
+
+    async def scenario():
+        streams = TurnStreams()
+        stream = streams.start("chat", "turn", "hi", tokens(2, asyncio.Event()))
+        async for event in stream.follow():
+            if event["type"] == "token":
+                break
+        await asyncio.wait_for(stream.task, 1)
+        return stream
+
+    stream = asyncio.run(scenario())
+
+    assert stream.cancelled
+    assert stream._events[-1]["type"] == "turn_end"
+    assert stream._events[-1]["cancelled"] is True
+
+
+def test_reconnect_before_orphan_timeout_keeps_the_turn(monkeypatch):
+    monkeypatch.setattr(turn_streams, "TURN_STREAM_ORPHAN_SECONDS", 0.05)
+
+    async def scenario():
+        streams = TurnStreams()
+        gate = asyncio.Event()
+        stream = streams.start("chat", "turn", "hi", tokens(2, gate))
+        async for event in stream.follow():
+            if event["type"] == "token":
+                after = event["seq"]
+                break
+        follower = asyncio.create_task(collect(stream, after))
+        await asyncio.sleep(0.1)
+        gate.set()
+        return stream, await asyncio.wait_for(follower, 1)
+
+    stream, resumed = asyncio.run(scenario())
+
+    assert not stream.cancelled
+    assert [event["type"] for event in resumed] == ["token", "turn_end"]
+
+
+def test_second_turn_on_a_busy_chat_is_refused():
+    async def scenario():
+        streams = TurnStreams()
+        gate = asyncio.Event()
+        stream = streams.start("chat", "turn", "hi", tokens(2, gate))
+        with pytest.raises(ChatBusyError):
+            streams.start("chat", "other", "again", tokens(1))
+        gate.set()
+        await stream.task
+
+    asyncio.run(scenario())
+
+
+def test_failing_turn_ends_with_an_error_event():
+    async def failing():
+        yield {"type": "token", "data": "x"}
+        raise RuntimeError("model unavailable")
+
+    async def scenario():
+        stream = TurnStreams().start("chat", "turn", "hi", failing())
+        return await collect(stream)
+
+    events = asyncio.run(scenario())
+
+    assert [event["type"] for event in events] == ["turn_start", "token", "error", "turn_end"]
+    assert "model unavailable" in events[2]["content"]
@@ -0,0 +1,192 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for streaming multipart uploads and resumable upload sessions."""
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+from starlette.requests import Request
+
+from uploads import (
+    ResumableUploads,
+    UploadError,
+    UploadNotFoundError,
+    UploadOffsetMismatchError,
+    UploadTooLargeError,
+    save_multipart_files,
+)
+
+BOUNDARY = "testboundary"
+
+
+def multipart_body(parts):
+    """Build a multipart/form-data body from (field, filename, content) tuples."""
+    body = b""
+    for field, filename, content in parts:
+        disposition = f'form-data; name="{field}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def make_request(body, chunk_size=7, content_length=None, reads=None):
+    """Build a request whose body arrives in small chunks, recording each read in `reads`."""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    headers.append((b"content-length", str(len(body) if content_length is None else content_length).encode()))
+
+    async def receive():
+        if reads is not None:
+            reads.append(1)
+        chunk = chunks.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+def test_files_are_streamed_to_disk_with_hashes(tmp_path):
+    first, second = b"hello world" * 50, b"\x00\x01binary\r\n--not-a-boundary"
+    body = multipart_body([("files", "a.txt", first), ("note", None, b"ignored"), ("files", "../b.bin", second)])
+
+    saved = asyncio.run(save_multipart_files(make_request(body), str(tmp_path)))
+
+    assert [upload.filename for upload in saved] == ["a.txt", "b.bin"]
+    assert (tmp_path / "a.txt").read_bytes() == first
+    assert (tmp_path / "b.bin").read_bytes() == second
+    assert saved[0].sha256 == hashlib.sha256(first).hexdigest()
+    assert saved[1].size == len(second)
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "b.bin"]
+
+
+def test_declared_length_over_limit_is_rejected_before_reading(tmp_path):
+    reads = []
+    request = make_request(multipart_body([("files", "a.txt", b"x")]), content_length=10_000, reads=reads)
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_multipart_files(request, str(tmp_path), max_request_bytes=1000))
+    assert reads == []
+
+
+def test_oversized_file_stops_reading_and_removes_written_files(tmp_path):
+    body = multipart_body([("files", "small.txt", b"ok"), ("files", "big.txt", b"x" * 5000)])
+    reads = []
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_multipart_files(make_request(body, chunk_size=64, reads=reads), str(tmp_path), max_file_bytes=1000))
+    assert len(reads) < len(body) // 64
+    assert os.listdir(tmp_path) == []
+
+
+def test_truncated_body_is_rejected(tmp_path):
+    body = multipart_body([("files", "a.txt", b"partial content")])[:-30]
+
+    with pytest.raises(UploadError):
+        asyncio.run(save_multipart_files(make_request(body), str(tmp_path)))
+    assert os.listdir(tmp_path) == []
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_resumable_upload_appends_at_offset_and_completes(tmp_path):
+    uploads = ResumableUploads(root=str(tmp_path / ".partial"))
+    data = b"0123456789" * 10
+    target = tmp_path / "done"
+    target.mkdir()
+
+    async def run():
+        upload_id = uploads.create("doc.pdf", len(data))["upload_id"]
+        await uploads.append(upload_id, 0, stream(data[:30], data[30:40]))
+        with pytest.raises(UploadOffsetMismatchError):
+            await uploads.append(upload_id, 10, stream(data[10:20]))
+        assert uploads.status(upload_id)["offset"] == 40
+        with pytest.raises(UploadTooLargeError):
+            await uploads.append(upload_id, 40, stream(data[40:]), content_length=len(data))
+        await uploads.append(upload_id, 40, stream(data[40:]), content_length=len(data) - 40)
+        return await uploads.complete(upload_id, str(target))
+
+    saved = asyncio.run(run())
+
+    assert (target / "doc.pdf").read_bytes() == data
+    assert saved.sha256 == hashlib.sha256(data).hexdigest()
+    assert os.listdir(uploads.root) == []
+
+
+def test_abort_waits_for_append_in_progress(tmp_path):
+    uploads = ResumableUploads(root=str(tmp_path / ".partial"))
+    order = []
+
+    async def slow_chunks():
+        yield b"abc"
+        await asyncio.sleep(0.05)
+        order.append("append done")
+        yield b"def"
+
+    async def run():
+        upload_id = uploads.create("doc.txt", 6)["upload_id"]
+        append = asyncio.create_task(uploads.append(upload_id, 0, slow_chunks()))
+        await asyncio.sleep(0.01)
+        await uploads.abort(upload_id)
+        order.append("aborted")
+        await append
+        with pytest.raises(UploadNotFoundError):
+            uploads.status(upload_id)
+
+    asyncio.run(run())
+    assert order == ["append done", "aborted"]
+
+
+def test_retried_chunk_on_another_worker_waits_and_is_rejected(tmp_path):
+    # Two stores on one directory stand in for two workers; they share no in-process lock.
+    first = ResumableUploads(root=str(tmp_path / ".partial"))
+    second = ResumableUploads(root=str(tmp_path / ".partial"))
+
+    async def slow_chunks():
+        yield b"abc"
+        await asyncio.sleep(0.05)
+        yield b"def"
+
+    async def run():
+        upload_id = first.create("doc.txt", 12)["upload_id"]
+        append = asyncio.create_task(first.append(upload_id, 0, slow_chunks()))
+        await asyncio.sleep(0.01)
+        with pytest.raises(UploadOffsetMismatchError):
+            await second.append(upload_id, 0, stream(b"abcdef"))
+        await append
+        return upload_id
+
+    upload_id = asyncio.run(run())
+    with open(first._data_path(upload_id), "rb") as f:
+        assert f.read() == b"abcdef"
+
+
+def test_expired_sessions_are_removed(tmp_path):
+    uploads = ResumableUploads(root=str(tmp_path / ".partial"), ttl_seconds=60)
+    stale = uploads.create("old.txt", 10)["upload_id"]
+    fresh = uploads.create("new.txt", 10)["upload_id"]
+    past = time.time() - 120
+    stale_dir = os.path.join(uploads.root, stale)
+    for name in ("data", "session.json"):
+        os.utime(os.path.join(stale_dir, name), (past, past))
+
+    assert asyncio.run(uploads.remove_expired()) == 1
+    assert os.listdir(uploads.root) == [fresh]
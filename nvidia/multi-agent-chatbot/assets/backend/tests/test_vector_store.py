@@ -0,0 +1,127 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Tests for VectorStore operations that talk to the Milvus client directly."""
+import json
+import re
+import threading
+
+from vector_store import VectorStore, source_partition_name
+
+
+class FakeClient:
+    """Milvus client stand-in holding rows in memory and evaluating simple filters."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.upserts = []
+
+    def query(self, collection_name, filter, output_fields, partition_names=None):
+        source = json.loads(re.search(r'source == (".*?")', filter).group(1))
+        hashes = json.loads(re.search(r"chunk_hash in (\[.*\])", filter).group(1))
+        return [
+            {field: row[field] for field in output_fields}
+            for row in self.rows if row["source"] == source and row["chunk_hash"] in hashes
+        ]
+
+    def upsert(self, collection_name, data, partition_name=None):
+        self.upserts.append((data, partition_name))
+
+
+class FakeMilvus:
+    def __init__(self, client, fields):
+        self.client = client
+        self.fields = fields
+        self.col = object()
+
+
+def make_store(client, fields, partition_layout="none", num_partitions=16):
+    store = VectorStore.__new__(VectorStore)
+    store.collection_name = "context"
+    store.partition_layout = partition_layout
+    store.num_partitions = num_partitions
+    store.read_your_writes = False
+    store._store = FakeMilvus(client, fields)
+    store._partitions = None
+    store._flush_lock = threading.Lock()
+    store._unflushed_rows = 0
+    return store
+
+
+FIELDS = ["pk", "text", "vector", "source", "file_path", "content_hash", "chunk_hash"]
+
+
+def row(pk, chunk_hash, file_path="uploads/old/a.txt", content_hash="old"):
+    return {
+        "pk": pk, "text": f"text {pk}", "vector": [0.1, 0.2], "source": "a.txt",
+        "file_path": file_path, "content_hash": content_hash, "chunk_hash": chunk_hash
+    }
+
+
+def test_update_chunk_metadata_upserts_only_stale_rows_with_vectors():
+    client = FakeClient([row(1, "h1"), row(2, "h2", "uploads/new/a.txt", "new"), row(3, "h3")])
+    store = make_store(client, FIELDS)
+
+    updated = store.update_chunk_metadata(
+        "a.txt", ["h1", "h2"], {"file_path": "uploads/new/a.txt", "content_hash": "new", "missing": "x"}
+    )
+
+    assert updated == 1
+    (data, partition_name), = client.upserts
+    assert partition_name is None
+    assert data == [row(1, "h1", "uploads/new/a.txt", "new")]
+    assert store._unflushed_rows == 1
+
+
+def test_update_chunk_metadata_ignores_fields_the_collection_lacks():
+    client = FakeClient([row(1, "h1")])
+    store = make_store(client, ["pk", "text", "vector", "source", "chunk_hash"])
+
+    assert store.update_chunk_metadata("a.txt", ["h1"], {"file_path": "new"}) == 0
+    assert client.upserts == []
+
+
+def test_sources_are_hashed_into_a_bounded_set_of_partitions():
+    names = {source_partition_name(f"doc-{i}.pdf", 16) for i in range(2000)}
+
+    assert len(names) == 16
+    assert all(re.fullmatch(r"src_\d{4}", name) for name in names)
+    assert source_partition_name("doc-1.pdf", 16) == source_partition_name("doc-1.pdf", 16)
+
+
+class PartitionClient:
+    def __init__(self, partitions):
+        self.partitions = partitions
+
+    def list_partitions(self, collection_name):
+        return list(self.partitions)
+
+
+def test_partition_search_prunes_partitions_and_filters_by_source():
+    sources = ["a.pdf", "b.pdf"]
+    partitions = {"_default", source_partition_name("a.pdf", 16), source_partition_name("b.pdf", 16)}
+    store = make_store(PartitionClient(partitions), FIELDS, partition_layout="partition")
+
+    kwargs = store._build_search_kwargs(4, sources)
+
+    assert kwargs["partition_names"] == sorted({source_partition_name(s, 16) for s in sources})
+    assert kwargs["expr"] == 'source in ["a.pdf", "b.pdf"]'
+
+
+def test_partition_search_skips_sources_without_a_partition():
+    store = make_store(PartitionClient({"_default"}), FIELDS, partition_layout="partition")
+
+    assert store._build_search_kwargs(4, ["a.pdf"]) is None
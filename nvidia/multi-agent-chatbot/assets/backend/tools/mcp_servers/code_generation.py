@@ -14,57 +14,116 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+"""
+MCP server providing a code generation tool backed by a coding model.
 
+All calls share one pooled async client. Generated code is streamed from the
+model and forwarded to the caller as MCP progress notifications, so clients
+that pass a progress callback can show the code while it is being written.
+Each call is bounded by CODEGEN_MAX_TOKENS and CODEGEN_TIME_BUDGET; when the
+time budget runs out the code generated so far is returned. A cancelled call
+closes the model stream, which stops generation on the model server.
+"""
 import asyncio
-from typing import Type
-from pydantic import BaseModel, Field
+import os
+import sys
+import time
+from typing import List
 
-from langchain_core.tools import BaseTool
-from langchain_core.messages import SystemMessage, HumanMessage
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from openai import AsyncOpenAI
 
 mcp = FastMCP("Code Generation")
-model_name = "deepseek-coder:6.7b"
+model_name = os.getenv("CODEGEN_MODEL", "deepseek-coder:6.7b")
+model_client = AsyncOpenAI(
+    base_url=os.getenv("CODEGEN_BASE_URL", "http://deepseek-coder:8000/v1"),
+    api_key="ollama"
+)
+
+CODEGEN_MAX_TOKENS = int(os.getenv("CODEGEN_MAX_TOKENS", 4096))
+CODEGEN_TIME_BUDGET = float(os.getenv("CODEGEN_TIME_BUDGET", 120))
+# Minimum seconds between progress notifications; deltas in between are sent together.
+CODEGEN_PROGRESS_INTERVAL = float(os.getenv("CODEGEN_PROGRESS_INTERVAL", 0.05))
+
+
+def log(message: str) -> None:
+    # stdout carries the MCP stdio protocol.
+    print(message, file=sys.stderr)
+
+
+async def stream_code(messages: List[dict], parts: List[str], ctx: Context) -> None:
+    """Stream a completion into `parts`, reporting new text as progress.
+
+    Args:
+        messages: Chat messages for the coding model
+        parts: List the generated text is appended to, readable if the stream is cut short
+        ctx: Request context used to send progress notifications
+    """
+    stream = await model_client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        temperature=0.1,
+        max_tokens=CODEGEN_MAX_TOKENS,
+        stream=True,
+    )
+    pending = []
+    sent = 0
+    last_report = time.monotonic()
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            pending.append(delta)
+            now = time.monotonic()
+            if now - last_report >= CODEGEN_PROGRESS_INTERVAL:
+                sent += len(pending)
+                await ctx.report_progress(sent, None, "".join(pending))
+                pending.clear()
+                last_report = now
+        if pending:
+            await ctx.report_progress(sent + len(pending), None, "".join(pending))
+    finally:
+        await stream.close()
 
 
 @mcp.tool()
-async def write_code(query: str, programming_language: str):
+async def write_code(query: str, programming_language: str, ctx: Context):
     """This tool is used to write complete code.
-    
+
     Args:
         query: The natural language description of the code to be generated.
         programming_language: The programming language for the code generation (e.g., 'Python', 'JavaScript', 'HTML', 'CSS', 'Go').
-        
+
     Returns:
         The generated code.
     """
-    model_client = AsyncOpenAI(
-        base_url="http://deepseek-coder:8000/v1",
-        api_key="ollama"
-    )
-    
     system_prompt = f"""You are an expert coder specializing in {programming_language}.
     Given a user request, generate clean, efficient {programming_language} code that accomplishes the specified task.
     Always provide the full code generation so the user can copy and paste a fully working example.
     Return just the raw code, with no markdown formatting, explanations, or any other text.
     """
-    
+
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": query}
     ]
-    
-    response = await model_client.chat.completions.create(
-        model=model_name,
-        messages=messages,
-        temperature=0.1,
-    )
-    
-    generated_code = response.choices[0].message.content
+
+    parts: List[str] = []
+    try:
+        await asyncio.wait_for(stream_code(messages, parts, ctx), timeout=CODEGEN_TIME_BUDGET)
+    except asyncio.TimeoutError:
+        log(f"write_code: time budget of {CODEGEN_TIME_BUDGET}s exhausted after {len(parts)} chunks")
+        generated_code = "".join(parts).strip()
+        return f"{generated_code}\n\n[Code generation stopped after {CODEGEN_TIME_BUDGET:g}s; the code above may be incomplete.]"
+
+    generated_code = "".join(parts)
     return generated_code.strip()
 
 
 if __name__ == "__main__":
-    print(f"Starting {mcp.name} MCP server...")
-    mcp.run(transport="stdio")
\ No newline at end of file
+    log(f"Starting {mcp.name} MCP server...")
+    mcp.run(transport="stdio")
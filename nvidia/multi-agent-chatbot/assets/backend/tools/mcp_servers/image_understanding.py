@@ -14,111 +14,327 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-
 """
 MCP server providing image understanding and analysis tools.
 
-This server exposes a `process_image` tool that uses a vision language model to answer queries about images. 
+This server exposes an `explain_image` tool that uses a vision language model to answer queries about images. 
 It supports multiple image input formats including URLs, file paths, and base64-encoded images.
+
+Images are resolved by a shared fetcher that downloads URLs over one pooled
+HTTP client, caps their resolution for the VLM and caches recent results.
+URLs may only point at public addresses: every hop, redirects included, is
+resolved and checked before connecting, and the connection goes to the
+checked address so a second DNS answer cannot redirect it.
+VLM calls use an async client, so concurrent calls do not wait on each other.
+With IMAGE_BATCH_WINDOW > 0, calls that arrive within the window are combined
+into one VLM request covering several images and questions.
 """
 import asyncio
 import base64
+import hashlib
+import ipaddress
 import os
-import requests
+import re
+import socket
 import sys
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
-import time
+from typing import Dict, List, Optional
 
-from langchain_core.tools import tool, Tool
-from langchain_mcp_adapters.tools import to_fastmcp
+import httpx
 from mcp.server.fastmcp import FastMCP
-from openai import AsyncOpenAI, OpenAI
+from openai import AsyncOpenAI
 
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
-from postgres_storage import PostgreSQLConversationStorage
+from images import ImageError, downscale_for_vlm, to_data_uri
 
 
 mcp = FastMCP("image-understanding-server")
 
 
-model_name = "Qwen2.5-VL-7B-Instruct"
-model_client = OpenAI(
-    base_url=f"http://qwen2.5-vl:8000/v1",
+model_name = os.getenv("VLM_MODEL", "Qwen2.5-VL-7B-Instruct")
+model_client = AsyncOpenAI(
+    base_url=os.getenv("VLM_BASE_URL", "http://qwen2.5-vl:8000/v1"),
     api_key="api_key"
 )
-POSTGRES_HOST = os.getenv("POSTGRES_HOST", "postgres")
-POSTGRES_PORT = int(os.getenv("POSTGRES_PORT", 5432))
-POSTGRES_DB = os.getenv("POSTGRES_DB", "chatbot")
-POSTGRES_USER = os.getenv("POSTGRES_USER", "chatbot_user")
-POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "chatbot_password")
-
-postgres_storage = PostgreSQLConversationStorage(
-    host=POSTGRES_HOST,
-    port=POSTGRES_PORT,
-    database=POSTGRES_DB,
-    user=POSTGRES_USER,
-    password=POSTGRES_PASSWORD
-)
 
-@mcp.tool()
-def explain_image(query: str, image: str):
-    """
-    This tool is used to understand an image. It will respond to the user's query based on the image.
-    ...
-    """ 
-    if not image:
-        raise ValueError('Error: explain_image tool received an empty image string.')
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", 20))
+IMAGE_FETCH_MAX_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", 25 * 1024 * 1024))
+IMAGE_FETCH_CACHE_SIZE = int(os.getenv("IMAGE_FETCH_CACHE_SIZE", 32))
+IMAGE_FETCH_MAX_REDIRECTS = int(os.getenv("IMAGE_FETCH_MAX_REDIRECTS", 5))
+# Allow image URLs on private, loopback and link-local addresses (e.g. images served inside the deployment).
+IMAGE_FETCH_ALLOW_PRIVATE = os.getenv("IMAGE_FETCH_ALLOW_PRIVATE", "false").lower() == "true"
+# Seconds to wait for more calls to combine into one VLM request; 0 sends every call on its own.
+IMAGE_BATCH_WINDOW = float(os.getenv("IMAGE_BATCH_WINDOW", 0))
+IMAGE_BATCH_MAX = int(os.getenv("IMAGE_BATCH_MAX", 4))
+VLM_MAX_TOKENS = 512
+
+ANSWER_MARKER_RE = re.compile(r"^\s*\[\[(\d+)\]\]\s*", re.MULTILINE)
+
+
+def log(message: str) -> None:
+    # stdout carries the MCP stdio protocol.
+    print(message, file=sys.stderr)
+
+
+def is_public_address(address: str) -> bool:
+    """Whether `address` is a globally routable unicast IP (not private, loopback, link-local or reserved)."""
+    ip = ipaddress.ip_address(address)
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class ImageFetcher:
+    """Resolves URLs, file paths and data URIs to VLM-sized data URIs, with a small LRU cache."""
 
-    image_url_content = {}
+    def __init__(
+        self,
+        cache_size: int = IMAGE_FETCH_CACHE_SIZE,
+        allow_private: bool = IMAGE_FETCH_ALLOW_PRIVATE,
+        max_redirects: int = IMAGE_FETCH_MAX_REDIRECTS
+    ):
+        self.cache_size = cache_size
+        self.allow_private = allow_private
+        self.max_redirects = max_redirects
+        self._cache: OrderedDict = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
 
-    if image.startswith("http://") or image.startswith("https://"):
-        image_url_content = {
-            "type": "image_url",
-            "image_url": {"url": image}
-        }
-    else:
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # Redirects are followed in `_download` so that every hop is checked.
+            self._client = httpx.AsyncClient(timeout=IMAGE_FETCH_TIMEOUT, follow_redirects=False)
+        return self._client
+
+    async def _resolve(self, url: httpx.URL) -> str:
+        """Resolve the URL's host to the address to connect to, refusing non-public addresses."""
+        if url.scheme not in ("http", "https") or not url.host:
+            raise ValueError(f"Unsupported image URL: {url}")
+        port = url.port or (443 if url.scheme == "https" else 80)
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(url.host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise ValueError(f"Could not resolve {url.host}: {e}")
+        addresses = [info[4][0] for info in infos]
+        if not addresses:
+            raise ValueError(f"Could not resolve {url.host}")
+        if not self.allow_private and not all(is_public_address(address) for address in addresses):
+            raise ValueError(f"Image URL {url} resolves to a private or reserved address")
+        return addresses[0]
+
+    def _pinned_request(self, url: httpx.URL, address: str) -> httpx.Request:
+        """Build a request for `url` that connects to `address` while keeping its Host header and TLS name."""
+        return self._get_client().build_request(
+            "GET",
+            url.copy_with(host=address),
+            headers={"Host": url.netloc.decode("ascii")},
+            extensions={"sni_hostname": url.host}
+        )
+
+    async def _download(self, url: str) -> bytes:
+        target = httpx.URL(url)
+        for _ in range(self.max_redirects + 1):
+            address = await self._resolve(target)
+            response = await self._get_client().send(self._pinned_request(target, address), stream=True)
+            try:
+                if response.is_redirect:
+                    target = target.join(response.headers["location"])
+                    continue
+                response.raise_for_status()
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > IMAGE_FETCH_MAX_BYTES:
+                        raise ValueError(f"Image at {url} exceeds {IMAGE_FETCH_MAX_BYTES} bytes")
+                    chunks.append(chunk)
+                return b"".join(chunks)
+            finally:
+                await response.aclose()
+        raise ValueError(f"Too many redirects fetching {url}")
+
+    async def _read(self, image: str) -> bytes:
+        if image.startswith("http://") or image.startswith("https://"):
+            return await self._download(image)
         if image.startswith("data:image/"):
-            metadata, b64_data = image.split(",", 1)
-            filetype = metadata.split(";")[0].split("/")[-1]
-        elif os.path.exists(image):
-            with open(image, "rb") as image_file:
-                filetype = image.split('.')[-1]
-                b64_data = base64.b64encode(image_file.read()).decode("utf-8")
-        else:
-            raise ValueError(f'Invalid image type -- could not be identified as a url or filepath: {image}')
-        
-        image_url_content = {
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/{filetype if filetype else 'jpeg'};base64,{b64_data}"
-            }
-        }
-
-    message = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": query},
-                image_url_content
-            ]
-        }
-    ]
-    
+            _, b64_data = image.split(",", 1)
+            return base64.b64decode(b64_data)
+        if os.path.exists(image):
+            return await asyncio.to_thread(Path(image).read_bytes)
+        raise ValueError(f'Invalid image type -- could not be identified as a url or filepath: {image}')
+
+    async def fetch(self, image: str) -> str:
+        """Return a data URI for `image` whose resolution is capped for the VLM."""
+        # Local files may change between calls, so only URLs and inline data are cached.
+        cacheable = not os.path.exists(image)
+        key = hashlib.sha256(image.encode("utf-8")).digest()
+        if cacheable and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        try:
+            image_bytes = await self._read(image)
+        except httpx.HTTPError as e:
+            raise ValueError(f"Could not fetch image {image}: {e}")
+        try:
+            data_uri = to_data_uri(await asyncio.to_thread(downscale_for_vlm, image_bytes))
+        except ImageError as e:
+            raise ValueError(f'Invalid image: {e}')
+
+        if cacheable:
+            self._cache[key] = data_uri
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return data_uri
+
+
+fetcher = ImageFetcher()
+
+
+async def ask_vlm(content: List[dict], max_tokens: int = VLM_MAX_TOKENS) -> str:
     try:
-        print(f"Sending request to vision model: {query}")
-        response = model_client.chat.completions.create(
+        response = await model_client.chat.completions.create(
             model=model_name,
-            messages=message,
-            max_tokens=512,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=max_tokens,
             temperature=0.1
         )
-        print(f"Received response from vision model")
         return response.choices[0].message.content
     except Exception as e:
-        print(f"Error calling vision model: {e}")
+        log(f"Error calling vision model: {e}")
         raise RuntimeError(f"Failed to process image with vision model: {e}")
 
+
+def single_request(query: str, data_uri: str) -> List[dict]:
+    return [
+        {"type": "text", "text": query},
+        {"type": "image_url", "image_url": {"url": data_uri}}
+    ]
+
+
+@dataclass
+class PendingQuestion:
+    query: str
+    data_uri: str
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class VLMBatcher:
+    """Combines questions that arrive within a short window into one VLM request.
+
+    Each distinct image is attached once and the model is asked to answer every
+    question under a numbered marker. Questions whose answer cannot be found in
+    the combined response are retried on their own.
+    """
+
+    def __init__(self, window: float = IMAGE_BATCH_WINDOW, max_batch: int = IMAGE_BATCH_MAX):
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: List[PendingQuestion] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+
+    async def ask(self, query: str, data_uri: str) -> str:
+        if self.window <= 0 or self.max_batch == 1:
+            return await ask_vlm(single_request(query, data_uri))
+
+        question = PendingQuestion(query, data_uri)
+        self._pending.append(question)
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_task is None:
+            self._flush_task = self._spawn(self._flush_after(self.window))
+        return await question.future
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _flush_now(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        batch, self._pending = self._pending, []
+        self._spawn(self._send(batch))
+
+    async def _flush_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        batch, self._pending = self._pending, []
+        await self._send(batch)
+
+    async def _send(self, batch: List[PendingQuestion]) -> None:
+        if not batch:
+            return
+        if len(batch) == 1:
+            answers = {0: None}
+        else:
+            answers = await self._send_combined(batch)
+
+        async def answer_alone(index: int, question: PendingQuestion) -> None:
+            try:
+                answer = answers.get(index) or await ask_vlm(single_request(question.query, question.data_uri))
+                question.future.set_result(answer)
+            except Exception as e:
+                question.future.set_exception(e)
+
+        await asyncio.gather(*[answer_alone(i, question) for i, question in enumerate(batch)])
+
+    async def _send_combined(self, batch: List[PendingQuestion]) -> Dict[int, str]:
+        image_numbers: Dict[str, int] = {}
+        content: List[dict] = []
+        for question in batch:
+            if question.data_uri not in image_numbers:
+                image_numbers[question.data_uri] = len(image_numbers) + 1
+                content.append({"type": "text", "text": f"Image {image_numbers[question.data_uri]}:"})
+                content.append({"type": "image_url", "image_url": {"url": question.data_uri}})
+
+        instructions = [
+            "Answer each question below about the image it refers to. "
+            "Start each answer on its own line with its marker, e.g. [[1]], and answer every question."
+        ]
+        for i, question in enumerate(batch, start=1):
+            instructions.append(f"[[{i}]] (Image {image_numbers[question.data_uri]}) {question.query}")
+        content.append({"type": "text", "text": "\n".join(instructions)})
+
+        try:
+            response = await ask_vlm(content, max_tokens=VLM_MAX_TOKENS * len(batch))
+        except RuntimeError:
+            return {}
+
+        answers: Dict[int, str] = {}
+        markers = list(ANSWER_MARKER_RE.finditer(response or ""))
+        for marker, next_marker in zip(markers, markers[1:] + [None]):
+            index = int(marker.group(1)) - 1
+            end = next_marker.start() if next_marker else len(response)
+            answer = response[marker.end():end].strip()
+            if 0 <= index < len(batch) and answer:
+                answers[index] = answer
+        log(f"Combined VLM request answered {len(answers)}/{len(batch)} questions over {len(image_numbers)} images")
+        return answers
+
+
+batcher = VLMBatcher()
+
+
+@mcp.tool()
+async def explain_image(query: str, image: str):
+    """
+    This tool is used to understand an image. It will respond to the user's query based on the image.
+    ...
+    """ 
+    if not image:
+        raise ValueError('Error: explain_image tool received an empty image string.')
+
+    data_uri = await fetcher.fetch(image)
+    log(f"Sending request to vision model: {query}")
+    answer = await batcher.ask(query, data_uri)
+    log("Received response from vision model")
+    return answer
+
 if __name__ == "__main__":
-    print(f'running {mcp.name} MCP server')
-    mcp.run(transport="stdio")
\ No newline at end of file
+    log(f'running {mcp.name} MCP server')
+    mcp.run(transport="stdio")
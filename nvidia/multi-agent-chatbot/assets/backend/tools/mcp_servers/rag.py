@@ -114,21 +114,21 @@ class RAGAgent:
         {context}
         """
 
-    def retrieve(self, state: RAGState) -> Dict:
+    async def retrieve(self, state: RAGState) -> Dict:
         """Retrieve relevant documents from the vector store."""
         logger.info({"message": "Starting document retrieval"})
         sources = state.get("sources", [])
         
         if sources:
             logger.info({"message": "Attempting retrieval with source filters", "sources": sources})
-            retrieved_docs = self.vector_store.get_documents(state["question"], sources=sources)
+            retrieved_docs = await self.vector_store.aget_documents(state["question"], sources=sources)
         else:
             logger.info({"message": "No sources specified, searching all documents"})
-            retrieved_docs = self.vector_store.get_documents(state["question"])
+            retrieved_docs = await self.vector_store.aget_documents(state["question"])
         
         if not retrieved_docs and sources:
             logger.info({"message": "No documents found with source filtering, trying without filters"})
-            retrieved_docs = self.vector_store.get_documents(state["question"])
+            retrieved_docs = await self.vector_store.aget_documents(state["question"])
         
         if retrieved_docs:
             sources_found = set(doc.metadata.get("source", "unknown") for doc in retrieved_docs)
@@ -250,5 +250,5 @@ async def search_documents(query: str) -> str:
 
 
 if __name__ == "__main__":
-    print(f"Starting {mcp.name} MCP server...")
+    print(f"Starting {mcp.name} MCP server...", file=sys.stderr)
     mcp.run(transport="stdio")
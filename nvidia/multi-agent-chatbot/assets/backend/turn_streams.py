@@ -0,0 +1,183 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Resumable event streams for chat turns.
+
+A turn runs in its own task, detached from the websocket that started it, and
+publishes its events into a bounded buffer. Each event carries the turn id
+and a sequence number. A client that reconnects while the turn is running
+replays the events after the last sequence number
+it saw and then follows the live stream. A turn whose client does not come
+back within TURN_STREAM_ORPHAN_SECONDS is cancelled. Finished turns are
+dropped; their reply reaches clients with the history.
+
+Streams live in the memory of the worker running the turn. With several
+workers, reconnects must reach the same worker (sticky sessions) to resume.
+Otherwise the client gets the reply with the history sync once it is saved.
+"""
+
+import asyncio
+import contextlib
+import os
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from chat_turns import ChatBusyError
+from logger import logger
+
+
+TURN_STREAM_BUFFER_EVENTS = int(os.getenv("TURN_STREAM_BUFFER_EVENTS", 8192))
+# 0 cancels a turn as soon as its last client disconnects.
+TURN_STREAM_ORPHAN_SECONDS = float(os.getenv("TURN_STREAM_ORPHAN_SECONDS", 120))
+
+
+class TurnStream:
+    """The buffered events of one turn."""
+
+    def __init__(self, chat_id: str, turn_id: str, message: str, max_events: int = TURN_STREAM_BUFFER_EVENTS):
+        self.chat_id = chat_id
+        self.turn_id = turn_id
+        self.message = message
+        self.max_events = max_events
+        self.done = False
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+        self._events: List[Dict[str, Any]] = []
+        # Sequence number of self._events[0].
+        self._first_seq = 1
+        self._changed = asyncio.Event()
+        self._followers = 0
+        self._orphan_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._first_seq + len(self._events) - 1
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Append an event, tagging it with the turn id and the next sequence number."""
+        self._events.append({**event, "turn_id": self.turn_id, "seq": self.last_seq + 1})
+        if len(self._events) >= 2 * self.max_events:
+            dropped = len(self._events) - self.max_events
+            del self._events[:dropped]
+            self._first_seq += dropped
+        self._wake()
+
+    def finish(self) -> None:
+        self.done = True
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the events after sequence number `after`, then live events until the turn ends.
+        
+        If events after `after` were already dropped from the buffer, a
+        "turn_gap" event is yielded first, carrying the last dropped sequence number.
+        """
+        self._followers += 1
+        if self._orphan_timer:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+        try:
+            while True:
+                changed = self._changed
+                if after < self._first_seq - 1:
+                    after = self._first_seq - 1
+                    yield {"type": "turn_gap", "turn_id": self.turn_id, "seq": after}
+                for event in self._events[after - self._first_seq + 1:]:
+                    yield event
+                    after = event["seq"]
+                if self.done and after >= self.last_seq:
+                    return
+                if after >= self.last_seq:
+                    await changed.wait()
+        finally:
+            self._followers -= 1
+            if self._followers == 0 and not self.done:
+                self._orphan_timer = asyncio.get_running_loop().call_later(
+                    TURN_STREAM_ORPHAN_SECONDS, self._cancel_orphan
+                )
+
+    def _cancel_orphan(self) -> None:
+        self._orphan_timer = None
+        if self._followers == 0 and not self.done:
+            logger.info({"message": "Cancelling turn without clients", "chat_id": self.chat_id, "turn_id": self.turn_id})
+            self.cancel()
+
+    def cancel(self) -> None:
+        """Stop the turn; its stream ends with a cancelled "turn_end" event."""
+        if self.task and not self.done:
+            self.cancelled = True
+            self.task.cancel()
+
+
+class TurnStreams:
+    """The running turns of this worker, by chat."""
+
+    def __init__(self):
+        self._streams: Dict[str, TurnStream] = {}
+
+    def get(self, chat_id: str) -> Optional[TurnStream]:
+        """Return the chat's running turn, if any."""
+        return self._streams.get(chat_id)
+
+    def start(self, chat_id: str, turn_id: str, message: str, events: AsyncIterator[Dict[str, Any]]) -> TurnStream:
+        """Run a turn in the background, publishing `events` to a new stream.
+        
+        The stream starts with a "turn_start" event and ends with a "turn_end"
+        event. An exception raised by `events` is published as an "error" event.
+        
+        Raises:
+            ChatBusyError: If a turn on this chat is already running on this worker
+        """
+        if chat_id in self._streams:
+            raise ChatBusyError(f"Another reply is still being generated for chat {chat_id}")
+
+        stream = TurnStream(chat_id, turn_id, message)
+        stream.publish({"type": "turn_start", "message": message})
+        self._streams[chat_id] = stream
+        stream.task = asyncio.create_task(self._run(stream, events))
+        return stream
+
+    async def _run(self, stream: TurnStream, events: AsyncIterator[Dict[str, Any]]) -> None:
+        try:
+            async with aclosing(events):
+                async for event in events:
+                    stream.publish(event)
+        except asyncio.CancelledError:
+            pass
+        except ChatBusyError as e:
+            stream.publish({"type": "error", "content": str(e)})
+        except Exception as e:
+            logger.error({"message": "Error in chat turn", "chat_id": stream.chat_id, "error": str(e)}, exc_info=True)
+            stream.publish({"type": "error", "content": f"Error processing request: {str(e)}"})
+        finally:
+            if self._streams.get(stream.chat_id) is stream:
+                del self._streams[stream.chat_id]
+            stream.publish({"type": "turn_end", "cancelled": stream.cancelled})
+            stream.finish()
+
+    async def close(self) -> None:
+        """Cancel every running turn and wait for it to stop."""
+        tasks = []
+        for stream in list(self._streams.values()):
+            stream.cancel()
+            if stream.task:
+                tasks.append(stream.task)
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.gather(*tasks, return_exceptions=True)
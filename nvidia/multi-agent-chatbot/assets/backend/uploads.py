@@ -0,0 +1,553 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Streaming and resumable file uploads for document ingestion.
+
+Multipart request bodies are parsed as they arrive and each file part is
+written straight to its destination in chunks, hashed while streaming, so
+memory use stays constant regardless of file size and size limits are
+enforced before the rest of the body is read. Resumable uploads keep their
+state on disk: the number of bytes already written is the resume offset.
+Requests on a session are serialized with a file lock, so chunk retries that
+reach different workers cannot append the same bytes twice. Sessions that see
+no data for RESUMABLE_UPLOAD_TTL_SECONDS are removed.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, Dict, List, Optional
+
+from python_multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from ingestion_manifest import hash_file
+from logger import logger
+
+
+UPLOAD_ROOT = os.getenv("UPLOAD_ROOT", "uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", 512 * 1024 * 1024))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", 2 * 1024 * 1024 * 1024))
+MAX_RESUMABLE_UPLOAD_BYTES = int(os.getenv("MAX_RESUMABLE_UPLOAD_BYTES", 8 * 1024 * 1024 * 1024))
+RESUMABLE_UPLOAD_TTL_SECONDS = float(os.getenv("RESUMABLE_UPLOAD_TTL_SECONDS", 24 * 3600))
+RESUMABLE_UPLOAD_CLEANUP_INTERVAL = float(os.getenv("RESUMABLE_UPLOAD_CLEANUP_INTERVAL", 3600))
+# How often a request retries the file lock of a session another process is writing to.
+RESUMABLE_UPLOAD_LOCK_POLL_SECONDS = 0.05
+
+
+class UploadError(Exception):
+    """Base class for upload errors, carrying the HTTP status code to report."""
+    status_code = 400
+
+
+class UploadTooLargeError(UploadError):
+    status_code = 413
+
+
+class UploadNotFoundError(UploadError):
+    status_code = 404
+
+
+class UploadOffsetMismatchError(UploadError):
+    status_code = 409
+
+
+@dataclass
+class SavedUpload:
+    """A file written to disk along with its size and content hash."""
+    filename: str
+    path: str
+    size: int
+    sha256: str
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Strip directory components so uploads cannot escape their target directory."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        return f"upload-{uuid.uuid4().hex[:8]}"
+    return name
+
+
+def content_length(request: Request) -> Optional[int]:
+    """Return the request's declared Content-Length, or None if absent or invalid."""
+    try:
+        return int(request.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _write_hashed(f, hasher, chunk: bytes) -> None:
+    if hasher is not None:
+        hasher.update(chunk)
+    f.write(chunk)
+
+
+async def _write_chunks(
+    chunks: AsyncIterator[bytes],
+    path: str,
+    max_bytes: int,
+    mode: str = "wb",
+    hasher=None
+) -> int:
+    """Write an async stream of chunks to `path`, enforcing a byte limit."""
+    written = 0
+    f = await asyncio.to_thread(open, path, mode)
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds the limit of {max_bytes} bytes")
+            await asyncio.to_thread(_write_hashed, f, hasher, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+    return written
+
+
+class _MultipartFileWriter:
+    """Collects events from the push parser and writes file parts to disk.
+
+    Parser callbacks run synchronously inside `MultipartParser.write`, so they
+    only record events; `drain` then performs the blocking file I/O in threads.
+    """
+
+    def __init__(self, directory: str, field_name: str, max_file_bytes: int):
+        self.directory = directory
+        self.field_name = field_name
+        self.max_file_bytes = max_file_bytes
+        self.saved: List[SavedUpload] = []
+        self._events: List[tuple] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._is_file = False
+        self._file = None
+        self._hasher = None
+        self._filename = ""
+        self._path = ""
+        self._size = 0
+        self.callbacks = {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._is_file = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        # Form fields other than the file field are ignored.
+        self._is_file = name == self.field_name and filename is not None
+        if self._is_file:
+            self._events.append(("open", filename.decode("utf-8", "replace")))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._is_file and end > start:
+            self._events.append(("data", data[start:end]))
+
+    def _on_part_end(self) -> None:
+        if self._is_file:
+            self._events.append(("close", None))
+
+    async def drain(self) -> None:
+        """Apply the events recorded since the last call."""
+        events, self._events = self._events, []
+        for kind, value in events:
+            if kind == "open":
+                self._filename = safe_filename(value)
+                self._path = os.path.join(self.directory, self._filename)
+                self._hasher = hashlib.sha256()
+                self._size = 0
+                self._file = await asyncio.to_thread(open, self._path, "wb")
+            elif kind == "data":
+                self._size += len(value)
+                if self._size > self.max_file_bytes:
+                    raise UploadTooLargeError(
+                        f"File {self._filename} exceeds the limit of {self.max_file_bytes} bytes"
+                    )
+                await asyncio.to_thread(_write_hashed, self._file, self._hasher, value)
+            else:
+                await self._close_file()
+                self.saved.append(SavedUpload(
+                    filename=self._filename,
+                    path=self._path,
+                    size=self._size,
+                    sha256=self._hasher.hexdigest()
+                ))
+
+    @property
+    def incomplete(self) -> bool:
+        """Whether a file part was opened but its closing boundary never arrived."""
+        return self._file is not None
+
+    async def _close_file(self) -> None:
+        f, self._file = self._file, None
+        if f is not None:
+            await asyncio.to_thread(f.close)
+
+    async def discard(self) -> None:
+        """Close and remove every file written so far."""
+        await self._close_file()
+        paths = {upload.path for upload in self.saved}
+        if self._path:
+            paths.add(self._path)
+        for path in paths:
+            await asyncio.to_thread(_remove_quietly, path)
+
+
+async def save_multipart_files(
+    request: Request,
+    directory: str,
+    field_name: str = "files",
+    max_file_bytes: int = MAX_UPLOAD_FILE_BYTES,
+    max_request_bytes: int = MAX_UPLOAD_REQUEST_BYTES
+) -> List[SavedUpload]:
+    """Stream the file parts of a multipart/form-data request body to `directory`.
+
+    The body is parsed while it is received, without spooling it first, and
+    each file is hashed as it is written.
+
+    Args:
+        request: Incoming request with a multipart/form-data body
+        directory: Directory the files are written to
+        field_name: Form field carrying the files
+        max_file_bytes: Size limit for each file
+        max_request_bytes: Size limit for the whole request body
+
+    Returns:
+        The saved files in the order they appeared in the body
+
+    Raises:
+        UploadTooLargeError: If the declared or received body, or a single file, exceeds its limit;
+            every file written by the request is removed
+        UploadError: If the body is not valid multipart/form-data
+    """
+    declared = content_length(request)
+    if declared is not None and declared > max_request_bytes:
+        raise UploadTooLargeError(f"Request exceeds the limit of {max_request_bytes} bytes")
+    if "content-type" not in request.headers and not declared:
+        return []
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data request body")
+
+    writer = _MultipartFileWriter(directory, field_name, max_file_bytes)
+    parser = MultipartParser(params[b"boundary"], writer.callbacks)
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadTooLargeError(f"Request exceeds the limit of {max_request_bytes} bytes")
+            parser.write(chunk)
+            await writer.drain()
+        parser.finalize()
+        await writer.drain()
+        if writer.incomplete:
+            raise UploadError("Multipart body ended in the middle of a file")
+    except MultipartParseError as e:
+        await writer.discard()
+        raise UploadError(f"Malformed multipart body: {e}")
+    except BaseException:
+        await writer.discard()
+        raise
+    return writer.saved
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@dataclass
+class UploadSession:
+    """State of a resumable upload, persisted next to its partial data."""
+    upload_id: str
+    filename: str
+    size: int
+
+
+class ResumableUploads:
+    """Chunked uploads that can be resumed from the last byte written to disk."""
+
+    def __init__(
+        self,
+        root: str = os.path.join(UPLOAD_ROOT, ".partial"),
+        max_bytes: int = MAX_RESUMABLE_UPLOAD_BYTES,
+        ttl_seconds: float = RESUMABLE_UPLOAD_TTL_SECONDS
+    ):
+        """Initialize the upload store.
+
+        Args:
+            root: Directory holding one subdirectory per upload session
+            max_bytes: Maximum declared size of a resumable upload
+            ttl_seconds: Idle time after which an unfinished session is removed
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    @asynccontextmanager
+    async def _session_lock(self, upload_id: str, wait: bool = True) -> AsyncIterator[bool]:
+        """Hold the session's lock in this process and its file lock across processes.
+
+        Args:
+            upload_id: Upload identifier
+            wait: Whether to wait for a lock held elsewhere, or yield False at once
+
+        Yields:
+            True if the session is locked, False if it was busy and `wait` is False
+
+        Raises:
+            UploadNotFoundError: If the session directory does not exist
+        """
+        lock = self._lock(upload_id)
+        if not wait and lock.locked():
+            yield False
+            return
+        async with lock:
+            try:
+                lock_file = open(os.path.join(self._dir(upload_id), "lock"), "a")
+            except FileNotFoundError:
+                raise UploadNotFoundError(f"Upload {upload_id} not found")
+            # Closing the file releases the lock.
+            with lock_file:
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if not wait:
+                            yield False
+                            return
+                        await asyncio.sleep(RESUMABLE_UPLOAD_LOCK_POLL_SECONDS)
+                yield True
+
+    def _dir(self, upload_id: str) -> str:
+        if not upload_id or os.path.basename(upload_id) != upload_id:
+            raise UploadNotFoundError(f"Upload {upload_id} not found")
+        return os.path.join(self.root, upload_id)
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self._dir(upload_id), "data")
+
+    def _load(self, upload_id: str) -> UploadSession:
+        try:
+            with open(os.path.join(self._dir(upload_id), "session.json"), "r") as f:
+                return UploadSession(**json.load(f))
+        except FileNotFoundError:
+            raise UploadNotFoundError(f"Upload {upload_id} not found")
+
+    def _offset(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self._data_path(upload_id))
+        except FileNotFoundError:
+            return 0
+
+    def _last_activity(self, upload_id: str) -> Optional[float]:
+        """Return when the session last received data, or None if it no longer exists."""
+        upload_dir = self._dir(upload_id)
+        times = []
+        for name in ("data", "session.json"):
+            try:
+                times.append(os.path.getmtime(os.path.join(upload_dir, name)))
+            except FileNotFoundError:
+                pass
+        if times:
+            return max(times)
+        try:
+            return os.path.getmtime(upload_dir)
+        except FileNotFoundError:
+            return None
+
+    def create(self, filename: str, size: int) -> dict:
+        """Start a resumable upload of `size` bytes."""
+        if size < 0:
+            raise UploadError("Upload size must be non-negative")
+        if size > self.max_bytes:
+            raise UploadTooLargeError(f"Upload exceeds the limit of {self.max_bytes} bytes")
+
+        session = UploadSession(upload_id=uuid.uuid4().hex, filename=safe_filename(filename), size=size)
+        upload_dir = self._dir(session.upload_id)
+        os.makedirs(upload_dir, exist_ok=True)
+        with open(os.path.join(upload_dir, "session.json"), "w") as f:
+            json.dump(asdict(session), f)
+        open(self._data_path(session.upload_id), "wb").close()
+        return self.status(session.upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        """Return the upload's declared size and the offset to resume from."""
+        session = self._load(upload_id)
+        last_activity = self._last_activity(upload_id) or time.time()
+        return {
+            "upload_id": session.upload_id,
+            "filename": session.filename,
+            "size": session.size,
+            "offset": self._offset(upload_id),
+            "chunk_size": UPLOAD_CHUNK_SIZE,
+            "expires_at": last_activity + self.ttl_seconds
+        }
+
+    async def append(
+        self,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        content_length: Optional[int] = None
+    ) -> dict:
+        """Append a chunk stream at `offset`, which must equal the bytes already received.
+
+        Args:
+            upload_id: Upload identifier returned by `create`
+            offset: Byte offset of the chunk
+            chunks: Chunk body, streamed to disk
+            content_length: Declared body size, checked before any data is read
+
+        Raises:
+            UploadOffsetMismatchError: If `offset` does not match the current resume offset
+            UploadTooLargeError: If the chunk would extend the upload past its declared size
+        """
+        async with self._session_lock(upload_id):
+            session = self._load(upload_id)
+            current = self._offset(upload_id)
+            if offset != current:
+                raise UploadOffsetMismatchError(f"Expected offset {current}, got {offset}")
+            remaining = session.size - current
+            if content_length is not None and content_length > remaining:
+                raise UploadTooLargeError(f"Chunk of {content_length} bytes exceeds the {remaining} bytes remaining")
+
+            await _write_chunks(chunks, self._data_path(upload_id), remaining, mode="ab")
+            return self.status(upload_id)
+
+    async def complete(self, upload_id: str, directory: str) -> SavedUpload:
+        """Move a fully received upload into `directory` and hash its content."""
+        async with self._session_lock(upload_id):
+            session = self._load(upload_id)
+            received = self._offset(upload_id)
+            if received != session.size:
+                raise UploadOffsetMismatchError(f"Upload incomplete: received {received} of {session.size} bytes")
+
+            path = os.path.join(directory, session.filename)
+            await asyncio.to_thread(shutil.move, self._data_path(upload_id), path)
+            sha256 = await asyncio.to_thread(hash_file, path, UPLOAD_CHUNK_SIZE)
+            await asyncio.to_thread(shutil.rmtree, self._dir(upload_id), True)
+        self._locks.pop(upload_id, None)
+
+        logger.debug({
+            "message": "Completed resumable upload",
+            "upload_id": upload_id,
+            "filename": session.filename,
+            "size": session.size
+        })
+        return SavedUpload(filename=session.filename, path=path, size=session.size, sha256=sha256)
+
+    async def abort(self, upload_id: str) -> None:
+        """Discard a resumable upload and its partial data.
+
+        Waits for an append in progress, so data is never written into a removed session.
+        """
+        async with self._session_lock(upload_id):
+            self._load(upload_id)
+            await asyncio.to_thread(shutil.rmtree, self._dir(upload_id), True)
+        self._locks.pop(upload_id, None)
+
+    async def remove_expired(self) -> int:
+        """Remove sessions that have received no data for `ttl_seconds`.
+
+        Returns:
+            Number of sessions removed
+        """
+        try:
+            upload_ids = await asyncio.to_thread(os.listdir, self.root)
+        except FileNotFoundError:
+            return 0
+
+        removed = 0
+        for upload_id in upload_ids:
+            try:
+                async with self._session_lock(upload_id, wait=False) as locked:
+                    if not locked:
+                        continue
+                    last_activity = await asyncio.to_thread(self._last_activity, upload_id)
+                    if last_activity is None or time.time() - last_activity < self.ttl_seconds:
+                        continue
+                    await asyncio.to_thread(shutil.rmtree, self._dir(upload_id), True)
+            except UploadNotFoundError:
+                # Completed or aborted since the directory was listed.
+                continue
+            self._locks.pop(upload_id, None)
+            removed += 1
+
+        if removed:
+            logger.info({"message": "Removed expired resumable uploads", "count": removed})
+        return removed
+
+    async def _cleanup_worker(self, interval: float) -> None:
+        while True:
+            try:
+                await self.remove_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning({"message": "Resumable upload cleanup failed", "error": str(e)})
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = RESUMABLE_UPLOAD_CLEANUP_INTERVAL) -> None:
+        """Start removing expired sessions every `interval` seconds."""
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_worker(interval))
+
+    async def stop(self) -> None:
+        """Stop the cleanup task."""
+        task, self._cleanup_task = self._cleanup_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
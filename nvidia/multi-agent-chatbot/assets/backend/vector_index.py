@@ -0,0 +1,110 @@
+#
+# SPDX-FileCopyrightText: Copyright (c) 1993-2025 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Milvus ANN index configuration.
+
+The index type, metric and build/search parameters come from the environment
+so deployments can trade recall for latency without code changes. Unset
+parameters fall back to per-index defaults that favour recall.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "AUTOINDEX").upper()
+MILVUS_METRIC_TYPE = os.getenv("MILVUS_METRIC_TYPE", "L2").upper()
+MILVUS_INDEX_PARAMS = os.getenv("MILVUS_INDEX_PARAMS", "")
+MILVUS_SEARCH_PARAMS = os.getenv("MILVUS_SEARCH_PARAMS", "")
+
+METRIC_TYPES = {"L2", "IP", "COSINE"}
+
+# Build and search defaults per index type. `m` for IVF_PQ must divide the vector dimension.
+INDEX_BUILD_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "AUTOINDEX": {},
+    "FLAT": {},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 16, "nbits": 8},
+    "SCANN": {"nlist": 1024, "with_raw_data": True},
+}
+INDEX_SEARCH_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "AUTOINDEX": {},
+    "FLAT": {},
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 16},
+    "SCANN": {"nprobe": 16, "reorder_k": 64},
+}
+
+
+def _parse_params(value: str, name: str) -> Dict[str, Any]:
+    if not value:
+        return {}
+    try:
+        params = json.loads(value)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{name} must be a JSON object: {e}") from e
+    if not isinstance(params, dict):
+        raise ValueError(f"{name} must be a JSON object")
+    return params
+
+
+def build_index_config(
+    index_type: str = MILVUS_INDEX_TYPE,
+    metric_type: str = MILVUS_METRIC_TYPE,
+    build_params: Optional[Dict[str, Any]] = None,
+    search_params: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Build Milvus index and search parameters.
+    
+    Args:
+        index_type: One of INDEX_BUILD_DEFAULTS
+        metric_type: "L2", "IP" or "COSINE"
+        build_params: Overrides for the index build parameters (defaults to MILVUS_INDEX_PARAMS)
+        search_params: Overrides for the search parameters (defaults to MILVUS_SEARCH_PARAMS)
+        
+    Returns:
+        Tuple of (index_params, search_params) in the form accepted by Milvus
+        
+    Raises:
+        ValueError: If the index type, metric or parameters are invalid
+    """
+    index_type = index_type.upper()
+    metric_type = metric_type.upper()
+    if index_type not in INDEX_BUILD_DEFAULTS:
+        raise ValueError(f"Unsupported index type {index_type!r}, expected one of {sorted(INDEX_BUILD_DEFAULTS)}")
+    if metric_type not in METRIC_TYPES:
+        raise ValueError(f"Unsupported metric type {metric_type!r}, expected one of {sorted(METRIC_TYPES)}")
+    
+    if build_params is None:
+        build_params = _parse_params(MILVUS_INDEX_PARAMS, "MILVUS_INDEX_PARAMS")
+    if search_params is None:
+        search_params = _parse_params(MILVUS_SEARCH_PARAMS, "MILVUS_SEARCH_PARAMS")
+    
+    index_params = {
+        "index_type": index_type,
+        "metric_type": metric_type,
+        "params": {**INDEX_BUILD_DEFAULTS[index_type], **build_params}
+    }
+    search = {
+        "metric_type": metric_type,
+        "params": {**INDEX_SEARCH_DEFAULTS[index_type], **search_params}
+    }
+    return index_params, search
@@ -14,48 +14,52 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-import glob
+import hashlib
+import json
+import threading
+import time
 from typing import List, Tuple
 import os
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_milvus import Milvus
 from langchain_core.documents import Document
 from typing_extensions import List
 from langchain_openai import OpenAIEmbeddings
-from langchain_unstructured import UnstructuredLoader
 from dotenv import load_dotenv
+from chunking import create_chunker
+from embedding_cache import create_default_embeddings
+from ingestion_manifest import IngestionManifest
+from vector_index import build_index_config
 from logger import logger
 from typing import Optional, Callable
-import requests
-
-
-class CustomEmbeddings:
-    """Wraps qwen3 embedding model to match OpenAI format"""
-    def __init__(self, model: str = "Qwen3-Embedding-4B-Q8_0.gguf", host: str = "http://qwen3-embedding:8000"):
-        self.model = model
-        self.url = f"{host}/v1/embeddings"
-
-    def __call__(self, texts: list[str]) -> list[list[float]]:
-        embeddings = []
-        for text in texts:
-            response = requests.post(
-                self.url,
-                json={"input": text, "model": self.model},
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            data = response.json()
-            embeddings.append(data["data"][0]["embedding"])
-        return embeddings
+from collections import OrderedDict
 
-    
-    def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        """Embed a list of document texts. Required by Milvus library."""
-        return self.__call__(texts)
-    
-    def embed_query(self, text: str) -> list[float]:
-        """Embed a single query text. Required by Milvus library."""
-        return self.__call__([text])[0]
+
+MILVUS_INSERT_BATCH_ROWS = int(os.getenv("MILVUS_INSERT_BATCH_ROWS", 1000))
+MILVUS_INSERT_BATCH_BYTES = int(os.getenv("MILVUS_INSERT_BATCH_BYTES", 16 * 1024 * 1024))
+MILVUS_FLUSH_ROWS = int(os.getenv("MILVUS_FLUSH_ROWS", 100_000))
+MILVUS_FLUSH_INTERVAL = float(os.getenv("MILVUS_FLUSH_INTERVAL", 600))
+MILVUS_READ_YOUR_WRITES = os.getenv("MILVUS_READ_YOUR_WRITES", "false").lower() == "true"
+# "none": one shared partition, sources filtered by expression.
+# "partition_key": `source` is the partition key; Milvus hashes sources into MILVUS_NUM_PARTITIONS.
+# "partition": sources are hashed into MILVUS_NUM_PARTITIONS physical partitions managed here;
+#     searches prune by partition and filter by source.
+MILVUS_PARTITION_LAYOUT = os.getenv("MILVUS_PARTITION_LAYOUT", "none").lower()
+# Milvus allows 1024 partitions per collection by default.
+MILVUS_NUM_PARTITIONS = min(int(os.getenv("MILVUS_NUM_PARTITIONS", 64)), 1024)
+
+PARTITION_LAYOUTS = {"none", "partition_key", "partition"}
+RETRIEVER_CACHE_SIZE = 128
+
+
+def milvus_str(value: str) -> str:
+    """Quote a string literal for use in a Milvus boolean expression."""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def source_partition_name(source: str, num_partitions: int = MILVUS_NUM_PARTITIONS) -> str:
+    """Map a source name to one of `num_partitions` stable Milvus partition names."""
+    bucket = int.from_bytes(hashlib.sha1(source.encode("utf-8")).digest()[:8], "big") % max(1, num_partitions)
+    return f"src_{bucket:04d}"
 
 
 class VectorStore:
@@ -68,25 +72,56 @@ class VectorStore:
         self, 
         embeddings=None, 
         uri: str = "http://milvus:19530",
-        on_source_deleted: Optional[Callable[[str], None]] = None
+        on_source_deleted: Optional[Callable[[str], None]] = None,
+        insert_batch_rows: int = MILVUS_INSERT_BATCH_ROWS,
+        insert_batch_bytes: int = MILVUS_INSERT_BATCH_BYTES,
+        flush_rows: int = MILVUS_FLUSH_ROWS,
+        flush_interval: float = MILVUS_FLUSH_INTERVAL,
+        read_your_writes: bool = MILVUS_READ_YOUR_WRITES,
+        partition_layout: str = MILVUS_PARTITION_LAYOUT,
+        num_partitions: int = MILVUS_NUM_PARTITIONS,
+        index_config: Optional[Tuple[dict, dict]] = None
     ):
         """Initialize the vector store.
         
         Args:
-            embeddings: Embedding model to use (defaults to OllamaEmbeddings)
+            embeddings: Embedding model to use (defaults to the cached CustomEmbeddings client)
             uri: Milvus connection URI
             on_source_deleted: Optional callback when a source is deleted
+            insert_batch_rows: Maximum rows per insert request
+            insert_batch_bytes: Approximate maximum payload bytes per insert request
+            flush_rows: Unflushed rows that trigger a collection flush (0 disables)
+            flush_interval: Seconds after which unflushed rows trigger a flush (0 disables)
+            read_your_writes: Search with Strong consistency by default
+            partition_layout: "none", "partition_key" or "partition" (see MILVUS_PARTITION_LAYOUT)
+            num_partitions: Number of partitions sources are hashed into (at most 1024)
+            index_config: (index_params, search_params) for the vector index
+                (defaults to the MILVUS_INDEX_* / MILVUS_METRIC_TYPE environment)
         """
         try:
-            self.embeddings = embeddings or CustomEmbeddings(model="qwen3-embedding-custom")
+            self.embeddings = embeddings or create_default_embeddings(model="qwen3-embedding-custom")
             self.uri = uri
+            self.collection_name = "context"
             self.on_source_deleted = on_source_deleted
+            self.insert_batch_rows = max(1, insert_batch_rows)
+            self.insert_batch_bytes = max(1, insert_batch_bytes)
+            self.flush_rows = flush_rows
+            self.flush_interval = flush_interval
+            self.read_your_writes = read_your_writes
+            if partition_layout not in PARTITION_LAYOUTS:
+                raise ValueError(f"Unknown partition layout {partition_layout!r}, expected one of {sorted(PARTITION_LAYOUTS)}")
+            self.partition_layout = partition_layout
+            self.num_partitions = max(1, min(num_partitions, 1024))
+            self.index_params, self.search_params = index_config or build_index_config()
+            self._partitions: Optional[set] = None
+            self._retrievers: OrderedDict = OrderedDict()
+            self._flush_lock = threading.Lock()
+            self._unflushed_rows = 0
+            self._last_flush = time.monotonic()
+            self.manifest = IngestionManifest()
             self._initialize_store()
             
-            self.text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
+            self.text_splitter = create_chunker()
             
             logger.debug({
                 "message": "VectorStore initialized successfully"
@@ -99,154 +134,244 @@ class VectorStore:
             raise
     
     def _initialize_store(self):
+        partition_kwargs = {}
+        if self.partition_layout == "partition_key":
+            partition_kwargs = {"partition_key_field": "source", "num_partitions": self.num_partitions}
+        
         self._store = Milvus(
             embedding_function=self.embeddings,
-            collection_name="context",
+            collection_name=self.collection_name,
             connection_args={"uri": self.uri},
-            auto_id=True
+            auto_id=True,
+            index_params=self.index_params,
+            search_params=self.search_params,
+            **partition_kwargs
         )
+        self._partitions = None
+        self._retrievers.clear()
+        self._check_existing_index()
         logger.debug({
             "message": "Milvus vector store initialized",
             "uri": self.uri,
-            "collection": "context"
+            "collection": self.collection_name,
+            "partition_layout": self.partition_layout,
+            "index_type": self.index_params["index_type"],
+            "metric_type": self.index_params["metric_type"]
         })
 
-    def _load_documents(self, file_paths: List[str] = None, input_dir: str = None) -> List[str]:
+    def _check_existing_index(self) -> None:
+        """Warn when an existing collection was indexed differently than configured.
+        
+        Milvus keeps a collection's index until it is rebuilt, so changing MILVUS_INDEX_TYPE or
+        MILVUS_METRIC_TYPE only applies to new collections. Searches must use the existing
+        index's metric, so the configured search params are aligned with it.
+        """
+        if self._store.col is None:
+            return
         try:
-            documents = []
-            source_name = None
-            
-            if input_dir:
-                source_name = os.path.basename(os.path.normpath(input_dir))
-                logger.debug({
-                    "message": "Loading files from directory",
-                    "directory": input_dir,
-                    "source": source_name
-                })
-                file_paths = glob.glob(os.path.join(input_dir, "**"), recursive=True)
-                file_paths = [f for f in file_paths if os.path.isfile(f)]
-            
-            logger.info(f"Processing {len(file_paths)} files: {file_paths}")
-            
-            for file_path in file_paths:
-                try:
-                    if not source_name:
-                        source_name = os.path.basename(file_path)
-                        logger.info(f"Using filename as source: {source_name}")
-                    
-                    logger.info(f"Loading file: {file_path}")
-                    
-                    file_ext = os.path.splitext(file_path)[1].lower()
-                    logger.info(f"File extension: {file_ext}")
-                    
-                    try:
-                        loader = UnstructuredLoader(file_path)
-                        docs = loader.load()
-                        logger.info(f"Successfully loaded {len(docs)} documents from {file_path}")
-                    except Exception as pdf_error:
-                        logger.error(f'error with unstructured loader, trying to load from scratch')
-                        file_text = None
-                        if file_ext == ".pdf":
-                            logger.info("Attempting PyPDF text extraction fallback")
-                            try:
-                                from pypdf import PdfReader
-                                reader = PdfReader(file_path)
-                                extracted_pages = []
-                                for page in reader.pages:
-                                    try:
-                                        extracted_pages.append(page.extract_text() or "")
-                                    except Exception as per_page_err:
-                                        logger.info(f"Warning: failed to extract a page: {per_page_err}")
-                                        extracted_pages.append("")
-                                file_text = "\n\n".join(extracted_pages).strip()
-                            except Exception as pypdf_error:
-                                logger.info(f"PyPDF fallback failed: {pypdf_error}")
-                                file_text = None
-
-                        if not file_text:
-                            logger.info("Falling back to raw text read of file contents")
-                            try:
-                                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                                    file_text = f.read()
-                            except Exception as read_error:
-                                logger.info(f"Fallback read failed: {read_error}")
-                                file_text = ""
-
-                        if file_text and file_text.strip():
-                            docs = [Document(
-                                page_content=file_text,
-                                metadata={
-                                    "source": source_name,
-                                    "file_path": file_path,
-                                    "filename": os.path.basename(file_path),
-                                }
-                            )]
-                        else:
-                            logger.info("Creating a simple document as fallback (no text extracted)")
-                            docs = [Document(
-                                page_content=f"Document: {os.path.basename(file_path)}",
-                                metadata={
-                                    "source": source_name,
-                                    "file_path": file_path,
-                                    "filename": os.path.basename(file_path),
-                                }
-                            )]
-                    
-                    for doc in docs:
-                        if not doc.metadata:
-                            doc.metadata = {}
-                        
-                        cleaned_metadata = {}
-                        cleaned_metadata["source"] = source_name
-                        cleaned_metadata["file_path"] = file_path
-                        cleaned_metadata["filename"] = os.path.basename(file_path)
-                        
-                        for key, value in doc.metadata.items():
-                            if key not in ["source", "file_path"]:
-                                if isinstance(value, (list, dict, set)):
-                                    cleaned_metadata[key] = str(value)
-                                elif value is not None:
-                                    cleaned_metadata[key] = str(value)
-                        
-                        doc.metadata = cleaned_metadata
-                    documents.extend(docs)
-                    logger.debug({
-                        "message": "Loaded documents from file",
-                        "file_path": file_path,
-                        "document_count": len(docs)
-                    })
-                except Exception as e:
-                    logger.error({
-                        "message": "Error loading file",
-                        "file_path": file_path,
-                        "error": str(e)
-                    }, exc_info=True)
-                    continue
-
-            logger.info(f"Total documents loaded: {len(documents)}")
-            return documents
-            
-        except Exception as e:
-            logger.error({
-                "message": "Error loading documents",
-                "error": str(e)
-            }, exc_info=True)
-            raise
+            existing = self._store.client.describe_index(self.collection_name, self._store._vector_field)
+        except Exception:
+            return
+        if not existing:
+            return
+        
+        existing_type = existing.get("index_type")
+        existing_metric = existing.get("metric_type")
+        if (existing_type, existing_metric) != (self.index_params["index_type"], self.index_params["metric_type"]):
+            logger.warning({
+                "message": "Existing collection index differs from configuration; drop the collection to re-index",
+                "collection": self.collection_name,
+                "existing_index_type": existing_type,
+                "existing_metric_type": existing_metric,
+                "configured_index_type": self.index_params["index_type"],
+                "configured_metric_type": self.index_params["metric_type"]
+            })
+            if existing_metric and existing_metric != self.search_params["metric_type"]:
+                self._store.search_params = {"metric_type": existing_metric, "params": {}}
+
+    def _get_partitions(self) -> set:
+        """Return the collection's partition names, cached until a partition is added or dropped."""
+        if self._partitions is None:
+            if self._store.col is None:
+                return set()
+            self._partitions = set(self._store.client.list_partitions(self.collection_name))
+        return self._partitions
+
+    def _partition_name(self, source: str) -> str:
+        return source_partition_name(source, self.num_partitions)
 
-    def index_documents(self, documents: List[Document]) -> List[Document]:
+    def _ensure_partition(self, source: str) -> str:
+        name = self._partition_name(source)
+        if name not in self._get_partitions():
+            if not self._store.client.has_partition(self.collection_name, name):
+                self._store.client.create_partition(self.collection_name, name)
+            self._partitions.add(name)
+            self._retrievers.clear()
+        return name
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Split loaded documents into chunks for embedding."""
+        return self.text_splitter.split_documents(documents)
+
+    def get_chunk_stats(self) -> Optional[dict]:
+        """Get chunk size statistics, if the configured chunker records them."""
+        get_stats = getattr(self.text_splitter, "get_stats", None)
+        return get_stats() if get_stats else None
+
+    @property
+    def supports_chunk_hashes(self) -> bool:
+        """Whether chunks can be deleted individually by their `chunk_hash` metadata.
+        
+        True for new collections (the schema is inferred from the first insert) and for
+        collections created with the field; False for collections that predate it.
+        """
+        return self._store.col is None or "chunk_hash" in (self._store.fields or [])
+
+    def delete_source_chunks(self, source: str, chunk_hashes: List[str] = None, batch_size: int = 1000) -> None:
+        """Delete the chunks of `source`, or only those whose hash is in `chunk_hashes`.
+        
+        Raises:
+            RuntimeError: If Milvus rejects the delete
+        """
+        if self._store.col is None:
+            return
+        
+        source_expr = f"source == {milvus_str(source)}"
+        if chunk_hashes is None:
+            expressions = [source_expr]
+        else:
+            expressions = [
+                f"{source_expr} && chunk_hash in {json.dumps(chunk_hashes[i:i + batch_size])}"
+                for i in range(0, len(chunk_hashes), batch_size)
+            ]
+        
+        for expr in expressions:
+            if not self._store.delete(expr=expr):
+                raise RuntimeError(f"Failed to delete chunks for source {source}")
+        
+        logger.debug({
+            "message": "Deleted source chunks",
+            "source": source,
+            "chunk_count": len(chunk_hashes) if chunk_hashes is not None else "all"
+        })
+
+    def update_chunk_metadata(self, source: str, chunk_hashes: List[str], metadata: dict, batch_size: int = 1000) -> int:
+        """Overwrite metadata fields of already indexed chunks, keeping their vectors.
+        
+        Used for chunks kept across a re-upload, whose text is unchanged but whose
+        file-level metadata (`file_path`, `content_hash`) belongs to the old upload.
+        Fields the collection does not have are ignored.
+        
+        Returns:
+            int: Number of rows rewritten
+        """
+        if self._store.col is None or not chunk_hashes:
+            return 0
+        fields = self._store.fields or []
+        metadata = {key: value for key, value in metadata.items() if key in fields}
+        if not metadata:
+            return 0
+        
+        client = self._store.client
+        partition_name = None
+        if self.partition_layout == "partition":
+            partition_name = self._partition_name(source)
+            if partition_name not in self._source_partitions([source]):
+                return 0
+        updated = 0
+        source_expr = f"source == {milvus_str(source)}"
+        for i in range(0, len(chunk_hashes), batch_size):
+            batch = chunk_hashes[i:i + batch_size]
+            rows = client.query(
+                self.collection_name,
+                filter=f"{source_expr} && chunk_hash in {json.dumps(batch)}",
+                # Every field, including the primary key and vector, so the upsert replaces the row.
+                output_fields=fields,
+                partition_names=[partition_name] if partition_name else None
+            )
+            stale = [row for row in rows if any(row.get(key) != value for key, value in metadata.items())]
+            if not stale:
+                continue
+            for row in stale:
+                row.update(metadata)
+            upsert_kwargs = {"partition_name": partition_name} if partition_name else {}
+            client.upsert(self.collection_name, stale, **upsert_kwargs)
+            updated += len(stale)
+        
+        with self._flush_lock:
+            self._unflushed_rows += updated
+        logger.debug({
+            "message": "Updated metadata of kept chunks",
+            "source": source,
+            "chunk_count": updated
+        })
+        return updated
+
+    def _insert_batches(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[Tuple[int, int]]:
+        """Split rows into contiguous [start, end) ranges bounded by row count and payload size."""
+        ranges = []
+        start, batch_bytes = 0, 0
+        for i, (text, vector, metadata) in enumerate(zip(texts, vectors, metadatas)):
+            row_bytes = len(text.encode("utf-8")) + 4 * len(vector) + sum(len(str(value)) for value in metadata.values())
+            batch_len = i - start
+            if batch_len and (batch_len >= self.insert_batch_rows or batch_bytes + row_bytes > self.insert_batch_bytes):
+                ranges.append((start, i))
+                start, batch_bytes = i, 0
+            batch_bytes += row_bytes
+        if start < len(texts):
+            ranges.append((start, len(texts)))
+        return ranges
+
+    def insert_embeddings(self, texts: List[str], vectors: List[List[float]], metadatas: List[dict]) -> List[str]:
+        """Insert pre-computed chunk embeddings without re-embedding them.
+        
+        Rows are sent in batches bounded by `insert_batch_rows` and `insert_batch_bytes`
+        over the store's existing client connection. Nothing is flushed here; see `flush_store`.
+        """
+        if self.partition_layout != "partition":
+            groups = [(None, texts, vectors, metadatas)]
+        else:
+            if self._store.col is None and texts:
+                # Create the collection up front so rows can be routed to a partition.
+                self._store._init(embeddings=[vectors], metadatas=metadatas)
+            by_source = OrderedDict()
+            for text, vector, metadata in zip(texts, vectors, metadatas):
+                group = by_source.setdefault(metadata["source"], ([], [], []))
+                group[0].append(text)
+                group[1].append(vector)
+                group[2].append(metadata)
+            groups = [(self._ensure_partition(source), *group) for source, group in by_source.items()]
+        
+        pks = []
+        for partition_name, texts, vectors, metadatas in groups:
+            insert_kwargs = {"partition_name": partition_name} if partition_name else {}
+            for start, end in self._insert_batches(texts, vectors, metadatas):
+                pks.extend(self._store.add_embeddings(
+                    texts=texts[start:end],
+                    embeddings=vectors[start:end],
+                    metadatas=metadatas[start:end],
+                    batch_size=end - start,
+                    **insert_kwargs
+                ))
+        with self._flush_lock:
+            self._unflushed_rows += len(pks)
+        return pks
+
+    def index_documents(self, documents: List[Document]) -> None:
         try:
             logger.debug({
                 "message": "Starting document indexing",
                 "document_count": len(documents)
             })
             
-            splits = self.text_splitter.split_documents(documents)
+            splits = self.split_documents(documents)
             logger.debug({
                 "message": "Split documents into chunks",
                 "chunk_count": len(splits)
             })
             
-            self._store.add_documents(splits)
+            texts = [doc.page_content for doc in splits]
+            self.insert_embeddings(texts, self.embeddings.embed_documents(texts), [doc.metadata for doc in splits])
             self.flush_store()
             
             logger.debug({
@@ -259,55 +384,148 @@ class VectorStore:
             }, exc_info=True)
             raise
 
-    def flush_store(self):
-        """
-        Flush the Milvus collection to ensure that all added documents are persisted to disk.
+    def _flush_due(self) -> bool:
+        if self._unflushed_rows == 0:
+            return False
+        if self.flush_rows and self._unflushed_rows >= self.flush_rows:
+            return True
+        return bool(self.flush_interval) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush_store(self, force: bool = False) -> bool:
         """
-        try:
-            from pymilvus import connections
-            
-            connections.connect(uri=self.uri)
+        Flush this collection if the deferred flush policy says it is due.
+        
+        Inserted rows are searchable before they are flushed, so flushing is only about sealing
+        growing segments. Sealing on every ingest fragments the collection into many small
+        segments, so flushes are deferred until `flush_rows` unflushed rows accumulate or
+        `flush_interval` seconds have passed; in between, Milvus seals segments on its own.
+        
+        Args:
+            force: Flush any unflushed rows regardless of the policy
             
+        Returns:
+            bool: True if a flush was issued
+        """
+        with self._flush_lock:
+            if not (force and self._unflushed_rows) and not self._flush_due():
+                return False
+            unflushed_rows = self._unflushed_rows
+            try:
+                self._store.client.flush(self.collection_name)
+            except Exception as e:
+                logger.error({
+                    "message": "Error flushing Milvus collection",
+                    "collection": self.collection_name,
+                    "error": str(e)
+                }, exc_info=True)
+                return False
+            self._unflushed_rows = 0
+            self._last_flush = time.monotonic()
+        
+        logger.debug({
+            "message": "Milvus collection flushed",
+            "collection": self.collection_name,
+            "row_count": unflushed_rows
+        })
+        return True
+
+    def _source_partitions(self, sources: List[str]) -> List[str]:
+        """Return the partitions holding `sources`, refreshing the cache once if any are unknown."""
+        names = [self._partition_name(source) for source in sources]
+        if not set(names) <= self._get_partitions():
+            # Another process may have created the partition since the cache was filled.
+            self._partitions = None
+        partitions = self._get_partitions()
+        return sorted({name for name in names if name in partitions})
+
+    def _build_search_kwargs(self, k: int, sources: List[str] = None, read_your_writes: Optional[bool] = None) -> Optional[dict]:
+        """Build retriever search kwargs, restricting the search to `sources` if given.
+        
+        Returns:
+            The search kwargs, or None if none of the sources can have any documents
+        """
+        search_kwargs = {"k": k}
+        if self.read_your_writes if read_your_writes is None else read_your_writes:
+            search_kwargs["consistency_level"] = "Strong"
+        
+        if not sources:
+            return search_kwargs
+        
+        if self.partition_layout == "partition":
+            partition_names = self._source_partitions(sources)
+            if not partition_names:
+                return None
+            # Partitions are shared by several sources, so the source filter still applies.
+            search_kwargs["partition_names"] = partition_names
+        if len(sources) == 1:
+            search_kwargs["expr"] = f'source == {milvus_str(sources[0])}'
+        else:
+            # With a partition key on `source`, Milvus uses this filter to prune partitions.
+            search_kwargs["expr"] = f'source in {json.dumps(sorted(sources), ensure_ascii=False)}'
+        
+        logger.debug({
+            "message": "Retrieving with filter",
+            "filter": search_kwargs.get("expr"),
+            "partition_names": search_kwargs.get("partition_names")
+        })
+        return search_kwargs
+
+    def _get_retriever(self, k: int, sources: List[str] = None, read_your_writes: Optional[bool] = None):
+        """Return a cached retriever for the given search settings, or None if nothing can match."""
+        search_kwargs = self._build_search_kwargs(k, sources, read_your_writes)
+        if search_kwargs is None:
+            return None
+        
+        key = json.dumps(search_kwargs, sort_keys=True)
+        retriever = self._retrievers.get(key)
+        if retriever is None:
+            retriever = self._store.as_retriever(search_type="similarity", search_kwargs=search_kwargs)
+            self._retrievers[key] = retriever
+            if len(self._retrievers) > RETRIEVER_CACHE_SIZE:
+                self._retrievers.popitem(last=False)
+        else:
+            self._retrievers.move_to_end(key)
+        return retriever
 
-            from pymilvus import utility
-            utility.flush_all()
+    def get_documents(self, query: str, k: int = 8, sources: List[str] = None, read_your_writes: Optional[bool] = None) -> List[Document]:
+        """
+        Get relevant documents using the retriever's invoke method.
+        
+        Pass `read_your_writes=True` to search with Strong consistency, so rows inserted
+        by another process (e.g. the backend's ingestion pipeline) are guaranteed visible.
+        """
+        try:
+            retriever = self._get_retriever(k, sources, read_your_writes)
+            if retriever is None:
+                return []
             
+            docs = retriever.invoke(query)
             logger.debug({
-                "message": "Milvus store flushed (persisted to disk)"
+                "message": "Retrieved documents",
+                "query": query,
+                "document_count": len(docs)
             })
+            
+            return docs
         except Exception as e:
             logger.error({
-                "message": "Error flushing Milvus store",
+                "message": "Error retrieving documents",
                 "error": str(e)
             }, exc_info=True)
+            return []
 
-
-    def get_documents(self, query: str, k: int = 8, sources: List[str] = None) -> List[Document]:
+    async def aget_documents(self, query: str, k: int = 8, sources: List[str] = None, read_your_writes: Optional[bool] = None) -> List[Document]:
         """
-        Get relevant documents using the retriever's invoke method.
+        Get relevant documents without blocking the event loop.
+        
+        Uses the async embedding client for the query vector and the async Milvus client for search.
         """
         try:
-            search_kwargs = {"k": k}
+            retriever = self._get_retriever(k, sources, read_your_writes)
+            if retriever is None:
+                return []
             
-            if sources:
-                if len(sources) == 1:
-                    filter_expr = f'source == "{sources[0]}"'
-                else:
-                    source_conditions = [f'source == "{source}"' for source in sources]
-                    filter_expr = " || ".join(source_conditions)
-                
-                search_kwargs["expr"] = filter_expr
-                logger.debug({
-                    "message": "Retrieving with filter",
-                    "filter": filter_expr
-                })
-            
-            retriever = self._store.as_retriever(
-                search_type="similarity",
-                search_kwargs=search_kwargs
-            )
-            
-            docs = retriever.invoke(query)
+            docs = await retriever.ainvoke(query)
             logger.debug({
                 "message": "Retrieved documents",
                 "query": query,
@@ -322,6 +540,18 @@ class VectorStore:
             }, exc_info=True)
             return []
 
+    def delete_source(self, source: str) -> None:
+        """Remove every chunk of `source` from the index and forget it.
+        
+        Raises:
+            RuntimeError: If Milvus rejects the delete
+        """
+        self.delete_source_chunks(source)
+        self.manifest.remove(source)
+        if self.on_source_deleted:
+            self.on_source_deleted(source)
+        logger.debug({"message": "Source deleted", "source": source})
+
     def delete_collection(self, collection_name: str) -> bool:
         """
         Delete a collection from Milvus.
@@ -333,14 +563,17 @@ class VectorStore:
             bool: True if successful, False otherwise
         """
         try:
-            from pymilvus import connections, Collection, utility
-            
-            connections.connect(uri=self.uri)
+            client = self._store.client
             
-            if utility.has_collection(collection_name):
-                collection = Collection(name=collection_name)
+            if client.has_collection(collection_name):
+                client.drop_collection(collection_name)
                 
-                collection.drop()
+                if collection_name == self.collection_name:
+                    self.manifest.clear()
+                    self._partitions = None
+                    self._retrievers.clear()
+                    with self._flush_lock:
+                        self._unflushed_rows = 0
                 
                 if self.on_source_deleted:
                     self.on_source_deleted(collection_name)
@@ -378,9 +611,8 @@ def create_vector_store_with_config(config_manager, uri: str = "http://milvus:19
     def handle_source_deleted(source_name: str):
         """Handle source deletion by updating config."""
         config = config_manager.read_config()
-        if hasattr(config, 'sources') and source_name in config.sources:
-            config.sources.remove(source_name)
-            config_manager.write_config(config)
+        if source_name in config.sources or source_name in (config.selected_sources or []):
+            config_manager.remove_source(source_name)
     
     return VectorStore(
         uri=uri,
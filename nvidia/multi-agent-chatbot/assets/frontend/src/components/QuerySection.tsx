@@ -190,6 +190,10 @@ export default function QuerySection({
   const [showWelcome, setShowWelcome] = useState(true);
   const [selectedSources, setSelectedSources] = useState<string[]>([]);
   const wsRef = useRef<WebSocket | null>(null);
+  // Last synced history per chat, so reconnects only fetch messages added since.
+  const historyRef = useRef<Record<string, { seq: number; version: number; messages: any[] }>>({});
+  // The turn being streamed, so a dropped connection can resume it from the last event received.
+  const turnRef = useRef<{ chatId: string; turnId: string; seq: number; query: string; text: string } | null>(null);
   const [toolOutput, setToolOutput] = useState("");
   const [graphStatus, setGraphStatus] = useState("");
   const [isPinnedToolOutputVisible, setPinnedToolOutputVisible] = useState(false);
@@ -223,6 +227,8 @@ export default function QuerySection({
   }, []);
 
   useEffect(() => {
+    let closing = false;
+
     const initWebSocket = async () => {
       if (!currentChatId) return;
 
@@ -234,24 +240,77 @@ export default function QuerySection({
         const wsProtocol = 'ws:';
         const wsHost = 'localhost';
         const wsPort = '8000';
-        const ws = new WebSocket(`${wsProtocol}//${wsHost}:${wsPort}/ws/chat/${currentChatId}`);
+        const synced = historyRef.current[currentChatId];
+        let syncParams = `seq=${synced?.seq ?? 0}&version=${synced?.version ?? 0}`;
+        const turn = turnRef.current;
+        if (turn && turn.chatId === currentChatId) {
+          syncParams += `&turn_id=${turn.turnId}&turn_seq=${turn.seq}`;
+        }
+        const ws = new WebSocket(`${wsProtocol}//${wsHost}:${wsPort}/ws/chat/${currentChatId}?${syncParams}`);
         wsRef.current = ws;
 
         ws.onmessage = (event) => {
           const msg = JSON.parse(event.data);
           const type = msg.type
           const text = msg.data ?? msg.token ?? "";
+          if (msg?.turn_id && turnRef.current?.turnId === msg.turn_id && typeof msg.seq === "number") {
+            turnRef.current.seq = msg.seq;
+          }
         
           switch (type) {
             case "history": {
               console.log('history messages: ', msg.messages);
               if (Array.isArray(msg.messages)) {
                 // const filtered = msg.messages.filter(m => m.type !== "ToolMessage"); // TODO: add this back in
+                historyRef.current[currentChatId] = { seq: msg.seq, version: msg.version, messages: msg.messages };
                 setResponse(JSON.stringify(msg.messages));
                 setIsStreaming(false);
               }
               break;
             }
+            case "history_delta": {
+              if (Array.isArray(msg.messages)) {
+                const previous = historyRef.current[currentChatId]?.messages ?? [];
+                const messages = previous.concat(msg.messages);
+                historyRef.current[currentChatId] = { seq: msg.seq, version: msg.version, messages };
+                setResponse(JSON.stringify(messages));
+                setIsStreaming(false);
+              }
+              break;
+            }
+            case "turn_start": {
+              turnRef.current = { chatId: currentChatId, turnId: msg.turn_id, seq: msg.seq, query: msg.message, text: "" };
+              break;
+            }
+            case "turn_resume": {
+              // The history just received does not contain the running turn yet.
+              const sameTurn = turnRef.current?.turnId === msg.turn_id && msg.seq > 0;
+              const partial = sameTurn ? turnRef.current!.text : "";
+              turnRef.current = { chatId: currentChatId, turnId: msg.turn_id, seq: msg.seq, query: msg.message, text: partial };
+              setIsStreaming(true);
+              setResponse(prev => {
+                try {
+                  const messages = JSON.parse(prev);
+                  messages.push({ type: "HumanMessage", content: msg.message });
+                  if (partial) {
+                    messages.push({ type: "AssistantMessage", content: partial });
+                  }
+                  return JSON.stringify(messages);
+                } catch {
+                  return prev;
+                }
+              });
+              break;
+            }
+            case "turn_gap": {
+              console.log("missed streamed events up to", msg.seq);
+              break;
+            }
+            case "turn_end": {
+              turnRef.current = null;
+              setGraphStatus("");
+              break;
+            }
             case "tool_token": {
               if (text !== undefined && text !== "undefined") {
                 setToolOutput(prev => prev + text);
@@ -264,6 +323,9 @@ export default function QuerySection({
                 firstTokenReceived.current = true;
                 hasAssistantContent.current = true;
               }
+              if (turnRef.current) {
+                turnRef.current.text += text;
+              }
               setResponse(prev => {
                 try {
                   const messages = JSON.parse(prev);
@@ -306,6 +368,12 @@ export default function QuerySection({
         ws.onclose = () => {
           console.log("WebSocket connection closed");
           setIsStreaming(false);
+          // The reply keeps generating on the server; reconnect to resume it.
+          if (!closing && wsRef.current === ws && turnRef.current?.chatId === currentChatId) {
+            setTimeout(() => {
+              if (!closing && wsRef.current === ws) initWebSocket();
+            }, 1000);
+          }
         };
 
         ws.onerror = (error) => {
@@ -321,6 +389,7 @@ export default function QuerySection({
     initWebSocket();
 
     return () => {
+      closing = true;
       if (wsRef.current) {
         wsRef.current.close();
       }
@@ -460,9 +529,8 @@ export default function QuerySection({
   };
 
   const handleCancelStream = () => {
-    if (wsRef.current) {
-      wsRef.current.close();
-      wsRef.current = null;
+    if (wsRef.current?.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ type: "cancel" }));
       setIsStreaming(false);
     }
   };